@@ -0,0 +1,171 @@
+"""Benchmarks for the football simulator.
+
+Times Match.simulate_match, League.__init__, League.simulate_league,
+League.build_league_table and main() on synthetic leagues of 18, 20 and 24
+teams, reporting seasons (or calls) per second and peak traced memory.
+
+    python benchmarks/bench_football.py --save baseline.json
+    python benchmarks/bench_football.py --compare baseline.json --threshold 10
+
+In comparison mode the exit status is 1 if any benchmark's throughput has
+dropped by more than threshold percent against the saved results.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+SIM_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SIM_DIR))
+
+TEAM_SIZES = (18, 20, 24)
+MATCH_CALLS = 1000
+
+
+def synthetic_league(n_teams, seed=0):
+    """Rows of HGS, HGC, AGS, AGC, M_no for a plausible league season"""
+    rng = random.Random(seed)
+    games = n_teams - 1
+    rows = {}
+    for i in range(n_teams):
+        quality = rng.uniform(0.6, 1.4)
+        rows[f'Team {i+1:02d}'] = [
+            round(games*1.5*quality*rng.uniform(0.8, 1.2)),
+            round(games*1.2/quality*rng.uniform(0.8, 1.2)),
+            round(games*1.2*quality*rng.uniform(0.8, 1.2)),
+            round(games*1.5/quality*rng.uniform(0.8, 1.2)),
+            2*games,
+            ]
+    return rows
+
+def write_league(workdir, n_teams):
+    """Writes the data and team id files read by League, returning its name"""
+    name = f'Synthetic {n_teams}'
+    league_dir = workdir / 'League Data'
+    league_dir.mkdir(exist_ok=True)
+    rows = synthetic_league(n_teams, seed=n_teams)
+    with open(league_dir / f'{name}.csv', 'w') as f:
+        f.write(',HGS,HGC,AGS,AGC,M_no\n')
+        for team, values in rows.items():
+            f.write(','.join([team, *map(str, values)]) + '\n')
+    with open(league_dir / f'{name}_ids.json', 'w') as f:
+        json.dump({team: i for i, team in enumerate(rows)}, f)
+    return name
+
+
+def measure(func, repeat):
+    """Best wall time of func over repeat runs, then peak traced memory"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 2**20
+
+
+def benchmarks(league_name, ns):
+    """Yields (benchmark name, n, callable, seasons or calls per callable)"""
+    import matplotlib.pyplot as plt
+    import main
+    from league import League
+
+    team_ids = main.utils.load_team_info(league_name)
+    league = League(league_name, team_ids)
+    match = league.Matches[0]
+
+    def simulate_matches():
+        for _ in range(MATCH_CALLS):
+            match.simulate_match()
+    yield 'Match.simulate_match', MATCH_CALLS, simulate_matches, MATCH_CALLS
+
+    yield 'League.__init__', 1, lambda: League(league_name, team_ids), 1
+
+    def simulate_league():
+        league.reset()
+        league.simulate_league()
+    yield 'League.simulate_league', 1, simulate_league, 1
+
+    yield 'build_league_table', 1, league.build_league_table, 1
+
+    for n in ns:
+        def run_main():
+            main.main(league_name, n)
+            plt.close('all')
+        yield 'main', n, run_main, n
+
+
+def run_benchmarks(team_sizes, ns, repeat):
+    results = {}
+    workdir = Path(tempfile.mkdtemp(prefix='football-bench-'))
+    cwd = os.getcwd()
+    try:
+        # The simulator reads its data files relative to the working directory
+        for filename in ('league_ids.json', 'club_crests.json'):
+            shutil.copy(SIM_DIR / filename, workdir)
+        os.chdir(workdir)
+        os.environ.setdefault('MPLBACKEND', 'Agg')
+        for n_teams in team_sizes:
+            league_name = write_league(workdir, n_teams)
+            for name, n, func, units in benchmarks(league_name, ns):
+                seconds, peak_mb = measure(func, repeat)
+                key = f'{name}[teams={n_teams},n={n}]'
+                results[key] = {'seconds': seconds,
+                                'per_second': units/seconds,
+                                'peak_mb': peak_mb}
+                print(f'{key:45s} {seconds:10.4f} s {units/seconds:12.1f}/s '
+                      f'{peak_mb:9.2f} MB')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the benchmarks whose throughput regressed beyond threshold %"""
+    regressions = []
+    for key, base in baseline.items():
+        if key not in results:
+            continue
+        change = 100*(results[key]['per_second']/base['per_second'] - 1)
+        flag = 'REGRESSION' if change < -threshold else ''
+        print(f'{key:45s} {change:+8.1f}% {flag}')
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the football simulator.')
+    parser.add_argument('--teams', type=int, nargs='+', default=TEAM_SIZES)
+    parser.add_argument('--n', type=int, nargs='+', default=[1, 5, 20],
+                        help='numbers of seasons simulated by main()')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare to')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='allowed throughput regression in percent')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.teams, args.n, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmark(s) regressed by more than '
+                  f'{args.threshold}%')
+            sys.exit(1)
@@ -0,0 +1,97 @@
+import logging
+import os
+import pickle
+import random
+import tempfile
+
+from probabilities import PointsDistribution, SensitivityEstimator
+
+logging.basicConfig(filename='log.txt', level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, state):
+    """Writes state atomically: a killed process leaves the old checkpoint"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def load_checkpoint(path):
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version in {path}')
+    return state
+
+def new_state(league, n):
+    return {
+        'version'   : CHECKPOINT_VERSION,
+        'league'    : league.name,
+        'n'         : n,
+        'seasons'   : 0,
+        'points'    : PointsDistribution(league.teams),
+        'estimator' : SensitivityEstimator(league.teams),
+        'rng'       : None,
+        }
+
+def merge_checkpoints(paths):
+    """Combines the accumulators of checkpoints written by parallel workers.
+
+    The merged state has no RNG state and cannot itself be resumed."""
+    states = [load_checkpoint(path) for path in paths]
+    merged = states[0]
+    for state in states[1:]:
+        if state['league'] != merged['league']:
+            raise ValueError('Cannot merge checkpoints of different leagues')
+        merged['n'] += state['n']
+        merged['seasons'] += state['seasons']
+        merged['points'].merge(state['points'])
+        merged['estimator'].merge(state['estimator'])
+    merged['rng'] = None
+    return merged
+
+
+def run_seasons(league, n, checkpoint=None, resume=False, every=1000,
+                seed=None):
+    """Simulates n seasons of league, accumulating points and outcomes.
+
+    If checkpoint is a path, the accumulators and the random state are saved
+    there every `every` seasons and at the end. With resume, a run continues
+    from the checkpoint exactly as if it had never stopped.
+    """
+    if resume and checkpoint and os.path.exists(checkpoint):
+        state = load_checkpoint(checkpoint)
+        if state['league'] != league.name or state['rng'] is None:
+            raise ValueError(f'{checkpoint} cannot resume this run')
+        random.setstate(state['rng'])
+        logging.info(f'Resuming from season {state["seasons"]} '
+                     f'of {state["n"]}')
+    else:
+        state = new_state(league, n)
+        if seed is not None:
+            random.seed(seed)
+    # A resumed run may be extended past its original target
+    state['n'] = max(state['n'], n)
+
+    while state['seasons'] < state['n']:
+        league.reset()
+        league.simulate_league()
+        state['points'].update(league)
+        state['estimator'].update(league)
+        state['seasons'] += 1
+
+        if checkpoint and (state['seasons'] % every == 0
+                           or state['seasons'] == state['n']):
+            state['rng'] = random.getstate()
+            save_checkpoint(checkpoint, state)
+    return state
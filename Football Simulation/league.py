@@ -57,6 +57,10 @@ class League:
             self.fetch_league_data()
         else: self.league_df = league_df
         
+    def reset(self):
+        for team in self.Teams:
+            team.reset()
+        
     def simulate_league(self):
         for match in self.Matches:
             match.simulate_match()
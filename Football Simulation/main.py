@@ -1,12 +1,15 @@
+import argparse
 import logging
 
+import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sb
 
-from mpl_toolkits.axes_grid.inset_locator import inset_axes
+from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
 import utils
 from league import League
+from checkpoint import run_seasons, merge_checkpoints
 
 logging.basicConfig(filename='log.txt', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -16,26 +19,35 @@ LEAGUE_NAME = 'Premier League'
 LEAGUE_IDS = utils.read_json('league_ids.json')
 TEAM_PNGS = utils.read_json('club_crests.json')
 
-def main(league_name, n=2):
+def main(league_name, n=2, checkpoint=None, resume=False,
+         checkpoint_every=1000, seed=None):
     team_ids = utils.load_team_info(league_name)
-    pts_dict = {team: [] for team in team_ids.keys()}
-    for i in range(n):
-        league = League(league_name, team_ids)
-        league.simulate_league()
-        for team in league.Teams:
-            pts_dict[team.name].append(team.points)
-    pts_dict = utils.sort_dict(pts_dict)
+    league = League(league_name, team_ids)
+    state = run_seasons(league, n, checkpoint, resume, checkpoint_every, seed)
+    plot_points(league_name, state['points'])
+    return state
+
+def plot_points(league_name, points_dist):
+    pts_dict = points_dist.sorted_counts()
+    n = points_dist.n_seasons
+    points = np.arange(points_dist.counts.shape[1])
 
     fig, axs = plt.subplots(len(pts_dict), figsize=(18,16),
                             sharex=True, sharey=True)
     idx = 0
-    for team, points in pts_dict.items(): #Very messy implementation
-        sb.kdeplot(points, ax=axs[idx], bw_method=0.5, warn_singular=False)
+    for team, counts in pts_dict.items(): #Very messy implementation
+        if np.count_nonzero(counts) < 2:
+            #No spread to estimate a density from, e.g. for a single season
+            axs[idx].axvline(points[counts > 0][0], linewidth=2)
+        else:
+            sb.kdeplot(x=points, weights=counts, ax=axs[idx], bw_method=0.5,
+                       warn_singular=False)
         axs[idx].get_yaxis().set_visible(False)
-        crest_im = plt.imread(TEAM_PNGS[team])
-        inset_ax = inset_axes(axs[idx], height=0.4, width=0.4, loc=6) 
-        inset_ax.imshow(crest_im)
-        inset_ax.set_axis_off()
+        if team in TEAM_PNGS:
+            crest_im = plt.imread(TEAM_PNGS[team])
+            inset_ax = inset_axes(axs[idx], height=0.4, width=0.4, loc=6) 
+            inset_ax.imshow(crest_im)
+            inset_ax.set_axis_off()
         idx+=1
         
     fig.text(0.5, 0.06, 'Points', ha='center', size='x-large')
@@ -43,4 +55,25 @@ def main(league_name, n=2):
              ha='center', size='x-large', fontvariant='small-caps')
    
 if __name__ == '__main__':
-    main(LEAGUE_NAME)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Simulate league seasons.')
+    parser.add_argument('--league', default=LEAGUE_NAME)
+    parser.add_argument('-n', type=int, default=2,
+                        help='number of seasons to simulate')
+    parser.add_argument('--checkpoint', help='file to checkpoint the run to')
+    parser.add_argument('--every', type=int, default=1000,
+                        help='seasons between checkpoints')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the run saved in --checkpoint')
+    parser.add_argument('--seed', type=int,
+                        help='random seed, distinct for parallel workers')
+    parser.add_argument('--merge', nargs='+', metavar='CHECKPOINT',
+                        help='plot the merged results of worker checkpoints')
+    args = parser.parse_args()
+
+    if args.merge:
+        state = merge_checkpoints(args.merge)
+        plot_points(state['league'], state['points'])
+    else:
+        main(args.league, args.n, args.checkpoint, args.resume, args.every,
+             args.seed)
+    plt.show()
\ No newline at end of file
@@ -51,9 +51,10 @@ class Match:
         
     def simulate_match(self):
         logging.info('Simulation started')
-        expected_goals = self.expected_score()
-        goal_probs = self.score_probabilities(*expected_goals)
-        self.simulate_score(*goal_probs)
+        # Kept so that sensitivities can be scored against the fixture rates
+        self.expected_goals = self.expected_score()
+        self.goal_probs = self.score_probabilities(*self.expected_goals)
+        self.simulate_score(*self.goal_probs)
         self.allocate_goals()
         self.allocate_points()
         logging.info('Simulation completed successfully')
\ No newline at end of file
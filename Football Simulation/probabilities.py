@@ -0,0 +1,178 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(filename='log.txt', level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Outcomes estimated from finishing positions (1 = champions). These are
+# module-level functions so that accumulators can be pickled to checkpoints.
+def title(pos, n_teams):
+    return pos == 1
+
+def top_four(pos, n_teams):
+    return pos <= 4
+
+def relegation(pos, n_teams):
+    return pos > n_teams - 3
+
+OUTCOMES = {
+    'title'      : title,
+    'top_four'   : top_four,
+    'relegation' : relegation,
+}
+
+STRENGTHS = ['h_att', 'a_att', 'h_def', 'a_def']
+
+
+def final_positions(league):
+    table = league.build_league_table()
+    return {team: pos for pos, team in enumerate(table.index, start=1)}
+
+def truncated_mean(goal_probs):
+    """Mean goals of the truncated, renormalised Poisson used by Match"""
+    goal_probs = np.asarray(goal_probs)
+    return np.arange(len(goal_probs)) @ goal_probs / goal_probs.sum()
+
+def match_scores(match):
+    """Score function d(log p)/d(strength) of one simulated fixture.
+
+    The goals are drawn from a Poisson truncated at max_goals, for which
+    d(log p)/d(rate) = (goals - truncated mean)/rate. Each rate is a product
+    of strengths, so d(rate)/d(strength) = rate/strength and the rate cancels.
+    """
+    hm_probs, aw_probs = match.goal_probs
+    hm_resid = match.home_goals - truncated_mean(hm_probs)
+    aw_resid = match.away_goals - truncated_mean(aw_probs)
+    contributions = [
+        (match.home, 'h_att', hm_resid),
+        (match.away, 'a_def', hm_resid),
+        (match.away, 'a_att', aw_resid),
+        (match.home, 'h_def', aw_resid),
+        ]
+    return [(team.name, strength, resid/getattr(team, strength))
+            for team, strength, resid in contributions
+            if getattr(team, strength) != 0]
+
+def season_scores(league, team_index):
+    """Score function of a whole simulated season as (team, strength) array"""
+    scores = np.zeros((len(team_index), len(STRENGTHS)))
+    for match in league.Matches:
+        for team, strength, value in match_scores(match):
+            scores[team_index[team], STRENGTHS.index(strength)] += value
+    return scores
+
+
+class SensitivityEstimator:
+    """Accumulates outcome probabilities and their likelihood-ratio
+    sensitivities to every team strength from simulated seasons.
+
+    dP(outcome)/d(strength) is estimated as the sample covariance between the
+    outcome indicator and the season score function, so it is a by-product
+    of the seasons already simulated for the probabilities.
+    """
+    def __init__(self, teams, outcomes=OUTCOMES):
+        self.teams = list(teams)
+        self.outcomes = outcomes
+        self._team_index = {team: i for i, team in enumerate(self.teams)}
+
+        n_teams, n_outcomes = len(self.teams), len(self.outcomes)
+        self.n_seasons = 0
+        self.counts = np.zeros((n_outcomes, n_teams))
+        self.score_sums = np.zeros((n_teams, len(STRENGTHS)))
+        self.cross_sums = np.zeros((n_outcomes, n_teams,
+                                    n_teams, len(STRENGTHS)))
+
+    def update(self, league):
+        """Adds the outcomes of a league whose season has been simulated"""
+        positions = final_positions(league)
+        n_teams = len(self.teams)
+        events = np.array([[outcome(positions[team], n_teams)
+                            for team in self.teams]
+                           for outcome in self.outcomes.values()],
+                          dtype=float)
+        scores = season_scores(league, self._team_index)
+
+        self.n_seasons += 1
+        self.counts += events
+        self.score_sums += scores
+        self.cross_sums += np.einsum('ot,sk->otsk', events, scores)
+
+    def merge(self, other):
+        """Adds the seasons accumulated by another estimator"""
+        if (other.teams != self.teams
+                or list(other.outcomes) != list(self.outcomes)):
+            raise ValueError('Estimators are for different teams or outcomes')
+        self.n_seasons += other.n_seasons
+        self.counts += other.counts
+        self.score_sums += other.score_sums
+        self.cross_sums += other.cross_sums
+
+    def probabilities(self):
+        probs = self.counts / max(self.n_seasons, 1)
+        return pd.DataFrame(probs.T, index=self.teams,
+                            columns=list(self.outcomes))
+
+    def sensitivities(self, outcome='title', own=False):
+        """dP(outcome)/d(strength) with outcome teams as rows.
+
+        Columns are (team, strength) pairs, or only the strengths of the
+        outcome team itself if own is True."""
+        n = max(self.n_seasons, 1)
+        o = list(self.outcomes).index(outcome)
+        mean_scores = self.score_sums / n
+        # Subtracting P*E[S] (zero in expectation) as a control variate
+        sens = (self.cross_sums[o] / n
+                - (self.counts[o] / n)[:, None, None] * mean_scores[None])
+        if own:
+            own_sens = sens[np.arange(len(self.teams)),
+                            np.arange(len(self.teams))]
+            return pd.DataFrame(own_sens, index=self.teams, columns=STRENGTHS)
+        columns = pd.MultiIndex.from_product([self.teams, STRENGTHS])
+        return pd.DataFrame(sens.reshape(len(self.teams), -1),
+                            index=self.teams, columns=columns)
+
+
+class PointsDistribution:
+    """Histogram of the points each team finishes a season on"""
+    def __init__(self, teams):
+        self.teams = list(teams)
+        self.n_seasons = 0
+        # Double round robin: at most 3 points from 2*(n-1) matches
+        self.counts = np.zeros((len(self.teams), 6*(len(self.teams) - 1) + 1),
+                               dtype=np.int64)
+
+    def update(self, league):
+        points = {team.name: team.points for team in league.Teams}
+        self.n_seasons += 1
+        self.counts[np.arange(len(self.teams)),
+                    [points[team] for team in self.teams]] += 1
+
+    def merge(self, other):
+        if other.teams != self.teams:
+            raise ValueError('Distributions are for different teams')
+        self.n_seasons += other.n_seasons
+        self.counts += other.counts
+
+    def mean(self):
+        points = np.arange(self.counts.shape[1])
+        return dict(zip(self.teams,
+                        self.counts @ points / max(self.n_seasons, 1)))
+
+    def sorted_counts(self):
+        """{team: points counts} ordered by mean points, highest first"""
+        means = self.mean()
+        return {team: self.counts[self.teams.index(team)]
+                for team in sorted(self.teams, key=means.get, reverse=True)}
+
+
+def simulate_probabilities(league, n=1000):
+    """Simulates n seasons of league, returning a SensitivityEstimator"""
+    estimator = SensitivityEstimator(league.teams)
+    for i in range(n):
+        league.reset()
+        league.simulate_league()
+        estimator.update(league)
+    logging.info(f'Simulated {n} seasons of {league.name}')
+    return estimator
@@ -0,0 +1,265 @@
+"""Local HTTP service serving cached league outcome probabilities.
+
+    GET /probabilities?league=Premier%20League&n=1000
+    GET /stats
+
+Results are cached under a hash of the league, team strengths, score model
+and number of seasons. When the league data on disk changes the strengths
+change with it, and the affected results are recomputed in a worker pool
+while the previous ones keep being served. Requests for a result that is
+already being computed wait on the same job. Leagues are built in a thread,
+as fetching missing data sleeps between API requests, and only the
+CACHE_SIZE most recently used results are kept.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import utils
+from league import League
+from probabilities import simulate_probabilities
+
+logging.basicConfig(filename='log.txt', level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+MODELS = {'poisson'}
+DEFAULT_N = 1000
+MAX_N = 1_000_000
+# Results, and latest keys of (league, model, n) runs, kept in memory
+CACHE_SIZE = 128
+
+
+def league_data_path(league_name):
+    return f'League Data/{league_name}.csv'
+
+def league_strengths(league):
+    return {team.name: {'h_att': team.h_att, 'a_att': team.a_att,
+                        'h_def': team.h_def, 'a_def': team.a_def}
+            for team in league.Teams}
+
+def cache_key(league_name, strengths, model, n):
+    payload = json.dumps([league_name, strengths, model, n], sort_keys=True,
+                         default=float)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def build_league(league_name):
+    """Thread job: League with the team IDs on file"""
+    league = League(league_name, utils.load_team_info(league_name))
+    logging.info(f'Loaded {league_name} strengths')
+    return league
+
+def compute_probabilities(league, n):
+    """Worker pool job: simulate n seasons of the League the result is cached
+    under, returning JSON-ready results"""
+    estimator = simulate_probabilities(league, n)
+    return {
+        'probabilities': estimator.probabilities().to_dict(orient='index'),
+        'sensitivities': {outcome: estimator.sensitivities(outcome, own=True)
+                          .to_dict(orient='index')
+                          for outcome in estimator.outcomes},
+        }
+
+
+class LRUCache(OrderedDict):
+    """Dictionary keeping the maxsize most recently used items"""
+    def __init__(self, maxsize=CACHE_SIZE):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class SimulationService:
+    def __init__(self, workers=None, poll_interval=5, cache_size=CACHE_SIZE):
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._poll_interval = poll_interval
+
+        # key : result, and key : future of a running job
+        self._cache = LRUCache(cache_size)
+        self._jobs = {}
+        # league name : (data file mtime, League), and league name :
+        # (data file mtime, future) of a League being built
+        self._leagues = {}
+        self._loading = {}
+        # (league name, model, n) : key of the latest completed result
+        self._latest = LRUCache(cache_size)
+
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0,
+                      'coalesced': 0, 'jobs': 0}
+
+    async def load_league(self, league_name):
+        """Returns the League, rebuilt in a thread if its data file has
+        changed. Concurrent requests wait on the same build."""
+        mtime = os.path.getmtime(league_data_path(league_name))
+        cached = self._leagues.get(league_name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        loading = self._loading.get(league_name)
+        if loading is None or loading[0] != mtime:
+            loop = asyncio.get_running_loop()
+            loading = (mtime, loop.run_in_executor(None, build_league,
+                                                   league_name))
+            self._loading[league_name] = loading
+        try:
+            league = await asyncio.shield(loading[1])
+        finally:
+            if self._loading.get(league_name) is loading:
+                del self._loading[league_name]
+        self._leagues[league_name] = (mtime, league)
+        return league
+
+    def _submit(self, key, run, league):
+        loop = asyncio.get_running_loop()
+        job = loop.run_in_executor(self._executor, compute_probabilities,
+                                   league, run[2])
+        self._jobs[key] = job
+        self.stats['jobs'] += 1
+
+        def _done(job):
+            del self._jobs[key]
+            if not job.cancelled() and job.exception() is None:
+                self._cache[key] = job.result()
+                self._latest[run] = key
+            else:
+                logging.error(f'Simulation job {key} failed')
+        job.add_done_callback(_done)
+        return job
+
+    async def probabilities(self, league_name, model='poisson', n=DEFAULT_N):
+        league = await self.load_league(league_name)
+        key = cache_key(league_name, league_strengths(league), model, n)
+        run = (league_name, model, n)
+
+        if key in self._cache:
+            self.stats['hits'] += 1
+            return key, self._cache[key], False
+        if key in self._jobs:
+            self.stats['coalesced'] += 1
+            job = self._jobs[key]
+        else:
+            self.stats['misses'] += 1
+            job = self._submit(key, run, league)
+        # Serve the result for the old strengths until the new one is ready
+        previous = self._latest.get(run)
+        if previous in self._cache:
+            self.stats['stale_hits'] += 1
+            return previous, self._cache[previous], True
+        return key, await asyncio.shield(job), False
+
+    async def _refresh(self, run):
+        """Starts the job for the current strengths of a known run, if it is
+        neither cached nor running. Doesn't wait for it or count as a
+        request."""
+        league_name, model, n = run
+        league = await self.load_league(league_name)
+        key = cache_key(league_name, league_strengths(league), model, n)
+        if key not in self._cache and key not in self._jobs:
+            self._submit(key, run, league)
+
+    async def watch(self):
+        """Recomputes known results in the background when data changes"""
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            for run in list(self._latest):
+                try:
+                    await self._refresh(run)
+                except FileNotFoundError:
+                    logging.exception(f'{run[0]} data file missing')
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1')
+            # Headers are read and ignored
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            status, body = await self.route(request_line)
+        except Exception as exc:
+            logging.exception(type(exc).__name__)
+            status, body = 500, {'error': type(exc).__name__}
+
+        content = json.dumps(body).encode()
+        writer.write((f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n'
+                      'Content-Type: application/json\r\n'
+                      f'Content-Length: {len(content)}\r\n'
+                      'Connection: close\r\n\r\n').encode() + content)
+        await writer.drain()
+        writer.close()
+
+    async def route(self, request_line):
+        try:
+            method, target, _ = request_line.split()
+        except ValueError:
+            return 400, {'error': 'Malformed request'}
+        if method != 'GET':
+            return 405, {'error': 'Only GET is supported'}
+
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == '/stats':
+            return 200, dict(self.stats, cached=len(self._cache),
+                             running=len(self._jobs))
+        if url.path != '/probabilities':
+            return 404, {'error': f'Unknown path {url.path}'}
+
+        league_name = query.get('league', 'Premier League')
+        model = query.get('model', 'poisson')
+        try:
+            n = int(query.get('n', DEFAULT_N))
+        except ValueError:
+            return 400, {'error': 'n must be an integer'}
+        if model not in MODELS:
+            return 400, {'error': f'Unsupported model {model}'}
+        if not 0 < n <= MAX_N:
+            return 400, {'error': f'n must be between 1 and {MAX_N}'}
+        try:
+            key, result, stale = await self.probabilities(league_name,
+                                                          model, n)
+        except FileNotFoundError:
+            return 404, {'error': f'No data for {league_name}'}
+        return 200, dict(result, league=league_name, model=model, n=n,
+                         key=key, stale=stale)
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        watcher = asyncio.create_task(self.watch())
+        logging.info(f'Serving simulations on {host}:{port}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+            self._executor.shutdown(cancel_futures=True)
+
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--poll', type=float, default=5,
+                        help='seconds between checks for changed data')
+    args = parser.parse_args()
+    service = SimulationService(args.workers, args.poll)
+    asyncio.run(service.serve(args.host, args.port))
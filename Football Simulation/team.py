@@ -6,6 +6,9 @@ class Team:
         self.a_att = a_att
         self.a_def = h_def
         
+        self.reset()
+        
+    def reset(self):
         self.goals_scored = 0
         self.goals_allowed = 0
         self.points = 0
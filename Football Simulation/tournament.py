@@ -0,0 +1,235 @@
+"""Vectorized knockout tournament simulator.
+
+Cups and play-offs are simulated for many tournaments at once with NumPy,
+using the team strengths and truncated Poisson score model of Match. Ties
+can be single or two-legged, level ties go to extra time and penalties, and
+first round draws can be seeded.
+
+    league = League('EFL Championship')
+    table = league.build_league_table()
+    playoffs = playoff_tournament(league, list(table.index[2:6]))
+    probs = simulate_tournaments(playoffs, 1_000_000)
+"""
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import poisson
+
+logging.basicConfig(filename='log.txt', level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# legs: 1 or 2; neutral: single leg at a neutral ground (e.g. a final);
+# redraw: pair the winners of the previous round by a new random draw
+Round = namedtuple('Round', ['legs', 'neutral', 'redraw'],
+                   defaults=[1, False, False])
+
+EXTRA_TIME = 30/90
+MAX_GOALS = 5
+
+
+def goal_cdfs(rates, max_goals=MAX_GOALS):
+    """Cumulative probabilities of the truncated Poisson used by Match"""
+    pmf = poisson.pmf(np.arange(max_goals), rates[..., None])
+    return np.cumsum(pmf, axis=-1) / pmf.sum(axis=-1, keepdims=True)
+
+def sample_goals(rng, cdfs):
+    """One inverse-CDF draw per row of cdfs"""
+    u = rng.random(cdfs.shape[:-1])
+    return (u[..., None] > cdfs).sum(axis=-1)
+
+
+class ScoreTables:
+    """Goal distributions for every (home, away) pairing of a league"""
+    def __init__(self, league, max_goals=MAX_GOALS):
+        teams = league.Teams
+        h_att = np.array([team.h_att for team in teams])
+        a_att = np.array([team.a_att for team in teams])
+        h_def = np.array([team.h_def for team in teams])
+        a_def = np.array([team.a_def for team in teams])
+        averages = league.averages
+
+        # Same expected scores as Match.expected_score, indexed [home, away]
+        exp_hgs = np.outer(h_att, a_def) * averages['HGS']
+        exp_ags = np.outer(h_def, a_att) * averages['AGS']
+        # At a neutral ground each side plays half a home and half an away game
+        neutral = 0.5*(exp_hgs + exp_ags.T)
+
+        self.teams = [team.name for team in teams]
+        self.normal = (goal_cdfs(exp_hgs, max_goals),
+                       goal_cdfs(exp_ags, max_goals))
+        self.extra = (goal_cdfs(exp_hgs*EXTRA_TIME, max_goals),
+                      goal_cdfs(exp_ags*EXTRA_TIME, max_goals))
+        self.neutral = (goal_cdfs(neutral, max_goals),
+                        goal_cdfs(neutral.T, max_goals))
+        self.neutral_extra = (goal_cdfs(neutral*EXTRA_TIME, max_goals),
+                              goal_cdfs(neutral.T*EXTRA_TIME, max_goals))
+
+    def play(self, rng, home, away, tables):
+        hm_cdfs, aw_cdfs = tables
+        return (sample_goals(rng, hm_cdfs[home, away]),
+                sample_goals(rng, aw_cdfs[home, away]))
+
+
+def play_tie(rng, scores, first, second, legs=1, neutral=False,
+             penalty_prob=0.5):
+    """Winners of ties between arrays of team indices first and second.
+
+    In a two-legged tie first is at home in the first leg. Level ties are
+    decided by extra time at the final venue, then penalties, which first
+    wins with probability penalty_prob."""
+    if legs == 1:
+        tables = scores.neutral if neutral else scores.normal
+        first_goals, second_goals = scores.play(rng, first, second, tables)
+        extra_tables = scores.neutral_extra if neutral else scores.extra
+        home, away = first, second
+    elif legs == 2:
+        first_goals, second_goals = scores.play(rng, first, second,
+                                                scores.normal)
+        second_leg = scores.play(rng, second, first, scores.normal)
+        second_goals += second_leg[0]
+        first_goals += second_leg[1]
+        extra_tables = scores.extra
+        home, away = second, first
+    else:
+        raise ValueError('Ties have one or two legs')
+
+    level = first_goals == second_goals
+    if level.any():
+        home_et, away_et = scores.play(rng, home[level], away[level],
+                                       extra_tables)
+        if legs == 2:
+            home_et, away_et = away_et, home_et
+        first_goals[level] += home_et
+        second_goals[level] += away_et
+    level = first_goals == second_goals
+    penalties = rng.random(first.shape) < penalty_prob
+    first_wins = (first_goals > second_goals) | (level & penalties)
+    return np.where(first_wins, first, second)
+
+
+def draw(rng, entrants, seeded=False):
+    """Randomly orders each row of entrants into (home, away) pairings.
+
+    With seeded, the first half of each row are seeds, and every tie pairs a
+    seed with an unseeded team, either side at home."""
+    n, k = entrants.shape
+    if not seeded:
+        return np.take_along_axis(entrants,
+                                  rng.random((n, k)).argsort(axis=1), axis=1)
+    seeds = np.take_along_axis(entrants[:, :k//2],
+                               rng.random((n, k//2)).argsort(axis=1), axis=1)
+    others = np.take_along_axis(entrants[:, k//2:],
+                                rng.random((n, k//2)).argsort(axis=1), axis=1)
+    swap = rng.random((n, k//2)) < 0.5
+    pairs = np.stack([np.where(swap, others, seeds),
+                      np.where(swap, seeds, others)], axis=2)
+    return pairs.reshape(n, k)
+
+
+class Tournament:
+    def __init__(self, league, entrants, rounds, draw_first=True,
+                 seeded=False, penalty_prob=0.5):
+        """entrants are team names in seed order. Without draw_first they
+        form a fixed bracket, pairing entrants 0 v 1, 2 v 3, ..."""
+        if len(entrants) != 2**len(rounds):
+            raise ValueError(f'{len(rounds)} rounds need '
+                             f'{2**len(rounds)} entrants')
+        self.name = league.name
+        self.scores = ScoreTables(league)
+        self.entrants = list(entrants)
+        self._index = np.array([self.scores.teams.index(team)
+                                for team in entrants])
+        self.rounds = list(rounds)
+        self.draw_first = draw_first
+        self.seeded = seeded
+        self.penalty_prob = penalty_prob
+
+    def simulate(self, n, rng):
+        """Counts of how often each entrant reached each round, the last
+        column being the number of wins"""
+        bracket = np.broadcast_to(self._index, (n, len(self._index)))
+        if self.draw_first:
+            bracket = draw(rng, bracket, self.seeded)
+        reached = np.zeros((len(self.scores.teams), len(self.rounds) + 1),
+                           dtype=np.int64)
+        for r, rnd in enumerate(self.rounds):
+            if rnd.redraw and r > 0:
+                bracket = draw(rng, bracket)
+            reached[:, r] = np.bincount(bracket.ravel(),
+                                        minlength=len(reached))
+            winners = play_tie(rng, self.scores, bracket[:, 0::2].ravel(),
+                               bracket[:, 1::2].ravel(), rnd.legs,
+                               rnd.neutral, self.penalty_prob)
+            bracket = winners.reshape(n, -1)
+        reached[:, -1] = np.bincount(bracket.ravel(), minlength=len(reached))
+        return reached[self._index]
+
+
+def _simulate_batch(tournament, n, seed):
+    return tournament.simulate(n, np.random.default_rng(seed))
+
+def simulate_tournaments(tournament, n, workers=None, batch_size=100_000,
+                         seed=None):
+    """Simulates n tournaments in batches across worker processes.
+
+    Returns the probability of each entrant reaching each round."""
+    batches = [batch_size]*(n // batch_size)
+    if n % batch_size:
+        batches.append(n % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    workers = min(workers or os.cpu_count(), len(batches))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = sum(executor.map(_simulate_batch,
+                                      [tournament]*len(batches),
+                                      batches, seeds))
+    else:
+        counts = sum(_simulate_batch(tournament, size, seed)
+                     for size, seed in zip(batches, seeds))
+    logging.info(f'Simulated {n} tournaments of {tournament.name}')
+
+    columns = [f'round_{r+1}' for r in range(len(tournament.rounds))]
+    return pd.DataFrame(counts / n, index=tournament.entrants,
+                        columns=columns + ['winner'])
+
+
+def knockout_rounds(entrants):
+    """Number of rounds to reduce entrants to one winner. There are no byes,
+    so the number of entrants must be a power of two."""
+    n = len(entrants)
+    if n < 2 or n & (n - 1):
+        raise ValueError(f'A knockout needs a power of two entrants, '
+                         f'not {n}')
+    return n.bit_length() - 1
+
+def cup_tournament(league, entrants, two_legged_rounds=0, seeded=False):
+    """A domestic cup: random draws every round and a neutral final. The
+    first two_legged_rounds rounds are played over two legs.
+
+    entrants are a power of two of the league's team names, as there are no
+    byes or preliminary rounds."""
+    n_rounds = knockout_rounds(entrants)
+    rounds = [Round(legs=2 if r < two_legged_rounds else 1, redraw=True)
+              for r in range(n_rounds - 1)]
+    rounds.append(Round(legs=1, neutral=True, redraw=True))
+    return Tournament(league, entrants, rounds, seeded=seeded)
+
+def playoff_tournament(league, entrants):
+    """End of season play-offs, entrants in league finishing order.
+
+    As in the EFL, the top seed plays the lowest over two legs with the
+    higher seed at home second, and the final is a single neutral match."""
+    n_rounds = knockout_rounds(entrants)
+    # Fixed bracket 1 v 4, 2 v 3 with the lower seed at home first
+    order = []
+    for high, low in zip(entrants[:len(entrants)//2],
+                         reversed(entrants[len(entrants)//2:])):
+        order += [low, high]
+    rounds = [Round(legs=2) for r in range(n_rounds - 1)]
+    rounds.append(Round(legs=1, neutral=True))
+    return Tournament(league, order, rounds, draw_first=False)
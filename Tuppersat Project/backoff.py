@@ -0,0 +1,58 @@
+"""
+backoff.py
+
+Exponential backoff with jitter between retries of a failing sensor.
+
+The n-th consecutive failure waits initial*factor**(n - 1) seconds, at
+most maximum, scaled by a random factor between 1 - jitter and 1, so that
+sensors failing together, e.g. on a bus fault, do not retry in lockstep.
+A wait ends as soon as stop() is called, so shutdown never sits out a
+backoff.
+"""
+# standard library imports
+import random
+import threading
+
+# local imports
+from clock import SYSTEM_CLOCK
+
+
+class Backoff:
+    """Delays between retries: initial, initial*factor, ... up to maximum
+    seconds, interruptible by stop()."""
+    def __init__(self, initial=0.5, maximum=30.0, factor=2.0, jitter=0.5,
+                 clock=None):
+        """Initialisation. clock (default the system clock) provides the
+        waits."""
+        self._initial = initial
+        self._maximum = maximum
+        self._factor = factor
+        self._jitter = jitter
+        self._clock = clock or SYSTEM_CLOCK
+        self._random = random.Random()
+        self._stop_event = threading.Event()
+
+        # consecutive failures since the last success
+        self.failures = 0
+
+    def delay(self):
+        """Delay before the next retry, counting a failure."""
+        base = min(self._initial*self._factor**self.failures, self._maximum)
+        self.failures += 1
+        return base*(1 - self._jitter*self._random.random())
+
+    def wait(self):
+        """Wait out the next delay. Returns True if stopped meanwhile."""
+        return self._clock.wait(self._stop_event, self.delay())
+
+    def reset(self):
+        """Start again from the initial delay, after a success."""
+        self.failures = 0
+
+    def stop(self):
+        """End any wait in progress, and all later ones immediately."""
+        self._stop_event.set()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
@@ -0,0 +1,127 @@
+"""Benchmark of the streaming NMEA parser against the line-based GGA path.
+
+Replays a recorded serial byte stream (or a synthetic u-blox stream of
+RMC, VTG, GGA, GSA, GSV and GLL sentences with some corrupted bytes) in
+serial-sized chunks, reporting MB/s, sentences/s and fixes/s for
+
+    legacy : readline + decode, keep GGA, then gga_parser and gps_altitude
+             as called separately by handle_telem and handle_data
+    nmea   : NmeaParser.feed, one shared Fix per epoch
+
+    python benchmarks/bench_nmea.py
+    python benchmarks/bench_nmea.py --file capture.bin --chunk 64
+"""
+import argparse
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+TUPPERSAT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(TUPPERSAT_DIR))
+
+from gps.nmea import NmeaParser, checksum
+from gps.parse_gga import gga_parser, gps_altitude
+
+EPOCHS = 20000
+CHUNK = 64
+REPEATS = 3
+
+
+def sentence(body):
+    return f'${body}*{checksum(body.encode()):02X}\r\n'.encode()
+
+def synthetic_stream(epochs, corrupt=0.001, seed=0):
+    """Bytes of a 1 Hz u-blox NMEA output during an ascent"""
+    rng = random.Random(seed)
+    out = bytearray()
+    lat, lon, alt = 5318.57800, 615.19200, 50.0
+    for i in range(epochs):
+        h, m, s = (i // 3600) % 24, (i // 60) % 60, i % 60
+        utc = f'{h:02d}{m:02d}{s:02d}.00'
+        lat += rng.uniform(-0.002, 0.003)
+        lon += rng.uniform(-0.002, 0.003)
+        alt += rng.uniform(3, 6)
+        sats = rng.randint(6, 12)
+        svs = ','.join(f'{rng.randint(1, 32):02d}' for _ in range(sats))
+        svs += ',' * (12 - sats)
+        for body in (
+                f'GPRMC,{utc},A,{lat:010.5f},N,{lon:011.5f},W,'
+                f'{rng.uniform(0, 20):.3f},{rng.uniform(0, 360):.2f},'
+                f'010122,,,A',
+                f'GPVTG,{rng.uniform(0, 360):.2f},T,,M,'
+                f'{rng.uniform(0, 20):.3f},N,{rng.uniform(0, 37):.3f},K,A',
+                f'GPGGA,{utc},{lat:010.5f},N,{lon:011.5f},W,1,{sats:02d},'
+                f'{rng.uniform(0.5, 2):.2f},{alt:.1f},M,55.0,M,,',
+                f'GPGSA,A,3,{svs},{rng.uniform(1, 3):.2f},'
+                f'{rng.uniform(0.5, 2):.2f},{rng.uniform(1, 3):.2f}',
+                f'GPGSV,3,1,{sats:02d},01,45,123,40,02,30,045,38,'
+                f'03,10,300,25,04,60,200,42',
+                f'GPGLL,{lat:010.5f},N,{lon:011.5f},W,{utc},A,A'):
+            out += sentence(body)
+    for _ in range(int(len(out)*corrupt)):
+        out[rng.randrange(len(out))] = rng.randrange(256)
+    return bytes(out)
+
+
+def legacy(stream, chunk):
+    """The previous GpsReceiver.read and handlers, fed line by line"""
+    fixes = 0
+    sentences = 0
+    for line in io.BytesIO(stream):
+        sentences += 1
+        try:
+            text = line.decode('ascii')
+        except UnicodeDecodeError:
+            continue
+        if text[3:6] != 'GGA':
+            continue
+        try:
+            gga_parser(text)
+            gps_altitude(text)
+            gga_parser(text)
+        except (IndexError, ValueError):
+            continue
+        fixes += 1
+    return sentences, fixes
+
+def streaming(stream, chunk):
+    parser = NmeaParser()
+    fixes = 0
+    for i in range(0, len(stream), chunk):
+        fixes += len(parser.feed(stream[i:i + chunk]))
+    return parser.stats.sentences, fixes
+
+
+def bench(name, func, stream, chunk, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        sentences, fixes = func(stream, chunk)
+        best = min(best, time.perf_counter() - start)
+    print(f'{name:8s} {len(stream)/best/1e6:7.2f} MB/s '
+          f'{sentences/best:10.0f} sentences/s {fixes/best:9.0f} fixes/s '
+          f'({fixes} fixes)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--file', type=Path,
+                        help='recorded raw serial byte stream')
+    parser.add_argument('--epochs', type=int, default=EPOCHS,
+                        help='epochs of synthetic stream without --file')
+    parser.add_argument('--chunk', type=int, default=CHUNK,
+                        help='bytes per serial read')
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    args = parser.parse_args()
+
+    stream = (args.file.read_bytes() if args.file
+              else synthetic_stream(args.epochs))
+    print(f'{len(stream)/1e6:.2f} MB stream, {args.chunk} byte reads')
+    bench('legacy', legacy, stream, args.chunk, args.repeats)
+    bench('nmea', streaming, stream, args.chunk, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+bus_manager.py
+
+Shared manager for the I2C bus used by the pressure, humidity and ozone
+sensors.
+
+Every transaction goes through one lock per bus, so sensors on different
+threads can no longer interleave their transfers. The lock is only held for
+the transfer itself: a sensor that sends a conversion command hands the bus
+back while it waits for the result. SharedBus offers the same methods as
+smbus.SMBus, so it can be passed anywhere a bus object is expected.
+"""
+# standard library imports
+import contextlib
+import logging
+import threading
+
+# third party imports
+import smbus
+
+# local imports
+from clock import SYSTEM_CLOCK
+
+
+# ****************************************************************************
+
+class DeviceStats:
+    """Bus usage of one device address."""
+    def __init__(self):
+        self.transactions = 0
+        self.errors = 0
+        self.bus_time = 0.0
+        self.wait_time = 0.0
+
+    def summary(self):
+        return {'transactions': self.transactions,
+                'errors'      : self.errors,
+                'bus_time_ms' : 1e3*self.bus_time,
+                'wait_time_ms': 1e3*self.wait_time}
+
+
+class SharedBus:
+    """A thread-safe, instrumented wrapper around smbus.SMBus."""
+    def __init__(self, bus_number=1, clock=None):
+        """Initialisation. clock (default the system clock) times the
+        transactions and waits."""
+        self._number = bus_number
+        self._bus = smbus.SMBus(bus_number)
+        self._clock = clock or SYSTEM_CLOCK
+        # re-entrant so that a transaction can be made of several calls
+        self._lock = threading.RLock()
+        self._stats = {}
+        self._logger = logging.getLogger(__name__)
+
+    def __repr__(self):
+        return f'SharedBus({self._number})'
+
+    @contextlib.contextmanager
+    def transaction(self, addr):
+        """Hold the bus for a sequence of transfers to one device."""
+        stats = self._stats.setdefault(addr, DeviceStats())
+        requested = self._clock.monotonic()
+        with self._lock:
+            acquired = self._clock.monotonic()
+            try:
+                yield self._bus
+            except OSError:
+                stats.errors += 1
+                raise
+            finally:
+                stats.transactions += 1
+                stats.wait_time += acquired - requested
+                stats.bus_time += self._clock.monotonic() - acquired
+
+    # smbus.SMBus methods used by the sensors
+    def write_byte(self, addr, value):
+        with self.transaction(addr) as bus:
+            return bus.write_byte(addr, value)
+
+    def read_byte(self, addr):
+        with self.transaction(addr) as bus:
+            return bus.read_byte(addr)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        with self.transaction(addr) as bus:
+            return bus.read_i2c_block_data(addr, reg, length)
+
+    def write_i2c_block_data(self, addr, reg, data):
+        with self.transaction(addr) as bus:
+            return bus.write_i2c_block_data(addr, reg, data)
+
+    def read_registers(self, addr, registers):
+        """Read several (register, length) blocks in one bus transaction.
+        Returns list of lists of bytes."""
+        with self.transaction(addr) as bus:
+            return [bus.read_i2c_block_data(addr, reg, length)
+                    for reg, length in registers]
+
+    def command(self, addr, cmd, wait, reg, length):
+        """Send cmd, release the bus for wait seconds, then read length
+        bytes from reg, e.g. for an ADC conversion."""
+        self.write_byte(addr, cmd)
+        self._clock.sleep(wait)
+        return self.read_i2c_block_data(addr, reg, length)
+
+    def stats(self):
+        """Dictionary of device address : bus usage statistics."""
+        return {addr: stats.summary() for addr, stats in self._stats.items()}
+
+    def report(self):
+        """Log the bus usage of every device."""
+        for addr, stats in self.stats().items():
+            self._logger.info(
+                f"0x{addr:02X}: {stats['transactions']} transactions, "
+                f"{stats['errors']} errors, bus time "
+                f"{stats['bus_time_ms']:.0f} ms, waited "
+                f"{stats['wait_time_ms']:.0f} ms")
+
+    def close(self):
+        self._bus.close()
+
+
+# ****************************************************************************
+
+_BUSES = {}
+_BUSES_LOCK = threading.Lock()
+
+def get_bus(bus_number=1, clock=None):
+    """Return the SharedBus for bus_number, opening it on first use with
+    clock (default the system clock)."""
+    with _BUSES_LOCK:
+        if bus_number not in _BUSES:
+            _BUSES[bus_number] = SharedBus(bus_number, clock)
+        return _BUSES[bus_number]
@@ -0,0 +1,152 @@
+"""
+clock.py
+
+Clocks injected into the sensors, processes and flight log in place of
+direct calls to time.sleep, time.time and datetime.now.
+
+SYSTEM_CLOCK is the default everywhere and passes straight through to the
+time module. A VirtualClock runs simulated time: sleeping threads take part
+in a discrete-event loop, and the clock jumps to the earliest wake-up time
+once every participating thread is asleep, so a flight replays as fast as
+the code runs while each thread sees the same sequence of times as in
+flight.
+"""
+# standard library imports
+import datetime
+import heapq
+import threading
+import time
+
+
+# ****************************************************************************
+
+class SystemClock:
+    """Real time, from the time module."""
+    def time(self):
+        return time.time()
+
+    def time_ns(self):
+        return time.time_ns()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def monotonic_ns(self):
+        return time.monotonic_ns()
+
+    def now(self):
+        """Local time as a datetime."""
+        return datetime.datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        """Wait for a threading.Event up to timeout seconds, returning
+        True if it was set."""
+        return event.wait(timeout)
+
+    def wait_condition(self, condition, timeout=None):
+        """Wait on a threading.Condition held by the caller up to timeout
+        seconds (default forever), returning False on timeout."""
+        return condition.wait(timeout)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+# ****************************************************************************
+
+class VirtualClock:
+    """Simulated time advanced only by sleeping.
+
+    Threads sharing the clock are registered with join() and leave().
+    Time advances to the earliest wake-up time once all registered threads
+    are sleeping; with no threads registered, sleep advances time
+    immediately. A participant blocking on anything other than the clock
+    stops time.
+    """
+    def __init__(self, start=None):
+        """Initialisation. start is the epoch time (s) at which simulated
+        time begins, default now."""
+        start = time.time() if start is None else start
+        self._start_ns = round(start*1e9)
+        # kept in integer ns, so that repeated sleeps add up exactly
+        self._elapsed_ns = 0
+        self._participants = 0
+        # wake-up times (elapsed ns) of sleeping participants
+        self._sleepers = []
+        self._cond = threading.Condition()
+
+    def time(self):
+        return self.time_ns()/1e9
+
+    def time_ns(self):
+        return self._start_ns + self._elapsed_ns
+
+    def monotonic(self):
+        return self._elapsed_ns/1e9
+
+    def monotonic_ns(self):
+        return self._elapsed_ns
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.time())
+
+    def join(self):
+        """Register a participating thread, before it first sleeps."""
+        with self._cond:
+            self._participants += 1
+
+    def leave(self):
+        """Unregister a participating thread once it has finished."""
+        with self._cond:
+            self._participants -= 1
+            self._advance()
+
+    def advance(self, seconds):
+        """Move time forward, as if the only thread slept."""
+        with self._cond:
+            self._elapsed_ns += max(round(seconds*1e9), 0)
+            self._cond.notify_all()
+
+    def sleep(self, seconds):
+        with self._cond:
+            wake = self._elapsed_ns + max(round(seconds*1e9), 0)
+            if not self._participants:
+                self._elapsed_ns = wake
+                return
+            heapq.heappush(self._sleepers, wake)
+            self._advance()
+            while self._elapsed_ns < wake:
+                self._cond.wait()
+
+    def wait(self, event, timeout):
+        """Sleep for timeout unless event is already set; the event is
+        only checked before and after, as time jumps meanwhile."""
+        if not event.is_set():
+            self.sleep(timeout)
+        return event.is_set()
+
+    def wait_condition(self, condition, timeout=None):
+        """Sleep for timeout with the caller's condition released;
+        notifications are not seen, as time jumps meanwhile. Without a
+        timeout, waits for a notification in real time."""
+        if timeout is None:
+            return condition.wait()
+        condition.release()
+        try:
+            self.sleep(timeout)
+        finally:
+            condition.acquire()
+        return False
+
+    def _advance(self):
+        """Jump to the earliest wake-up time if every participant sleeps.
+        Called with the condition held."""
+        if not self._sleepers or len(self._sleepers) < self._participants:
+            return
+        self._elapsed_ns = max(self._elapsed_ns, self._sleepers[0])
+        while self._sleepers and self._sleepers[0] <= self._elapsed_ns:
+            heapq.heappop(self._sleepers)
+        self._cond.notify_all()
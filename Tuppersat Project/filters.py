@@ -0,0 +1,130 @@
+"""
+filters.py
+
+Streaming filters smoothing the readings of one sensor, sample by sample.
+
+Each filter takes one value per push and returns the filtered value, in
+constant time (MovingAverage, ExponentialAverage) or a memmove of at most
+window values (MovingMedian), so a sensor can be polled at its native rate
+whatever the length of its smoothing window.
+"""
+# standard library imports
+import bisect
+
+
+# ****************************************************************************
+
+class MovingAverage:
+    """Mean of the last window values, from a ring buffer and running sum."""
+    def __init__(self, window):
+        """Initialisation."""
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self._values = [0.0]*self.window
+        # index of the next slot to write, and number of values held
+        self._next = 0
+        self._count = 0
+        self._sum = 0.0
+
+    def push(self, value):
+        """Add a value, returning the mean of the window."""
+        if self._count == self.window:
+            self._sum -= self._values[self._next]
+        else:
+            self._count += 1
+        self._values[self._next] = value
+        self._sum += value
+        self._next = (self._next + 1) % self.window
+        if not self._next:
+            # re-sum once per window so that rounding errors of the running
+            # sum cannot build up
+            self._sum = sum(self._values[:self._count])
+        return self.value
+
+    @property
+    def value(self):
+        return self._sum/self._count if self._count else None
+
+
+class MovingMedian:
+    """Median of the last window values, robust to single-sample spikes."""
+    def __init__(self, window):
+        """Initialisation."""
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self._values = [None]*self.window
+        self._next = 0
+        self._count = 0
+        # the values held, in increasing order
+        self._sorted = []
+
+    def push(self, value):
+        """Add a value, returning the median of the window."""
+        if self._count == self.window:
+            oldest = self._values[self._next]
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        else:
+            self._count += 1
+        self._values[self._next] = value
+        bisect.insort(self._sorted, value)
+        self._next = (self._next + 1) % self.window
+        return self.value
+
+    @property
+    def value(self):
+        n = len(self._sorted)
+        if not n:
+            return None
+        if n % 2:
+            return self._sorted[n//2]
+        return (self._sorted[n//2 - 1] + self._sorted[n//2])/2
+
+
+class ExponentialAverage:
+    """Exponentially weighted mean, with the weight of a window-value
+    moving average, alpha = 2/(window + 1)."""
+    def __init__(self, window):
+        """Initialisation."""
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.window = window
+        self._alpha = 2/(window + 1)
+        self.reset()
+
+    def reset(self):
+        self._value = None
+
+    def push(self, value):
+        """Add a value, returning the updated mean."""
+        if self._value is None:
+            self._value = value
+        else:
+            self._value += self._alpha*(value - self._value)
+        return self._value
+
+    @property
+    def value(self):
+        return self._value
+
+
+# ****************************************************************************
+
+FILTERS = {'mean'  : MovingAverage,
+           'median': MovingMedian,
+           'ema'   : ExponentialAverage}
+
+def make_filter(kind, window):
+    """Filter of the given kind ('mean', 'median' or 'ema') over window
+    values."""
+    try:
+        return FILTERS[kind](window)
+    except KeyError:
+        raise ValueError(f'Unknown filter {kind}') from None
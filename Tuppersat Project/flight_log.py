@@ -0,0 +1,302 @@
+"""
+flight_log.py
+
+Compact binary flight log, written by StoreData in place of text lines.
+
+A flight file is a header followed by blocks. The header holds the schema
+(the fields of each record group) and a wall clock / monotonic clock pair,
+so monotonic_ns record times can be converted to UTC afterwards. Each
+block holds the records of one group stored column by column: the uint32
+record times in microseconds after the block's int64 monotonic_ns start
+time, then one little-endian array per field. Every block starts with a
+sync marker and ends with a CRC32, so a file cut short by a crash or with a
+corrupted block can still be read up to and around the damage.
+
+    header: MAGIC | version u8 | wall_ns i64 | mono_ns i64 | len u32 |
+            schema json | crc32 u32
+    block : SYNC | group u8 | count u16 | t0_ns i64 | payload len u32 |
+            payload | crc32 u32
+"""
+# standard library imports
+import json
+import logging
+import mmap
+import struct
+import zlib
+
+# third party imports
+import numpy as np
+
+# local imports
+from clock import SYSTEM_CLOCK
+
+
+MAGIC = b'TSFLOG\r\n'
+VERSION = 1
+SYNC = b'\xa5\x5aTSB\x00\xff\x5a'
+
+_HEADER = struct.Struct('<BqqI')
+_BLOCK = struct.Struct('<BHqI')
+_CRC = struct.Struct('<I')
+
+# Fields of each StoreData group, in the order of collect_data
+SCHEMA = {
+    'gps'     : [('lat', '<f8'), ('lon', '<f8'), ('alt', '<f4'),
+                 ('hdop', '<f4')],
+    'interior': [('temp1', '<f4'), ('pressure_t', '<f4'),
+                 ('pressure_p', '<f4')],
+    'payload' : [('temp2', '<f4'), ('p_ext_t', '<f4'), ('p_ext_p', '<f4'),
+                 ('hum', '<f4'), ('ozone', '<f4')],
+    }
+
+# Raw mode adds the ADC counts of the pressure and humidity sensors, exact
+# in float32 as they are at most 24 bit, and a record of the MS5611
+# calibration constants each time they are read
+RAW_SCHEMA = dict(SCHEMA,
+    raw=[('pressure_d1', '<f4'), ('pressure_d2', '<f4'),
+         ('p_ext_d1', '<f4'), ('p_ext_d2', '<f4'), ('hum_d3', '<f4')],
+    calibration=[(f'{label}_c{i}', '<f4') for label in ('pressure', 'p_ext')
+                 for i in range(1, 7)],
+    )
+
+# Window mode adds the mean of each interior and payload reading since the
+# previous record, beside the latest readings and raw counts
+MEAN_SCHEMA = {
+    'mean': [(f'{name}_mean', dtype) for group in ('interior', 'payload')
+             for name, dtype in SCHEMA[group]],
+    }
+
+# Records per group held in memory before a block is written, and the
+# longest time span of those records, so that slow groups are written
+# within seconds
+BLOCK_RECORDS = 60
+BLOCK_SECONDS = 5
+
+# Longest span of a block, limited by its uint32 microsecond offsets
+MAX_BLOCK_NS = (2**32 - 1)*1000
+
+
+class FlightLogError(Exception):
+    pass
+
+
+# ****************************************************************************
+
+class FlightLogWriter:
+    """Buffers records per group and writes them as checksummed blocks."""
+    def __init__(self, filename, schema=SCHEMA, block_records=BLOCK_RECORDS,
+                 block_seconds=BLOCK_SECONDS, clock=None):
+        """Initialisation.
+
+        A group's block is written once it holds block_records records or
+        spans block_seconds. At most that, plus whatever the FileWriter
+        has not yet flushed, is lost if the program stops without closing
+        the log. clock (default the system clock) gives the header's clock
+        pair and default record times.
+        """
+        self._filename = filename
+        self._schema = {group: [(name, np.dtype(dtype))
+                                for name, dtype in fields]
+                        for group, fields in schema.items()}
+        self._groups = list(schema)
+        self._block_records = block_records
+        self._block_ns = min(int(block_seconds*1e9), MAX_BLOCK_NS)
+        self._pending = {group: [] for group in schema}
+        self._file = None
+        self._clock = clock or SYSTEM_CLOCK
+
+        self.bytes_written = 0
+        self._logger = logging.getLogger(__name__)
+
+    def __repr__(self):
+        return f'FlightLogWriter({self._filename})'
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def open(self):
+        # Imported here so that reading logs on the ground doesn't need
+        # the tuppersat library
+        from tuppersat_utils.fileutils import OutputFile
+        self._file = OutputFile(self._filename, mode='wb')
+        self._file.open()
+        schema = json.dumps({group: [(name, dtype.str)
+                                     for name, dtype in fields]
+                             for group, fields in self._schema.items()},
+                            separators=(',', ':')).encode()
+        header = _HEADER.pack(VERSION, self._clock.time_ns(),
+                              self._clock.monotonic_ns(),
+                              len(schema)) + schema
+        self._write(MAGIC + header + _CRC.pack(zlib.crc32(header)))
+
+    def close(self):
+        """Write all pending records and close the file."""
+        for group in self._groups:
+            self._write_block(group)
+        self._file.close()
+
+    def append(self, group, values, t_ns=None):
+        """Add a record of values (one per field, None if missing) taken
+        at monotonic time t_ns (default now)."""
+        if len(values) != len(self._schema[group]):
+            raise ValueError(f'{group}: expected {len(self._schema[group])}'
+                             f' values, got {len(values)}')
+        t_ns = self._clock.monotonic_ns() if t_ns is None else t_ns
+        pending = self._pending[group]
+        if pending and t_ns - pending[0][0] > MAX_BLOCK_NS:
+            self._write_block(group)
+        pending.append((t_ns, values))
+        if (len(pending) >= self._block_records
+                or t_ns - pending[0][0] >= self._block_ns):
+            self._write_block(group)
+
+    def _write_block(self, group):
+        pending = self._pending[group]
+        if not pending:
+            return
+        times, rows = zip(*pending)
+        t0 = times[0]
+        offsets = (np.array(times, dtype=np.int64) - t0)//1000
+        columns = [offsets.astype('<u4')]
+        for i, (_, dtype) in enumerate(self._schema[group]):
+            columns.append(np.array([np.nan if row[i] is None else row[i]
+                                     for row in rows], dtype=dtype))
+        payload = b''.join(column.tobytes() for column in columns)
+        header = _BLOCK.pack(self._groups.index(group), len(pending), t0,
+                             len(payload))
+        self._write(SYNC + header + payload
+                    + _CRC.pack(zlib.crc32(header + payload)))
+        pending.clear()
+
+    def _write(self, data):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+
+# ****************************************************************************
+
+class FlightLogReader:
+    """Memory-maps a flight file and reads its blocks as NumPy arrays."""
+    def __init__(self, filename):
+        """Initialisation."""
+        self._filename = filename
+        self.corrupt_blocks = 0
+        self._logger = logging.getLogger(__name__)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def open(self):
+        with open(self._filename, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._read_header()
+
+    def close(self):
+        self._map.close()
+
+    def _read_header(self):
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise FlightLogError(f'{self._filename} is not a flight log')
+        start = len(MAGIC)
+        version, wall_ns, mono_ns, length = _HEADER.unpack_from(self._map,
+                                                                start)
+        if version != VERSION:
+            raise FlightLogError(f'Unsupported flight log version {version}')
+        end = start + _HEADER.size + length
+        crc, = _CRC.unpack_from(self._map, end)
+        if zlib.crc32(self._map[start:end]) != crc:
+            raise FlightLogError(f'{self._filename}: corrupt header')
+        schema = json.loads(self._map[start + _HEADER.size:end])
+        self.schema = {group: [(name, np.dtype(dtype))
+                               for name, dtype in fields]
+                       for group, fields in schema.items()}
+        self._groups = list(schema)
+        self._wall_ns = wall_ns
+        self._mono_ns = mono_ns
+        self._offset = end + _CRC.size
+
+    def wall_time(self, t_ns):
+        """UNIX time in seconds of monotonic_ns record time(s) t_ns."""
+        return (self._wall_ns + (np.asarray(t_ns) - self._mono_ns))/1e9
+
+    def blocks(self):
+        """Yield (group, columns) for every intact block, where columns
+        is a dictionary of field : array viewing the mapped file, with the
+        monotonic_ns record times under 't'. Corrupt blocks are skipped by
+        searching for the next sync marker."""
+        data = self._map
+        offset = data.find(SYNC, self._offset)
+        while offset != -1:
+            block = self._parse_block(offset)
+            if block is None:
+                self.corrupt_blocks += 1
+                offset = data.find(SYNC, offset + 1)
+                continue
+            group, columns, end = block
+            yield group, columns
+            offset = data.find(SYNC, end)
+
+    def _parse_block(self, offset):
+        """(group, columns, end offset) of the block at offset, or None
+        if it is truncated or fails its checksum."""
+        data = self._map
+        start = offset + len(SYNC)
+        if start + _BLOCK.size > len(data):
+            return None
+        index, count, t0, length = _BLOCK.unpack_from(data, start)
+        payload = start + _BLOCK.size
+        end = payload + length
+        if index >= len(self._groups) or end + _CRC.size > len(data):
+            return None
+        crc, = _CRC.unpack_from(data, end)
+        if zlib.crc32(data[start:end]) != crc:
+            return None
+
+        group = self._groups[index]
+        fields = [('t', np.dtype('<u4'))] + self.schema[group]
+        if length != count*sum(dtype.itemsize for _, dtype in fields):
+            return None
+        columns = {}
+        for name, dtype in fields:
+            columns[name] = np.frombuffer(data, dtype=dtype, count=count,
+                                          offset=payload)
+            payload += count*dtype.itemsize
+        columns['t'] = t0 + 1000*columns['t'].astype(np.int64)
+        return group, columns, end + _CRC.size
+
+    def read(self):
+        """Dictionary of group : {field : array} over the whole flight."""
+        parts = {group: [] for group in self._groups}
+        for group, columns in self.blocks():
+            parts[group].append(columns)
+        if self.corrupt_blocks:
+            self._logger.warning(f'{self._filename}: skipped '
+                                 f'{self.corrupt_blocks} corrupt blocks')
+        result = {}
+        for group, blocks in parts.items():
+            fields = [('t', np.dtype('<i8'))] + self.schema[group]
+            result[group] = {
+                name: (np.concatenate([block[name] for block in blocks])
+                       if blocks else np.empty(0, dtype))
+                for name, dtype in fields}
+        return result
+
+
+def read_flight_log(filename):
+    """Read a whole flight file into a dictionary of group :
+    {field : array}, with wall clock times under 'time'."""
+    with FlightLogReader(filename) as reader:
+        data = reader.read()
+        for columns in data.values():
+            columns['time'] = reader.wall_time(columns['t'])
+    return data
@@ -0,0 +1,197 @@
+"""
+flight_phase.py
+
+Flight phase detection, adapting the sampling rates to the phase.
+
+The vertical speed is the least-squares slope of the altitude over the
+last WINDOW seconds: from the GPS fixes while there are enough of them,
+otherwise from the pressure altitude. Each update classifies it as
+climbing, sinking or level, and the phase changes once the same class has
+held for HOLD seconds:
+
+    pad     --climbing--> ascent  --level--> float
+    ascent  --sinking---> descent --level--> landed
+    float   --climbing--> ascent
+    pad, float, landed --sinking--> descent
+
+The phase is seeded from the first vertical speed, so that a restart in
+flight does not start on the pad: climbing is the ascent, sinking the
+descent, and level the float above SEED_ALTITUDE and the pad below it.
+
+On every change the tasks of the rate table are set to the phase's rates,
+dense while climbing and sinking, sparse on the pad and after landing.
+"""
+# standard library imports
+import logging
+from collections import deque
+
+# third party imports
+import numpy as np
+
+# local imports
+from clock import SYSTEM_CLOCK
+
+
+# Flight phases, in the order of the rate table entries
+PAD = 'pad'
+ASCENT = 'ascent'
+FLOAT = 'float'
+DESCENT = 'descent'
+LANDED = 'landed'
+PHASES = (PAD, ASCENT, FLOAT, DESCENT, LANDED)
+
+# Vertical speeds (m/s) above which the payload is climbing and below
+# which it is sinking
+CLIMB_SPEED = 1.5
+SINK_SPEED = -3.0
+
+# Seconds of altitude fitted, fewest samples fitted, and seconds a new
+# class of vertical speed must hold before the phase changes
+WINDOW = 30
+MIN_SAMPLES = 5
+HOLD = 10
+
+# Altitude (m) above which level flight at startup is the float, well
+# above any launch site
+SEED_ALTITUDE = 3000
+
+# Phase entered from each phase when climbing, sinking or level; None to
+# stay
+TRANSITIONS = {PAD    : {'climbing': ASCENT, 'sinking': DESCENT,
+                         'level': None},
+               ASCENT : {'climbing': None, 'sinking': DESCENT,
+                         'level': FLOAT},
+               FLOAT  : {'climbing': ASCENT, 'sinking': DESCENT,
+                         'level': None},
+               DESCENT: {'climbing': None, 'sinking': None,
+                         'level': LANDED},
+               LANDED : {'climbing': None, 'sinking': DESCENT,
+                         'level': None}}
+
+
+def pressure_altitude(p_mbar):
+    """Altitude (m) of the ISA troposphere at pressure p_mbar"""
+    return 44330.8*(1 - (p_mbar/1013.25)**0.190263)
+
+
+def vertical_speed(samples):
+    """Least-squares slope (m/s) of (time, altitude) samples"""
+    t, alt = np.array(samples).T
+    t = t - t.mean()
+    return float((t*(alt - alt.mean())).sum()/(t*t).sum())
+
+
+def speed_class_of(speed):
+    """'climbing', 'sinking' or 'level' at vertical speed speed (m/s)"""
+    if speed > CLIMB_SPEED:
+        return 'climbing'
+    if speed < SINK_SPEED:
+        return 'sinking'
+    return 'level'
+
+
+# ****************************************************************************
+
+class FlightPhase:
+    """Process detecting the flight phase and setting task rates."""
+    def __init__(self, sensor_dict, scheduler, rates, pressure='pressure',
+                 phase=None, clock=None):
+        """Initialisation.
+
+        sensor_dict holds the 'gps' and pressure sensors, e.g. a
+        LatestView. rates is a dictionary of task name : rates (Hz) in the
+        order of PHASES, set on scheduler on every phase change. phase is
+        the phase to start in, by default seeded from the first vertical
+        speed and altitude; the rates are left as scheduled until then.
+        """
+        self._sensor_dict = sensor_dict
+        self._scheduler = scheduler
+        self._rates = rates
+        self._pressure = pressure
+        self._clock = clock or SYSTEM_CLOCK
+
+        self.phase = phase
+        self.vertical_speed = None
+        # (time, altitude) samples of each source within the window
+        self._gps = deque()
+        self._baro = deque()
+        # class of vertical speed since the given time
+        self._class = None
+        self._since = None
+        # phase whose rates are set on the scheduler
+        self._applied = None
+
+        self._logger = logging.getLogger(__name__)
+
+    def setup(self):
+        if self.phase is not None:
+            self._logger.info(f'Flight phase {self.phase}')
+
+    def teardown(self):
+        pass
+
+    def update(self):
+        """Sample the altitude, then change phase and rates if due.
+        Run once a second by the scheduler."""
+        now = self._clock.monotonic()
+        self._sample(now)
+        samples = self._samples()
+        self.vertical_speed = (None if samples is None
+                               else vertical_speed(samples))
+        if self.vertical_speed is not None:
+            if self.phase is None:
+                self._seed(self.vertical_speed, samples[-1][1])
+            self._classify(now, self.vertical_speed)
+        if self.phase is not None and self._applied != self.phase:
+            self._apply()
+
+    def _sample(self, now):
+        fix = self._sensor_dict['gps'].data
+        if fix is not None and fix.alt is not None:
+            self._gps.append((now, fix.alt))
+        _, p = self._sensor_dict[self._pressure].data
+        if p is not None and p > 0:
+            self._baro.append((now, pressure_altitude(p)))
+        for samples in (self._gps, self._baro):
+            while samples and samples[0][0] <= now - WINDOW:
+                samples.popleft()
+
+    def _samples(self):
+        """Samples to fit: the GPS's if there are enough, otherwise the
+        pressure altitude's, or None"""
+        for samples in (self._gps, self._baro):
+            if len(samples) >= MIN_SAMPLES:
+                return samples
+        return None
+
+    def _seed(self, speed, altitude):
+        speed_class = speed_class_of(speed)
+        if speed_class == 'climbing':
+            self.phase = ASCENT
+        elif speed_class == 'sinking':
+            self.phase = DESCENT
+        else:
+            self.phase = FLOAT if altitude > SEED_ALTITUDE else PAD
+        self._logger.info(f'Flight phase {self.phase} at startup, altitude '
+                          f'{altitude:.0f} m, vertical speed {speed:.1f} m/s')
+
+    def _classify(self, now, speed):
+        speed_class = speed_class_of(speed)
+        if speed_class != self._class:
+            self._class, self._since = speed_class, now
+        phase = TRANSITIONS[self.phase][speed_class]
+        if phase is not None and now - self._since >= HOLD:
+            self._logger.info(f'Flight phase {self.phase} -> {phase}, '
+                              f'vertical speed {speed:.1f} m/s')
+            self.phase = phase
+
+    def _apply(self):
+        """Set the rates of the phase, retried next update while any task
+        is not yet scheduled."""
+        index = PHASES.index(self.phase)
+        applied = True
+        for name, rates in self._rates.items():
+            if not self._scheduler.set_rate(name, rates[index]):
+                applied = False
+        if applied:
+            self._applied = self.phase
@@ -1,23 +1,57 @@
 import serial
-import time
 import logging
 
+from pubsub import null_publisher
+from clock import SYSTEM_CLOCK
+from backoff import Backoff
+from gps.nmea import NmeaParser
+from gps.ubx import UbxParser, cfg_prt, cfg_rate, cfg_msg
+from gps.ubx import NAV_PVT, NAV_DOP, CFG_MSG, CFG_RATE, CFG_PRT, PORT_USB
+from gps.ubx import PORT_UART1
+
+#Seconds to wait for the receiver to acknowledge a UBX configuration
+ACK_TIMEOUT = 1
+
+#Baud rate of the receiver's UART after a cold start
+DEFAULT_BAUDRATE = 9600
+
 class GpsReceiver:
     """A class representing the GPS receiver."""
-    def __init__(self, port):
-        """Initialsiation."""
+    def __init__(self, port, mode='nmea', nav_rate=1, ubx_port=PORT_UART1,
+                 ubx_baudrate=115200, clock=None):
+        """Initialsiation.
+        
+        mode 'nmea' reads the default 9600 baud NMEA output. mode 'ubx'
+        configures the receiver's port ubx_port (PORT_UART1 or PORT_USB)
+        for UBX NAV-PVT and NAV-DOP output only, at nav_rate solutions per
+        second and, on a UART, at ubx_baudrate."""
+        if mode not in ('nmea', 'ubx'):
+            raise ValueError(f'Unknown GPS mode {mode}')
         
         #Detials for openening serial port
         self._serial_details = {'port': port,
-                                'baudrate': 9600,
+                                'baudrate': DEFAULT_BAUDRATE,
                                 'timeout': 1}
         self._ser = None
         
-        #Data attribute
+        #UBX configuration
+        self._mode = mode
+        self._nav_rate = nav_rate
+        self._ubx_port = ubx_port
+        self._ubx_baudrate = ubx_baudrate
+        
+        #Data attribute, latest Fix
         self._data = None
         
-        #NMEA Sentence id
-        self._id = 'GGA'
+        #Incremental parser of the NMEA or UBX byte stream
+        self._parser = NmeaParser() if mode == 'nmea' else UbxParser()
+        
+        #Publisher of each new Fix
+        self._publish = null_publisher
+        #Clock for timestamps and waits
+        self._clock = clock or SYSTEM_CLOCK
+        #Backoff between retries after errors
+        self._backoff = Backoff(clock=self._clock)
         
         self._logger = logging.getLogger(__name__)
         
@@ -26,35 +60,91 @@ class GpsReceiver:
         try:
             #Open serial port
             self._ser = serial.Serial(**self._serial_details)
+            if self._mode == 'ubx':
+                self.configure()
             
         except (serial.SerialException, AttributeError) as exc:
             self._logger.exception(type(exc).__name__)
             self._data = None
             self.teardown()
-            time.sleep(60)
+            self._ser = None
+            self._backoff.wait()
 
     
+    def configure(self):
+        """Switch the receiver to UBX NAV-PVT and NAV-DOP output at the
+        navigation rate, reopening the port at the new baud rate if it is
+        a UART"""
+        rate = cfg_rate(round(1000/self._nav_rate))
+        if self._ubx_port == PORT_USB:
+            self._send(CFG_RATE, rate)
+        else:
+            #A receiver still powered since an earlier setup, e.g. after a
+            #restart of the software, is already at the UBX baud rate, so
+            #try that before the default
+            for baudrate in (self._ubx_baudrate, DEFAULT_BAUDRATE):
+                self._ser.baudrate = baudrate
+                if self._send(CFG_RATE, rate, warn=False) is not None:
+                    break
+            else:
+                self._logger.warning(f'No acknowledgement of UBX {CFG_RATE}')
+        self._send(CFG_MSG, cfg_msg(NAV_DOP))
+        self._send(CFG_MSG, cfg_msg(NAV_PVT))
+        if self._ubx_port == PORT_USB:
+            self._send(CFG_PRT, cfg_prt(port=PORT_USB))
+            return
+        #A UART acknowledges at the new baud rate, so do not wait
+        self._ser.write(cfg_prt(self._ubx_baudrate, port=self._ubx_port))
+        self._ser.flush()
+        self._clock.sleep(0.1)
+        self._ser.baudrate = self._ubx_baudrate
+        self._logger.info(f'GPS UART set to {self._ubx_baudrate} baud')
+    
+    def _send(self, msg, frame, warn=True):
+        """Send a UBX configuration frame and wait for its acknowledgement.
+        Returns True if acknowledged, False if rejected, None if neither
+        within ACK_TIMEOUT"""
+        self._parser.acks.pop(msg, None)
+        self._ser.write(frame)
+        deadline = self._clock.monotonic() + ACK_TIMEOUT
+        while (msg not in self._parser.acks
+               and self._clock.monotonic() < deadline):
+            self._parser.feed(self._ser.read(self._ser.in_waiting or 1))
+        ack = self._parser.acks.get(msg)
+        if ack is None and warn:
+            self._logger.warning(f'No acknowledgement of UBX {msg}')
+        elif ack is False:
+            self._logger.warning(f'UBX {msg} rejected')
+        return ack
+    
     def read(self):
-        """Listen for GGA sentence, and extract relevant details"""
-        #Constantly listen for NMEA sentence
+        """Parse the bytes waiting on the serial port (waiting up to the
+        timeout for at least one). Returns list of Fixes completed.
+        After an error the port is closed, then reopened on the next read
+        once the backoff has passed"""
+        if self._ser is None:
+            self.setup()
+            if self._ser is None:
+                return []
         try:
-            while True:
-                sentence = self._ser.readline().decode('ascii')
-                sen_id = sentence[3:6]
-                        
-                #Return if GGA sentence
-                if sen_id == self._id:
-                    return sentence
+            data = self._ser.read(self._ser.in_waiting or 1)
         except (serial.SerialException, AttributeError) as exc:
             self._logger.info(type(exc).__name__)
             self._data = None
+            self._publish(self._data)
             self.teardown()
-            time.sleep(60)
-                
+            self._ser = None
+            self._backoff.wait()
+            return []
+        self._backoff.reset()
+        return self._parser.feed(data)
         
     def update(self):
-        """Updating data attribute"""
-        self._data = self.read()
+        """Updating data attribute with the latest Fix, publishing
+        every Fix completed"""
+        for fix in self.read():
+            self._data = fix
+            self._publish(self._data)
         
     def teardown(self):
         """Tearing down by closing serial port"""
@@ -62,9 +152,22 @@ class GpsReceiver:
             self._ser.close()
         pass
         
+    def attach(self, publish):
+        """Publish each new Fix with publish(fix)"""
+        self._publish = publish
+        
+
+    def stop(self):
+        """End any backoff wait in progress, e.g. on shutdown"""
+        self._backoff.stop()
     @property
     def data(self):
         """Data attribute"""
         return self._data
     
+    @property
+    def stats(self):
+        """Counts of sentences or frames parsed and rejected"""
+        return self._parser.stats.summary()
+    
 
@@ -0,0 +1,228 @@
+"""
+nmea.py
+
+Streaming NMEA 0183 parser working on raw serial bytes.
+
+Bytes are fed in as they arrive, split into sentences, and only sentences
+with a valid *hh checksum are parsed. GGA, RMC, GSA and VTG sentences
+update a single fix, and each navigation epoch completes an immutable Fix
+shared by every consumer, so no sentence is split or converted more than
+once.
+
+An epoch starts with the first sentence of a new UTC time. Its Fix is
+completed once both its GGA and the GSA sent after it have arrived, so
+the dilutions of precision are those of the same epoch, or failing the
+GSA when the next epoch starts, without them.
+"""
+import datetime
+import logging
+from collections import namedtuple
+
+
+Fix = namedtuple('Fix', ['utc', 'lat', 'lon', 'alt', 'hdop', 'sats',
+                         'quality', 'speed', 'course', 'pdop', 'vdop'])
+Fix.__doc__ = """GPS fix. utc is a datetime.time, lat/lon in signed decimal
+degrees, alt in m above mean sea level, speed in m/s over ground and
+course in degrees true. Any field may be None if not (yet) reported."""
+
+EMPTY_FIX = Fix(*[None]*len(Fix._fields))
+
+# NMEA 0183 limits sentences to 82 characters; allow some slack
+MAX_SENTENCE = 128
+
+KNOTS = 1852/3600
+KMH = 1/3.6
+
+
+def checksum(body):
+    """XOR of all bytes between '$' and '*'.
+
+    The bytes are read as one integer and folded in halves, so the loop
+    runs log2(len(body)) times rather than once per byte.
+    """
+    value = int.from_bytes(body, 'little')
+    length = len(body)
+    while length > 1:
+        half = (length + 1)//2
+        value = (value & ((1 << 8*half) - 1)) ^ (value >> 8*half)
+        length = half
+    return value
+
+
+# ****************************************************************************
+# field conversion, working directly on bytes
+
+def _float(field):
+    return float(field) if field else None
+
+def _int(field):
+    return int(field) if field else None
+
+def _utc(field):
+    """hhmmss.ss to datetime.time"""
+    if len(field) < 6:
+        return None
+    seconds = float(field[4:])
+    return datetime.time(int(field[:2]), int(field[2:4]), int(seconds),
+                         int(round((seconds % 1)*1e6)) % 1000000)
+
+def _degrees(field, hemisphere):
+    """(d)ddmm.mmmm and N/S/E/W to signed decimal degrees"""
+    if not field:
+        return None
+    value = float(field)
+    degrees = int(value // 100)
+    decimal = degrees + (value - 100*degrees)/60
+    return -decimal if hemisphere in (b'S', b'W') else decimal
+
+
+# ****************************************************************************
+# sentence parsers, each returning the Fix fields it reports
+
+def parse_gga(fields):
+    return {'utc'    : _utc(fields[1]),
+            'lat'    : _degrees(fields[2], fields[3]),
+            'lon'    : _degrees(fields[4], fields[5]),
+            'quality': _int(fields[6]),
+            'sats'   : _int(fields[7]),
+            'hdop'   : _float(fields[8]),
+            'alt'    : _float(fields[9])}
+
+def parse_rmc(fields):
+    valid = fields[2] == b'A'
+    speed = _float(fields[7])
+    return {'utc'   : _utc(fields[1]),
+            'lat'   : _degrees(fields[3], fields[4]) if valid else None,
+            'lon'   : _degrees(fields[5], fields[6]) if valid else None,
+            'speed' : None if speed is None else speed*KNOTS,
+            'course': _float(fields[8])}
+
+def parse_gsa(fields):
+    return {'pdop': _float(fields[15]),
+            'hdop': _float(fields[16]),
+            'vdop': _float(fields[17])}
+
+def parse_vtg(fields):
+    speed = _float(fields[7])
+    return {'course': _float(fields[1]),
+            'speed' : None if speed is None else speed*KMH}
+
+# sentence type : (parser, minimum number of fields)
+PARSERS = {b'GGA': (parse_gga, 10),
+           b'RMC': (parse_rmc, 9),
+           b'GSA': (parse_gsa, 18),
+           b'VTG': (parse_vtg, 8)}
+
+
+# ****************************************************************************
+
+class NmeaStats:
+    """Counts of sentences seen by a NmeaParser."""
+    def __init__(self):
+        self.sentences = 0
+        self.parsed = 0
+        self.fixes = 0
+        self.bad_checksum = 0
+        self.malformed = 0
+        self.discarded_bytes = 0
+
+    def summary(self):
+        return dict(vars(self))
+
+
+class NmeaParser:
+    """Incremental parser turning raw NMEA bytes into Fix objects."""
+    def __init__(self):
+        """Initialisation."""
+        self._buffer = b''
+        self._fix = EMPTY_FIX
+        # UTC time of the epoch in progress, and whether its GGA and GSA
+        # have arrived since its Fix was last completed
+        self._epoch = None
+        self._gga = False
+        self._gsa = False
+        self.stats = NmeaStats()
+        self._logger = logging.getLogger(__name__)
+
+    def feed(self, data):
+        """Parse bytes as they arrive. Returns list of Fixes completed."""
+        *lines, self._buffer = (self._buffer + data).split(b'\n')
+        fixes = []
+        for line in lines:
+            fix = self.sentence(line)
+            if fix is not None:
+                fixes.append(fix)
+        if len(self._buffer) > MAX_SENTENCE:
+            # no line ending in sight: keep only a possible sentence start
+            start = self._buffer.rfind(b'$')
+            drop = len(self._buffer) if start == -1 else start
+            self.stats.discarded_bytes += drop
+            self._buffer = self._buffer[drop:]
+        return fixes
+
+    def sentence(self, line):
+        """Parse one line, returning the Fix it completes, if any."""
+        start = line.rfind(b'$')
+        if start == -1:
+            self.stats.discarded_bytes += len(line)
+            return None
+        line = line[start + 1:].rstrip(b'\r')
+        self.stats.sentences += 1
+
+        # only sentences that update the fix are checked and parsed
+        sentence_type = line[2:5]
+        parser, length = PARSERS.get(sentence_type, (None, 0))
+        if parser is None:
+            return None
+
+        body, star, check = line.partition(b'*')
+        try:
+            if not star or int(check[:2], 16) != checksum(body):
+                self.stats.bad_checksum += 1
+                return None
+        except ValueError:
+            self.stats.bad_checksum += 1
+            return None
+
+        fields = body.split(b',')
+        if len(fields) < length:
+            self.stats.malformed += 1
+            return None
+        try:
+            values = parser(fields)
+        except ValueError:
+            self.stats.malformed += 1
+            return None
+        self.stats.parsed += 1
+
+        fix = None
+        utc = values.get('utc')
+        if utc is not None and utc != self._epoch:
+            # a new epoch: complete the last one if its GSA never came, and
+            # drop its DOPs
+            if self._gga:
+                fix = self._complete()
+            self._epoch = utc
+            self._gga = self._gsa = False
+            self._fix = self._fix._replace(pdop=None, vdop=None)
+
+        self._fix = self._fix._replace(**values)
+        if sentence_type == b'GGA':
+            self._gga = True
+        elif sentence_type == b'GSA' and self._gga:
+            self._gsa = True
+        if self._gga and self._gsa:
+            fix = self._complete()
+        return fix
+
+    def _complete(self):
+        """The Fix of the epoch in progress, counted once."""
+        self._gga = self._gsa = False
+        self.stats.fixes += 1
+        return self._fix
+
+    @property
+    def fix(self):
+        """Latest state of the fix, including sentences since the last
+        completed Fix"""
+        return self._fix
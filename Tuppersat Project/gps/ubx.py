@@ -0,0 +1,229 @@
+"""
+ubx.py
+
+u-blox UBX binary protocol: configuration messages and a streaming parser
+of NAV-PVT navigation solutions and NAV-DOP dilutions of precision.
+
+A UBX frame is two sync bytes, class, id, a little-endian u16 payload
+length, the payload and a two byte Fletcher checksum over class to payload.
+One 92-byte NAV-PVT payload carries the time, position, velocity and
+accuracy of a navigation epoch, replacing several NMEA sentences, and is
+decoded with one struct.unpack_from on a memoryview of the receive buffer.
+NAV-PVT has no horizontal or vertical DOP, so these come from the NAV-DOP
+message, which the receiver sends before NAV-PVT in each epoch. The parser
+returns the same Fix as the NMEA parser.
+"""
+import datetime
+import logging
+import struct
+from itertools import accumulate
+
+from gps.nmea import Fix
+
+
+SYNC = b'\xb5\x62'
+_HEADER = struct.Struct('<BBH')
+
+# (class, id) of the messages used
+NAV_DOP = (0x01, 0x04)
+NAV_PVT = (0x01, 0x07)
+ACK_NAK = (0x05, 0x00)
+ACK_ACK = (0x05, 0x01)
+CFG_PRT = (0x06, 0x00)
+CFG_MSG = (0x06, 0x01)
+CFG_RATE = (0x06, 0x08)
+
+# Longest payload accepted, to recover quickly from a corrupt length
+MAX_PAYLOAD = 1024
+
+# Port ids and protocol masks for CFG-PRT
+PORT_UART1 = 1
+PORT_USB = 3
+PROTO_UBX = 0x01
+PROTO_NMEA = 0x02
+# 8 data bits, no parity, 1 stop bit
+UART_8N1 = 0x000008D0
+
+# NAV-PVT payload; only the fields named are kept
+_NAV_PVT = struct.Struct('<IHBBBBBBIiBBBBiiiiIIiiiiiIIH6xihH')
+NAV_PVT_LENGTH = _NAV_PVT.size
+# NAV-PVT flags bit 0: valid fix (within DOP and accuracy masks)
+GNSS_FIX_OK = 0x01
+
+# NAV-DOP payload: iTOW, then geometric, position, time, vertical,
+# horizontal, northing and easting DOP in units of 0.01
+_NAV_DOP = struct.Struct('<I7H')
+NAV_DOP_LENGTH = _NAV_DOP.size
+# Oldest NAV-DOP (ms of iTOW before the NAV-PVT) merged into a fix
+MAX_DOP_AGE = 2000
+
+
+def fletcher(data):
+    """8-bit Fletcher checksum (CK_A, CK_B) of a bytes-like object.
+
+    CK_B is the sum of the running sums making up CK_A, so both are
+    computed with builtin sums rather than a loop per byte.
+    """
+    return sum(data) & 0xFF, sum(accumulate(data)) & 0xFF
+
+def frame(msg, payload=b''):
+    """UBX frame of a message (class, id) and its payload."""
+    body = _HEADER.pack(*msg, len(payload)) + payload
+    return SYNC + body + bytes(fletcher(body))
+
+
+# ****************************************************************************
+# configuration messages
+
+def cfg_prt(baudrate=9600, port=PORT_UART1, in_proto=PROTO_UBX | PROTO_NMEA,
+            out_proto=PROTO_UBX):
+    """CFG-PRT frame setting the protocols (and for a UART the baud rate)
+    of a port. The receiver answers at the new settings, if at all."""
+    if port == PORT_USB:
+        mode, baudrate = 0, 0
+    else:
+        mode = UART_8N1
+    payload = struct.pack('<BxHIIHHH2x', port, 0, mode, baudrate, in_proto,
+                          out_proto, 0)
+    return frame(CFG_PRT, payload)
+
+def cfg_rate(period_ms, nav_rate=1, time_ref=1):
+    """CFG-RATE frame setting the measurement period (ms), measurements
+    per navigation solution and time reference (1: GPS time)."""
+    return frame(CFG_RATE, struct.pack('<HHH', period_ms, nav_rate,
+                                       time_ref))
+
+def cfg_msg(msg, rate=1):
+    """CFG-MSG frame sending msg every rate navigation solutions on the
+    current port (0 disables it)."""
+    return frame(CFG_MSG, struct.pack('<BBB', *msg, rate))
+
+
+# ****************************************************************************
+
+def nav_dop(payload):
+    """(iTOW, hdop, vdop) from a NAV-DOP payload."""
+    itow, g_dop, p_dop, t_dop, v_dop, h_dop, n_dop, e_dop = (
+        _NAV_DOP.unpack_from(payload))
+    return itow, h_dop*0.01, v_dop*0.01
+
+def nav_pvt_fix(payload, dop=None):
+    """Fix from a NAV-PVT payload (any bytes-like object). dop is the
+    (hdop, vdop) of the epoch, from NAV-DOP, if known."""
+    (itow, year, month, day, hour, minute, second, valid, t_acc, nano,
+     fix_type, flags, flags2, num_sv, lon, lat, height, h_msl, h_acc, v_acc,
+     vel_n, vel_e, vel_d, g_speed, head_mot, s_acc, head_acc, p_dop,
+     head_veh, mag_dec, mag_acc) = _NAV_PVT.unpack_from(payload)
+
+    # nano is the signed fraction of the second, -1e9 to 1e9
+    utc = (datetime.datetime(2000, 1, 1, hour, minute, min(second, 59))
+           + datetime.timedelta(microseconds=nano//1000)).time()
+    ok = bool(flags & GNSS_FIX_OK) and fix_type in (2, 3, 4)
+    hdop, vdop = dop or (None, None)
+    return Fix(utc     = utc,
+               lat     = lat*1e-7 if ok else None,
+               lon     = lon*1e-7 if ok else None,
+               alt     = h_msl*1e-3 if ok and fix_type != 2 else None,
+               hdop    = hdop,
+               sats    = num_sv,
+               quality = 1 if ok else 0,
+               speed   = g_speed*1e-3,
+               course  = head_mot*1e-5,
+               pdop    = p_dop*0.01,
+               vdop    = vdop)
+
+
+class UbxStats:
+    """Counts of frames seen by a UbxParser."""
+    def __init__(self):
+        self.frames = 0
+        self.fixes = 0
+        self.bad_checksum = 0
+        self.malformed = 0
+        self.discarded_bytes = 0
+
+    def summary(self):
+        return dict(vars(self))
+
+
+class UbxParser:
+    """Incremental parser turning a UBX byte stream into Fix objects.
+
+    Acknowledgements of configuration messages are kept in acks, as
+    (class, id) : True for ACK-ACK or False for ACK-NAK. The latest NAV-DOP
+    gives the hdop and vdop of the next fixes, up to MAX_DOP_AGE later.
+    """
+    def __init__(self):
+        """Initialisation."""
+        self._buffer = bytearray()
+        self.acks = {}
+        # (iTOW, hdop, vdop) of the latest NAV-DOP
+        self._dop = None
+        self.stats = UbxStats()
+        self._logger = logging.getLogger(__name__)
+
+    def feed(self, data):
+        """Parse bytes as they arrive. Returns list of Fixes completed."""
+        self._buffer += data
+        fixes = []
+        offset = 0
+        with memoryview(self._buffer) as view:
+            while True:
+                start = self._buffer.find(SYNC, offset)
+                if start == -1:
+                    # keep a trailing first sync byte
+                    end = len(self._buffer) - (self._buffer[-1:] == SYNC[:1])
+                    self.stats.discarded_bytes += end - offset
+                    offset = end
+                    break
+                self.stats.discarded_bytes += start - offset
+                offset = start
+                if len(view) < start + 6:
+                    break
+                cls, msg_id, length = _HEADER.unpack_from(view, start + 2)
+                if length > MAX_PAYLOAD:
+                    self.stats.malformed += 1
+                    offset = start + 1
+                    continue
+                end = start + 8 + length
+                if len(view) < end:
+                    break
+                if bytes(fletcher(view[start + 2:end - 2])) != view[end - 2:end]:
+                    self.stats.bad_checksum += 1
+                    offset = start + 1
+                    continue
+                self.stats.frames += 1
+                fix = self._message((cls, msg_id), view[start + 6:end - 2])
+                if fix is not None:
+                    fixes.append(fix)
+                offset = end
+        del self._buffer[:offset]
+        return fixes
+
+    def _message(self, msg, payload):
+        if msg == NAV_PVT:
+            if len(payload) != NAV_PVT_LENGTH:
+                self.stats.malformed += 1
+                return None
+            self.stats.fixes += 1
+            return nav_pvt_fix(payload, self._epoch_dop(payload))
+        if msg == NAV_DOP:
+            if len(payload) != NAV_DOP_LENGTH:
+                self.stats.malformed += 1
+                return None
+            self._dop = nav_dop(payload)
+            return None
+        if msg in (ACK_ACK, ACK_NAK) and len(payload) == 2:
+            self.acks[(payload[0], payload[1])] = msg == ACK_ACK
+        return None
+
+    def _epoch_dop(self, payload):
+        """(hdop, vdop) of the latest NAV-DOP if recent enough for the
+        NAV-PVT payload's epoch, otherwise None."""
+        if self._dop is None:
+            return None
+        itow, hdop, vdop = self._dop
+        pvt_itow, = struct.unpack_from('<I', payload)
+        if not 0 <= pvt_itow - itow <= MAX_DOP_AGE:
+            return None
+        return hdop, vdop
@@ -1,43 +1,48 @@
-# Importing standard libraries
-import time
-from datetime import datetime as dt
 # Importing custom libraries
-from gps.parse_gga import gps_altitude
+from gps.nmea import EMPTY_FIX
+from clock import SYSTEM_CLOCK
+from radio.packet_codec import encode_packet
+from radio.packet_stats import PacketStats
+from sensor_history import mean_since
 import logging
 #########################################################
 
 
-def handle_gps_sensor(label, sensor_dict):
-    """Extracts altitude data from gga string stored as 
+def handle_gps_sensor(label, sensor_dict, since=None):
+    """Extracts altitude data from the latest Fix stored as 
     data attribute in GpsReceiver object. 
     Example returns:
     >>> ('alt', 121.4)
     """
-    return gps_altitude(sensor_dict[label].data)
+    fix = sensor_dict[label].data or EMPTY_FIX
+    return ('alt', fix.alt)
 
-def handle_temp(label, sensor_dict):
-    """Extracts data attribute of temperature sensor and sensor label in tuple.
+def handle_temp(label, sensor_dict, since=None):
+    """Extracts mean temperature since time since (default the latest
+    reading) and sensor label in tuple.
     Example returns:
     >>> ('temp_int', 13.7)
     """
-    return (label, sensor_dict[label].data)
+    return (label, mean_since(sensor_dict[label], since))
 
-def handle_press(label, sensor_dict):
-    """Extracts pressure reading of pressure sensor and sensor label in tuple.
+def handle_press(label, sensor_dict, since=None):
+    """Extracts mean pressure since time since (default the latest
+    reading) of pressure sensor and sensor label in tuple.
     Example returns:
     >>> ('p_ext', 13.7)
     """
-    t, p = sensor_dict[label].data
+    t, p = mean_since(sensor_dict[label], since)
     return (label, p)
 
-def handle_humidity(label, sensor_dict):
-    """Extracts humidity reading from sensor and returns with label in tuple.
+def handle_humidity(label, sensor_dict, since=None):
+    """Extracts mean humidity since time since (default the latest
+    reading) from sensor and returns with label in tuple.
     Example returns:
         >>> ('hum', 5480)"""
-    return (label, sensor_dict[label].data)
+    return (label, mean_since(sensor_dict[label], since))
 
 
-def handle(sensor, sensor_dict):
+def handle(sensor, sensor_dict, since=None):
     """Handles a sensor with specified process, returning in tuple."""
     handle_process = {
         # Sensor  : process
@@ -47,14 +52,16 @@ def handle(sensor, sensor_dict):
         'hum'     : handle_humidity,
         'ozone'   : handle_humidity
          }
-    return handle_process[sensor](sensor, sensor_dict)
+    return handle_process[sensor](sensor, sensor_dict, since)
     
 
 
 
-def gather_data(sensors_dict):
+def gather_values(sensors_dict, since=None):
     """Gathers data from all required sensors and 
-    returns as , separated string with appropriate formatting"""
+    returns as dictionary with label : value pairs. Values are the mean
+    of the readings since monotonic time since, where the sensors keep a
+    history (see sensor_history.mean_since), otherwise the latest"""
     
     #List of labels of all required sensors
     data_sensors = ('gps',
@@ -64,13 +71,16 @@ def gather_data(sensors_dict):
 		    'ozone'
                     )
     #Handle all data sensors, returning list of (label, value) tuples
-    data_contents = [handle(sensor, sensors_dict) for sensor in sensors_dict
-                     if sensor in data_sensors]
+    data_contents = [handle(sensor, sensors_dict, since)
+                     for sensor in sensors_dict if sensor in data_sensors]
     #Defining as dictionary with label : value pairs
-    data_dict = dict(data_contents)
-    #Defining as comma-separated string with appropriate formatting
-    data_string = format_data(data_dict)
-    return data_string
+    return dict(data_contents)
+
+
+def gather_data(sensors_dict):
+    """Gathers data from all required sensors and 
+    returns as , separated string with appropriate formatting"""
+    return format_data(gather_values(sensors_dict))
 
 
 def format_data(data_dict):
@@ -90,27 +100,36 @@ def format_data(data_dict):
     #Returns as comma-separated string
     return ','.join([str(i) for i in data_list])
 
-def gather_full_packet(sensors_dict, index):
-    """Gathers data from sensors every 5 seconds, creates a data pakcet
-    every 20s with current time and index as a header."""
-    data = []
-    #Gathers data every 5s and creates packet every 20s
-    for i in range(4):
-        data.append(gather_data(sensors_dict))
-        time.sleep(5)
+def create_data_packet(data, index, fmt='text', when=None):
+    """Creates a data pakcet from a list of samples (dictionaries from
+    gather_values) with time when (default now) and index as a header.
+    
+    fmt 'text' gives the ASCII packet, 'binary' the compact encoding of
+    radio/packet_codec.py"""
+    when = SYSTEM_CLOCK.now() if when is None else when
+    if fmt == 'binary':
+        return encode_packet(data, index, when)
+    data = [format_data(values) for values in data]
     
     #Header consisting of timestamp and package index
-    header = f'{dt.now():%H%M%S},{index:05d}'
+    header = f'{when:%H%M%S},{index:05d}'
     data.insert(0, header)
     #Returns as ';' delineated bytestring
     return ';'.join(data).encode()
 
 
 class HandleData:
-    """Class to collect relevant data from sensors and send via radio
-    at frequency of 20s in separate thread."""
-    def __init__(self, sensor_dict, radio):
-        """Initialisation"""
+    """Class to collect relevant data from sensors and send via radio.
+    Scheduled at samples per 20s, taking one sample per update and
+    sending a packet every samples updates."""
+    def __init__(self, sensor_dict, radio, fmt='text', samples=4,
+                 clock=None, window=False):
+        """Initialisation. fmt is 'text' or 'binary' packets, each
+        holding samples samples. clock (default the system clock) times
+        the packets and their latency. Samples are the latest readings,
+        or with window the mean of the readings since the last sample"""
+        if fmt not in ('text', 'binary'):
+            raise ValueError(f'Unknown packet format {fmt}')
         
         #Input dictionary with label : sensor object pairs
         self._sensor_dict = sensor_dict
@@ -118,6 +137,23 @@ class HandleData:
         #Placeholder for data
         self._data = None
         
+        #Packet format and samples per packet
+        self._fmt = fmt
+        self._samples = samples
+        
+        #Samples of the packet being gathered
+        self._pending = []
+        
+        #Window mode, and monotonic time of the last sample
+        self._window = window
+        self._since = None
+        
+        #Clock for timestamps and latency
+        self._clock = clock or SYSTEM_CLOCK
+        
+        #Read-to-transmit latency of packets sent
+        self._stats = PacketStats()
+        
         # Start package index at 1
         self._packet_index = 1
         
@@ -145,25 +181,51 @@ class HandleData:
         pass
     
     def read(self):
-        """Gathers data from relevant sensors and returns as bytestring"""
-        self._logger.info('Read all data sensors')
-        return gather_full_packet(self._sensor_dict,
-                                  self._packet_index)
+        """Gathers one sample from relevant sensors, returned as
+        dictionary with label : value pairs"""
+        if not self._window:
+            return gather_values(self._sensor_dict)
+        now = self._clock.monotonic()
+        values = gather_values(self._sensor_dict, self._since)
+        self._since = now
+        return values
         
     def update(self):
-        """Reads sensor data as bytestring and updates to data attribute. 
-        Sends pakcet via radio with a frequency of 20s."""
+        """Reads one sample. Once samples samples have been read, creates
+        the data packet and sends it via radio."""
+        read_time = self._clock.monotonic()
+        self._pending.append(self.read())
+        if len(self._pending) < self._samples:
+            return
         
-        #Read relevant sensor data as bytestring
-        self._data = self.read()
-        print(self._data)
+        #Create packet of all samples gathered
+        self._data = create_data_packet(self._pending,
+                                        self._packet_index,
+                                        self._fmt,
+                                        self._clock.now())
+        self._pending = []
+        self._logger.debug(f'Data packet {self._packet_index}: '
+                           f'{self._data!r}')
         
         #Send data pakcet via radio
-        self._logger.info('Sent data packets via radio')
         self._radio.send_data_packet(self._data)
+        latency = self._clock.monotonic() - read_time
+        self._stats.record(latency)
+        self._logger.info(f'Sent data packet {self._packet_index} via '
+                          f'radio, read-to-transmit {1e3*latency:.1f} ms')
         
         #Update package index by 1
         self._packet_index += 1
-
-
-        
+    
+    @property
+    def stats(self):
+        """Read-to-transmit latency of packets sent"""
+        return self._stats
+
+    def report(self):
+        """Log the read-to-transmit latency of packets sent"""
+        stats = self._stats.summary()
+        self._logger.info(
+            f"data: {stats['packets']} packets, read-to-transmit latency "
+            f"mean {stats['mean_latency_ms']:.1f} ms "
+            f"max {stats['max_latency_ms']:.1f} ms")
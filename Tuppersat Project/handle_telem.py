@@ -1,41 +1,49 @@
 # Importing standard libraries
-import time
-from datetime import datetime as dt
+import logging
 # Importing custom libraries
-from gps.parse_gga import gga_parser
+from gps.nmea import EMPTY_FIX
+from clock import SYSTEM_CLOCK
+from radio.packet_stats import PacketStats
+from sensor_history import mean_since
 
 #########################################################
 
 
-def handle_gps_sensor(label, sensor_dict):
-    """Extracts relevant data from gga string stored as 
+def handle_gps_sensor(label, sensor_dict, since=None):
+    """Extracts relevant data from the latest Fix stored as 
     data attribute in GpsReceiver. 
     Example returns:
-    >>> [('alt', 121.4),
-         ('lat_dec_deg', 53.3096),
+    >>> [('lat_dec_deg', 53.3096),
          ('lon_dec_deg', -6.2186),
+         ('alt', 121.4),
          ('lat_dil' : 1.53)
          ]
     """
-    return gga_parser(sensor_dict[label].data)
+    fix = sensor_dict[label].data or EMPTY_FIX
+    return [('lat_dec_deg', fix.lat),
+            ('lon_dec_deg', fix.lon),
+            ('alt', fix.alt),
+            ('lat_dil', fix.hdop)]
 
-def handle_temp(label, sensor_dict):
-    """Extracts data attribute of temperature sensor and sensor label in tuple.
+def handle_temp(label, sensor_dict, since=None):
+    """Extracts mean temperature since time since (default the latest
+    reading) and sensor label in tuple.
     Example returns:
     >>> [('temp_int', 13.7)]
     """
-    return [(label, sensor_dict[label].data)]
+    return [(label, mean_since(sensor_dict[label], since))]
 
-def handle_press(label, sensor_dict):
-    """Extracts pressure reading of pressure sensor and sensor label in tuple.
+def handle_press(label, sensor_dict, since=None):
+    """Extracts mean pressure since time since (default the latest
+    reading) of pressure sensor and sensor label in tuple.
     Example returns:
     >>> [('pressure', 13.7)]
     """
-    t, p = sensor_dict[label].data
+    t, p = mean_since(sensor_dict[label], since)
     return [(label, p)]
     
 
-def handle(sensor, sensor_dict):
+def handle(sensor, sensor_dict, since=None):
     """Handles a sensor with specified process."""
     handle_process = {
         # Sensor  : process
@@ -44,25 +52,27 @@ def handle(sensor, sensor_dict):
         'temp2'   : handle_temp,
         'pressure': handle_press
          }
-    return handle_process[sensor](sensor, sensor_dict)
+    return handle_process[sensor](sensor, sensor_dict, since)
     
 
-def create_telem_packet(list_of_lists):
+def create_telem_packet(list_of_lists, clock=SYSTEM_CLOCK):
     """Concatenates all tuple pairs into single list and
-    converts to dictionary object.
+    converts to dictionary object, timestamped by clock.
     """
     #Combines all (field, value) tuples into  list
     list_of_tuples = sum(list_of_lists, [])
     #Converts list of tuples to dictionary with field : value pairs
     telem_packet = dict(list_of_tuples)
-    telem_packet['hhmmss'] = dt.now()
+    telem_packet['hhmmss'] = clock.now()
     #Dictionary is in correct format to send using SatRadio
     return telem_packet
 
 
-def gather_telem_data(sensors_dict):
+def gather_telem_data(sensors_dict, clock=SYSTEM_CLOCK, since=None):
     """Gathers data from all required sensors and 
-    returns as telemtry data dictionary object."""
+    returns as telemtry data dictionary object. Values are the mean of
+    the readings since monotonic time since, where the sensors keep a
+    history (see sensor_history.mean_since), otherwise the latest"""
     #List of sensors required for telemetry data:
     telem_sensors = ('gps',
                      'temp1',
@@ -70,19 +80,21 @@ def gather_telem_data(sensors_dict):
                      'pressure')
             
     #List of all required (field, value) tuples from telemetry sensors
-    telem_data = [handle(sensor, sensors_dict) for sensor in sensors_dict
-                  if sensor in telem_sensors]
+    telem_data = [handle(sensor, sensors_dict, since)
+                  for sensor in sensors_dict if sensor in telem_sensors]
     
     #Create telemetry packet as dictionary
-    telem_packet = create_telem_packet(telem_data)
+    telem_packet = create_telem_packet(telem_data, clock)
     return telem_packet
 
 
 class HandleTelemetry:
     """Class to collect relevant telemetry data from sensors and 
-    send via radio at frequency of 20s in separate thread."""
-    def __init__(self, sensor_dict, radio):
-        """Initialisation"""
+    send via radio, scheduled every 20s."""
+    def __init__(self, sensor_dict, radio, clock=None, window=False):
+        """Initialisation. clock (default the system clock) times the
+        packets and their latency. Packets carry the latest readings, or
+        with window the mean of the readings since the last packet"""
         
         #Input dictionary with label : sensor object pairs
         self._sensor_dict = sensor_dict
@@ -90,11 +102,20 @@ class HandleTelemetry:
         #Placeholder data attribute
         self._data = None
         
+        #Window mode, and monotonic time of the last read
+        self._window = window
+        self._since = None
+        
         #Define radio object (SatRadio)
         self._radio = radio
         
-        #Time between packets
-        self._pause = 20
+        #Clock for timestamps and latency
+        self._clock = clock or SYSTEM_CLOCK
+        
+        #Read-to-transmit latency of packets sent
+        self._stats = PacketStats()
+        
+        self._logger = logging.getLogger(__name__)
         
     def setup(self):
         """No setup process required"""
@@ -106,24 +127,36 @@ class HandleTelemetry:
     
     def read(self):
         """Gathers data from relevant sensors and returns as dictionary"""
-        return gather_telem_data(self._sensor_dict)
+        if not self._window:
+            return gather_telem_data(self._sensor_dict, self._clock)
+        now = self._clock.monotonic()
+        data = gather_telem_data(self._sensor_dict, self._clock, self._since)
+        self._since = now
+        return data
         
     def update(self):
-        """Gathers and creates telemetry packet every 20s and 
-        sends using radio"""
+        """Gathers and creates telemetry packet and sends it straight
+        away using radio"""
+        read_time = self._clock.monotonic()
         self._data = self.read()
         print(self._data)
         
-        #Wait for 20s
-        time.sleep(self._pause)
-        
         #Send using radio object (SatRadio)
         self._radio.send_telemetry(**self._data)
-        
-        
-
-
-        
-
-        
+        latency = self._clock.monotonic() - read_time
+        self._stats.record(latency)
+        self._logger.info(f'Sent telemetry via radio, read-to-transmit '
+                          f'{1e3*latency:.1f} ms')
     
+    @property
+    def stats(self):
+        """Read-to-transmit latency of packets sent"""
+        return self._stats
+
+    def report(self):
+        """Log the read-to-transmit latency of packets sent"""
+        stats = self._stats.summary()
+        self._logger.info(
+            f"telemetry: {stats['packets']} packets, read-to-transmit "
+            f"latency mean {stats['mean_latency_ms']:.1f} ms "
+            f"max {stats['max_latency_ms']:.1f} ms")
@@ -1,18 +1,32 @@
-from .humidity_utils import read_MS8607
-import smbus
+from .humidity_utils import read_adc, compute_humidity
+from bus_manager import get_bus
+from sensor_history import SensorHistory
+from pubsub import null_publisher
+from clock import SYSTEM_CLOCK
+from backoff import Backoff
 import logging
-import time
 
 
 class MS8607Sensor:
     """ A class representing an MS5611 pressure / temperature sensor . """
-    def __init__ (self, addr):
+    def __init__ (self, addr, clock=None):
         """ Initialisation . """
         self._addr = addr
-        # the I2C bus
-        self._bus = smbus.SMBus(1)
+        # the shared I2C bus
+        self._bus = get_bus(1, clock)
         # placeholder for data
         self._data = None
+        # history of readings, timestamped by the clock
+        self._history = SensorHistory(clock=clock)
+        # publisher of each new reading
+        self._publish = null_publisher
+        # latest raw (D3) ADC count, and its publisher for raw logging
+        self._raw = None
+        self._publish_raw = null_publisher
+        # clock for timestamps and waits
+        self._clock = clock or SYSTEM_CLOCK
+        # backoff between retries after errors
+        self._backoff = Backoff(clock=self._clock)
         # defining logger
         self._logger = logging.getLogger(__name__)
         
@@ -20,19 +34,23 @@ class MS8607Sensor:
         """ Read and update the stored data value . """
         try:
             self._data = self.read()
+            self._history.push(self._data)
+            self._publish(self._data)
+            self._publish_raw(self._raw)
+            self._backoff.reset()
         except OSError as exc:
             self._logger.exception(type(exc).__name__)
             self._data = None
-            time.sleep(20)
+            self._publish(self._data)
+            self._raw = None
+            self._publish_raw(self._raw)
+            self._backoff.wait()
             pass
         
     def read(self):
-        """ Read the pressure and temperature values from the sensor . """
-        rh = read_MS8607(
-            self._bus,
-            self._addr)
-        
-        return rh
+        """ Read the relative humidity value from the sensor . """
+        self._raw = read_adc(self._bus, self._addr, self._clock)
+        return compute_humidity(self._raw)
     
     def setup(self):
         """ Calibrate the MS8607 sensor. """
@@ -42,7 +60,28 @@ class MS8607Sensor:
         """ The MS8607 sensor needs no cleaning up. """
         pass
 
+    def attach(self, publish):
+        """ Publish each new reading with publish(reading) . """
+        self._publish = publish
+
+    def attach_raw(self, publish):
+        """ Publish the raw (D3) ADC count of each reading with
+        publish(count) . """
+        self._publish_raw = publish
+
+    def stop(self):
+        """ End any backoff wait in progress, e.g. on shutdown . """
+        self._backoff.stop()
+
     @property
     def data(self):
         return self._data
 
+    @property
+    def history(self):
+        return self._history
+
+    @property
+    def raw(self):
+        return self._raw
+
@@ -1,4 +1,4 @@
-import time
+from clock import SYSTEM_CLOCK
 
 def unpack(buffer ):
     """ Unpacks MSB -ordered buffer of bytes into an unsigned integer.
@@ -16,16 +16,17 @@ def unpack(buffer ):
     return sum(_byte << (_i * 8) for _i, _byte in enumerate(_buffer ))
 
 
-def read_adc(bus, addr):
+def read_adc(bus, addr, clock=None):
     """Inputs: Bus object, address of sensor, and cmd string
     specifying temperature or pressure to be read.
     
-    Reads pressure or temperature ADC values depending on cmd input.
+    Reads pressure or temperature ADC values depending on cmd input,
+    pausing for the response on clock (default the system clock).
     
     Returns integer value for temp or press"""
     # send temperature ADC command and pause for response cmd == 'p':        
     bus.write_byte(addr , 0xF5)
-    time.sleep(0.05)
+    (clock or SYSTEM_CLOCK).sleep(0.05)
     # read the ADC values
     adc_bytes = bus.read_byte(addr)
     # unpack value as integer
@@ -41,10 +42,10 @@ def compute_humidity(h_adc):
     rel_hum = -600 + 12500 * D3 / (2**16)
     return rel_hum
 
-def read_MS8607(bus, addr):
+def read_MS8607(bus, addr, clock=None):
     """Reads temperature and pressure from sensor and converts
     to integer values"""
-    h_adc = read_adc(bus, addr)
+    h_adc = read_adc(bus, addr, clock)
     rel_hum = compute_humidity(h_adc)
     return rel_hum
 
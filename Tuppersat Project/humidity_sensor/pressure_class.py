@@ -1,59 +1,154 @@
-from .pressure_utils import read_ms5611, read_calibration_constants
-import smbus
-import time
+from .pressure_utils import read_raw, read_calibration_constants
+from .pressure_utils import compute_pressure, format_temp_pres
+from pressure_sensors.conversion import ConversionStateMachine
+from bus_manager import get_bus
+from sensor_history import SensorHistory
+from pubsub import null_publisher
+from clock import SYSTEM_CLOCK
+from backoff import Backoff
 import logging
 
 
 class MS5611ExtSensor:
     """ A class representing an MS5611 pressure / temperature sensor . """
-    def __init__ (self, addr):
+    def __init__ (self, addr, osr=4096, clock=None):
         """ Initialisation . """
         self._addr = addr
-        # the I2C bus
-        self._bus = smbus.SMBus(1)
+        # oversampling ratio (256 - 4096)
+        self._osr = osr
+        # the shared I2C bus
+        self._bus = get_bus(1, clock)
         # placeholder for calibration constants
         self._calibration_constants = None
         # placeholder for data
         self._data = (None, None)
+        # history of readings, timestamped by the clock
+        self._history = SensorHistory(2, clock=clock)
+        # publisher of each new reading
+        self._publish = null_publisher
+        # latest raw (D1, D2) ADC counts, and publishers of the raw counts
+        # and of the calibration constants, for raw logging
+        self._raw = (None, None)
+        self._publish_raw = null_publisher
+        self._publish_calibration = null_publisher
+        # clock for timestamps and waits
+        self._clock = clock or SYSTEM_CLOCK
+        # backoff between retries after errors
+        self._backoff = Backoff(clock=self._clock)
         # defining logger
         self._logger = logging.getLogger(__name__)
         
     def update(self):
         """ Read and update the stored data value . """
+        if self._calibration_constants is None:
+            # calibration failed in setup: retry it in place of a reading
+            self.setup()
+            return
         try:
             self._data = self.read()
+            self._history.push(self._data)
+            self._publish(self._data)
+            self._publish_raw(self._raw)
+            self._backoff.reset()
         except OSError as exc:
             self._logger.exception(type(exc).__name__)
             self._data = (None, None)
-            time.sleep(20)
+            self._publish(self._data)
+            self._raw = (None, None)
+            self._publish_raw(self._raw)
+            self._backoff.wait()
             pass
         
     def read(self):
         """ Read the pressure and temperature values from the sensor . """
-        p, t = read_ms5611(
-        self._bus,
-        self._addr,
-        self._calibration_constants)
-        return (p ,t)
+        self._raw = read_raw(self._bus, self._addr, self._osr, self._clock)
+        d1, d2 = self._raw
+        t, p = compute_pressure(d2, d1, self._calibration_constants)
+        return format_temp_pres(t, p)
     
-    def setup(self):
-        """ Calibrate the MS5611 sensor . """
+    def conversion(self):
+        """ Non-blocking conversion state machine for this sensor . """
+        return ConversionStateMachine(self._bus, self._addr, self._osr,
+                                      self._clock)
+    
+    def convert(self, d1, d2):
+        """ Update the stored data value from raw pressure (D1) and
+        temperature (D2) ADC values . """
+        if self._calibration_constants is None and not self.calibrate():
+            # calibration failed in setup and again now: no reading
+            self.clear()
+            return
+        t, p = compute_pressure(d2, d1, self._calibration_constants)
+        self._data = format_temp_pres(t, p)
+        self._history.push(self._data)
+        self._publish(self._data)
+        self._raw = (d1, d2)
+        self._publish_raw(self._raw)
+    
+    def clear(self):
+        """ Mark the stored data value as unavailable . """
+        self._data = (None, None)
+        self._publish(self._data)
+        self._raw = (None, None)
+        self._publish_raw(self._raw)
+    
+    def calibrate(self):
+        """ Read the calibration constants once, without waiting after a
+        failure . Returns True if they were read . """
         try:
             self._calibration_constants = read_calibration_constants(
             self._bus,
             self._addr
             )
+            self._publish_calibration(self.calibration)
+            return True
         except OSError as exc:
             self._logger.warning(type(exc).__name__)
             self._data = (None, None)
-            time.sleep(20)
-            pass
+            return False
+    
+    def setup(self):
+        """ Calibrate the MS5611 sensor, backing off after a failure . """
+        if self.calibrate():
+            self._backoff.reset()
+        else:
+            self._backoff.wait()
     
     def teardown (self):
         """ The MS5611 sensor needs no cleaning up. """
         pass
 
+    def attach(self, publish):
+        """ Publish each new reading with publish(reading) . """
+        self._publish = publish
+
+    def attach_raw(self, publish, publish_calibration):
+        """ Publish the raw (D1, D2) ADC counts of each reading with
+        publish(counts), and the calibration constants whenever they are
+        read with publish_calibration(constants) . """
+        self._publish_raw = publish
+        self._publish_calibration = publish_calibration
+
+    def stop(self):
+        """ End any backoff wait in progress, e.g. on shutdown . """
+        self._backoff.stop()
+
     @property
     def data(self):
         return self._data
 
+    @property
+    def history(self):
+        return self._history
+
+    @property
+    def raw(self):
+        return self._raw
+
+    @property
+    def calibration(self):
+        """ Calibration constants (C1, ..., C6), None until read . """
+        if self._calibration_constants is None:
+            return None
+        return tuple(self._calibration_constants[1:])
+
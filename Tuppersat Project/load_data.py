@@ -0,0 +1,285 @@
+"""
+load_data.py
+
+Post-flight loader of the data stored by StoreData into one pandas
+DataFrame per flight, with a column per field on a common time index.
+
+Text group files are parsed a whole file at a time with pandas string
+methods, in the current layout of one value per field as well as the
+original one of str() tuples and raw GGA sentences. Their second-resolution
+HHMMSS stamps are unwrapped across midnight. Binary flight logs (.tsfl) are
+read with flight_log.
+
+The groups are joined on their times rounded to the second. StoreData
+writes every sensor's reading each time it runs, so a sensor slower than
+the store, or failing, repeats its last reading. The records hold one
+time per group, not per reading, so such repeats cannot be told from a
+quantised sensor reading the same value again (e.g. humidity in whole
+%RH); they are kept unless asked otherwise (--drop-repeats), which blanks
+every reading equal to the one before, to the last bit.
+
+The result is cached beside the data as an .npz file of one array per
+column, so loading the flight again takes milliseconds.
+
+    python load_data.py flight_data/101500_gps.txt --csv flight.csv
+"""
+# standard library imports
+import argparse
+import datetime
+import logging
+import os
+import re
+
+# third party imports
+import numpy as np
+import pandas as pd
+
+# local imports
+from flight_log import RAW_SCHEMA, MEAN_SCHEMA, read_flight_log
+from store_data import (GROUPS, RAW_GROUPS, MEAN_GROUPS, FILE_SUFFIXES,
+                        text_filename)
+
+
+DAY = 86400
+
+# Every group StoreData may write
+SCHEMA = dict(RAW_SCHEMA, **MEAN_SCHEMA)
+LABELS = {**GROUPS, **RAW_GROUPS, **MEAN_GROUPS}
+
+# A field of a text line, None for a missing value
+_VALUE = r'\s*(?P<{}>[^,()\s]*)\s*'
+_NONE = r'\s*None\s*'
+
+# The fields of a GGA sentence stored by the original GPS receiver class
+_GGA = (r'\s*\$..GGA,[^,]*,(?P<gga_lat>[^,]*),(?P<gga_ns>[NS]?),'
+        r'(?P<gga_lon>[^,]*),(?P<gga_ew>[EW]?),[^,]*,[^,]*,'
+        r'(?P<gga_hdop>[^,]*),(?P<gga_alt>[^,]*),.*')
+
+_logger = logging.getLogger(__name__)
+
+
+# ****************************************************************************
+
+def sensor_fields(group):
+    """Field names of each sensor of a group, in the order StoreData writes
+    them. The fields of a Fix and the calibration constants count as one
+    sensor each."""
+    names = [name for name, _ in SCHEMA[group]]
+    if group in ('gps', 'calibration'):
+        return [names]
+    labels = LABELS[group]
+    fields = []
+    for label in labels:
+        label = label.removesuffix('_raw')
+        fields.append([name for name in names
+                       if name == label or name.startswith(f'{label}_')])
+    return fields
+
+
+def line_pattern(group):
+    """Regular expression of a text line of a group, with a named match
+    per field. A (t, p) or (D1, D2) reading may be flattened or its str(),
+    and None in place of the whole reading; the GPS fix may be a raw GGA
+    sentence (fields gga_*)."""
+    parts = []
+    for fields in sensor_fields(group):
+        values = ','.join(_VALUE.format(field) for field in fields)
+        if len(fields) == 1 or group in ('gps', 'calibration'):
+            parts.append(values)
+        else:
+            parts.append(rf'(?:\(?{values}\)?|{_NONE})')
+    body = ','.join(parts)
+    if group == 'gps':
+        body = rf'(?:{body}|{_GGA}|{_NONE})'
+    return re.compile(rf'^(?P<hhmmss>\d{{6}}),{body}$')
+
+
+def _nmea_degrees(value, hemisphere, negative):
+    """Signed degrees from NMEA (d)ddmm.mmmm values and hemispheres"""
+    value = pd.to_numeric(value, errors='coerce')
+    degrees = value//100 + value%100/60
+    return degrees.where(hemisphere != negative, -degrees)
+
+
+def unwrap_seconds(hhmmss):
+    """Seconds after midnight of the first day of HHMMSS stamps in the
+    order written, counting a step back of over half a day as midnight"""
+    hhmmss = np.asarray(hhmmss, dtype=np.int64)
+    seconds = hhmmss//10000*3600 + hhmmss//100%100*60 + hhmmss%100
+    steps = np.diff(seconds, prepend=seconds[:1])
+    return seconds + DAY*np.cumsum(steps < -DAY//2)
+
+
+def read_text(filename, group, date=None):
+    """DataFrame of a group's text file, indexed by time. date is that of
+    the first line, by default taken from the file's modification time,
+    i.e. of the last line, less the midnights passed."""
+    with open(filename) as file:
+        lines = pd.Series(file.read().splitlines(), dtype=object)
+    lines = lines[lines.str.strip() != '']
+    matches = lines.str.extract(line_pattern(group)).dropna(
+        subset=['hhmmss'])
+    if len(matches) < len(lines):
+        _logger.warning(f'{filename}: skipped {len(lines) - len(matches)} '
+                        f'unreadable lines')
+
+    names = [name for name, _ in SCHEMA[group]]
+    frame = matches[names].apply(pd.to_numeric, errors='coerce')
+    if group == 'gps':
+        nmea = {'lat' : _nmea_degrees(matches['gga_lat'],
+                                      matches['gga_ns'], 'S'),
+                'lon' : _nmea_degrees(matches['gga_lon'],
+                                      matches['gga_ew'], 'W'),
+                'alt' : pd.to_numeric(matches['gga_alt'], errors='coerce'),
+                'hdop': pd.to_numeric(matches['gga_hdop'], errors='coerce')}
+        for name, values in nmea.items():
+            frame[name] = frame[name].fillna(values)
+
+    seconds = unwrap_seconds(matches['hhmmss'])
+    if date is None:
+        modified = datetime.date.fromtimestamp(os.path.getmtime(filename))
+        days = seconds[-1]//DAY if len(seconds) else 0
+        date = modified - datetime.timedelta(days=int(days))
+    frame.index = pd.Timestamp(date) + pd.to_timedelta(seconds, unit='s')
+    return frame
+
+
+def read_log(filename):
+    """Dictionary of group : DataFrame of a binary flight log, indexed by
+    UTC time"""
+    frames = {}
+    for group, columns in read_flight_log(filename).items():
+        names = [name for name, _ in SCHEMA[group]]
+        index = pd.to_datetime(columns['time'], unit='s')
+        frames[group] = pd.DataFrame({name: columns[name] for name in names},
+                                     index=index)
+    return frames
+
+
+# ****************************************************************************
+
+def drop_repeats(frame, group):
+    """Blank each sensor's readings equal to the reading before, repeated
+    by the store or not"""
+    for fields in sensor_fields(group):
+        values = frame[fields]
+        stale = (values == values.shift()).all(axis=1)
+        frame.loc[stale.to_numpy(), fields] = np.nan
+    return frame
+
+
+def align(frames):
+    """Join the DataFrames of all groups on their times rounded to the
+    second, keeping the last reading of each second"""
+    joined = [frame.groupby(frame.index.round('s')).last()
+              for frame in frames.values()]
+    aligned = pd.concat(joined, axis=1).sort_index()
+    aligned.index.name = 'time'
+    return aligned
+
+
+def flight_files(path):
+    """Files of a flight given its .tsfl file, one of its text files or
+    their common prefix (e.g. flight_data/101500), with its cache file"""
+    if path.endswith('.tsfl'):
+        return {'log': path}, f'{path[:-len(".tsfl")]}.npz'
+    prefix = path
+    if path.endswith('.txt'):
+        prefix = path[:-len('.txt')].rsplit('_', 1)[0]
+    files = {group: text_filename(prefix, group) for group in FILE_SUFFIXES}
+    files = {group: name for group, name in files.items()
+             if os.path.exists(name)}
+    if not files:
+        raise FileNotFoundError(f'No flight data files {prefix}_*.txt')
+    return files, f'{prefix}_data.npz'
+
+
+def load_flight(path, date=None, dedupe=False, cache=True):
+    """Aligned DataFrame of a flight given its .tsfl file, one of its text
+    files or their prefix. date is that of the first text line (see
+    read_text). Times are UTC for a flight log, and the local time written
+    on board for text files. dedupe blanks repeated readings (see
+    drop_repeats).
+
+    The result is saved to and, while its sources and these options are
+    unchanged, loaded from a cache file beside them unless cache is
+    False."""
+    files, cache_file = flight_files(path)
+    sources = sorted(files.values())
+    mtimes = [os.stat(name).st_mtime_ns for name in sources]
+    key = f'{date or ""},{dedupe:d}'
+    if cache:
+        cached = _load_cache(cache_file, sources, mtimes, key)
+        if cached is not None:
+            return cached
+
+    if 'log' in files:
+        frames = read_log(files['log'])
+    else:
+        frames = {group: read_text(name, group, date)
+                  for group, name in files.items()}
+    if dedupe:
+        frames = {group: drop_repeats(frame, group)
+                  for group, frame in frames.items()}
+    aligned = align(frames)
+
+    if cache:
+        _save_cache(cache_file, aligned, sources, mtimes, key)
+    return aligned
+
+
+def _save_cache(filename, frame, sources, mtimes, key):
+    columns = {name: frame[name].to_numpy() for name in frame.columns}
+    try:
+        np.savez(filename, _time=frame.index.to_numpy(),
+                 _sources=np.array([os.path.basename(name)
+                                    for name in sources]),
+                 _mtimes=np.array(mtimes, dtype=np.int64),
+                 _key=np.array(key), **columns)
+    except OSError as exc:
+        _logger.warning(f'Could not cache {filename}: {exc}')
+
+
+def _load_cache(filename, sources, mtimes, key):
+    """Cached DataFrame, or None if there is none of these sources"""
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as data:
+        if (list(data['_sources']) != [os.path.basename(name)
+                                       for name in sources]
+                or list(data['_mtimes']) != mtimes
+                or str(data['_key']) != key):
+            return None
+        columns = {name: data[name] for name in data.files
+                   if not name.startswith('_')}
+        index = pd.DatetimeIndex(data['_time'], name='time')
+    return pd.DataFrame(columns, index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[3])
+    parser.add_argument('path', help='flight log (.tsfl), one of the text '
+                                     'files of a flight, or their prefix')
+    parser.add_argument('--date', help='date of the first text line, '
+                                       'YYYY-MM-DD (default from the files)')
+    parser.add_argument('--drop-repeats', action='store_true',
+                        help='blank readings equal to the one before, '
+                             'which drops real repeats too')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='neither read nor write the cache file')
+    parser.add_argument('--csv', help='also write the aligned data to this '
+                                      'CSV file')
+    args = parser.parse_args()
+
+    date = datetime.date.fromisoformat(args.date) if args.date else None
+    flight = load_flight(args.path, date, dedupe=args.drop_repeats,
+                         cache=not args.no_cache)
+    if args.csv:
+        flight.to_csv(args.csv)
+    print(f'{len(flight)} s with data from {flight.index[0]} to '
+          f'{flight.index[-1]}')
+    print(flight.count().to_string())
+
+
+if __name__ == '__main__':
+    main()
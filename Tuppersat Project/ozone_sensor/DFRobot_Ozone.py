@@ -10,6 +10,8 @@
   @url https://github.com/DFRobot/DFRobot_Ozone
 '''
 import smbus
+
+from filters import MovingAverage
                 
 OZONE_ADDRESS_0           = 0x70
 OZONE_ADDRESS_1           = 0x71
@@ -40,14 +42,16 @@ PASS_DATA_LOW_REGISTER    = 0x08
 class DFRobot_Ozone(object):
   ## mode flag
   __m_flag   = 0
-  ## acquisition count
-  __count    = 0
   ## iic send buffer
   __txbuf      = [0]
-  ## ozone data
-  __ozonedata  = [0]*101
   def __init__(self ,bus):
-    self.i2cbus = smbus.SMBus(bus)
+    # bus may be a bus number or an already open bus object
+    if isinstance(bus, int):
+      self.i2cbus = smbus.SMBus(bus)
+    else:
+      self.i2cbus = bus
+    # moving average of the last collectnum readings, O(1) per reading
+    self.__average = None
 
   def set_mode(self ,mode):
     '''!
@@ -67,34 +71,32 @@ class DFRobot_Ozone(object):
         __m_flag = 2
         return
 
+  def read_ozone(self):
+    '''!
+      @brief read one ozone reading, without averaging
+      @return ozone concentration, (units PPB)
+    '''
+    if self.__m_flag == 0:
+      self.__txbuf[0] = AUTO_READ_DATA
+      self.write_reg(SET_PASSIVE_REGISTER ,self.__txbuf)
+      return self.get_ozone(AUTO_DATA_HIGE_REGISTER)
+    elif self.__m_flag == 1:
+      self.__txbuf[0] = PASSIVE_READ_DATA
+      self.write_reg(SET_PASSIVE_REGISTER ,self.__txbuf)
+      return self.get_ozone(PASS_DATA_HIGE_REGISTER)
+
   def get_ozone_data(self ,collectnum):
     '''!
       @brief get the ozone data
-      @param collectnum Collect the number
-      @return ozone concentration, (units PPB)
+      @param collectnum Collect the number (1-100)
+      @return mean ozone concentration of the last collectnum readings,
+              (units PPB)
     '''
-    if collectnum > 0:
-      for num in range(collectnum ,1 ,-1):
-        self.__ozonedata[num-1] = self.__ozonedata[num-2]
-      if self.__m_flag == 0:
-        self.__txbuf[0] = AUTO_READ_DATA
-        self.write_reg(SET_PASSIVE_REGISTER ,self.__txbuf)
-        self.__ozonedata[0] = self.get_ozone(AUTO_DATA_HIGE_REGISTER)
-      elif self.__m_flag == 1:
-        self.__txbuf[0] = PASSIVE_READ_DATA
-        self.write_reg(SET_PASSIVE_REGISTER ,self.__txbuf)
-        self.__ozonedata[0] = self.get_ozone(PASS_DATA_HIGE_REGISTER)
-      if self.__count < collectnum:
-        self.__count += 1
-      return self.get_average_num(self.__ozonedata ,self.__count)
-    elif (collectnum > 100) or (collectnum <= 0):
+    if (collectnum > 100) or (collectnum <= 0):
       return -1
-  
-  def get_average_num(self ,barry ,Len):
-    temp = 0
-    for num in range (0 ,Len):
-      temp += barry[num]
-    return (temp / Len)
+    if self.__average is None or self.__average.window != collectnum:
+      self.__average = MovingAverage(collectnum)
+    return self.__average.push(self.read_ozone())
 
   def get_ozone(self,reg):
       rslt = self.read_reg(reg ,2)
@@ -1,24 +1,39 @@
 from .DFRobot_Ozone import (DFRobot_Ozone_IIC,
                            MEASURE_MODE_AUTOMATIC,
                            OZONE_ADDRESS_3)
-import time
+from bus_manager import get_bus
+from sensor_history import SensorHistory
+from pubsub import null_publisher
+from clock import SYSTEM_CLOCK
+from backoff import Backoff
+from filters import make_filter
 import logging
 
 
 class OzoneSensor:
-    """ A class representing an MS5611 pressure / temperature sensor . """
-    def __init__ (self, mode, addr, coll_num):
+    """ A class representing a DFRobot SEN0321 ozone sensor, smoothing
+    its readings with a moving mean, median or exponential average . """
+    def __init__ (self, mode, addr, window, filter='mean', clock=None):
         """ Initialisation . """
         #Sensor I2C address:
         self._addr = addr
-        #Sensor I2C mode
+        #Sensor I2C mode (bus number)
         self._mode = mode
-        #Collect number (range 1-100)
-        self._coll_num = coll_num
+        #Readings per filter window, and filter ('mean', 'median', 'ema')
+        self._window = window
+        self._filter = make_filter(filter, window)
         #Sensor measure mode (set to automatic)
         self._measure_mode = MEASURE_MODE_AUTOMATIC
         # placeholder for data
         self._data = None
+        # history of readings, timestamped by the clock
+        self._history = SensorHistory(clock=clock)
+        # publisher of each new reading
+        self._publish = null_publisher
+        # clock for timestamps and waits
+        self._clock = clock or SYSTEM_CLOCK
+        # backoff between retries after errors
+        self._backoff = Backoff(clock=self._clock)
         # defining logger
         self._logger = logging.getLogger(__name__)
         
@@ -26,28 +41,45 @@ class OzoneSensor:
         """ Read and update the stored data value . """
         try:
             self._data = self.read()
+            self._history.push(self._data)
+            self._publish(self._data)
+            self._backoff.reset()
         except OSError as exc:
             self._logger.exception(type(exc).__name__)
             self._data = None
-            time.sleep(5)
+            self._publish(self._data)
+            self._backoff.wait()
             pass
         
     def read(self):
-        """ Read the ozone concentration (ppb) value from the sensor . """
-        time.sleep(1)
-        return self._ozone_sensor.get_ozone_data(self._coll_num)
+        """ Read the ozone concentration (ppb) from the sensor, returning
+        the filtered value . """
+        return self._filter.push(self._ozone_sensor.read_ozone())
     
     def setup(self):
         """ Define ozone sensor object. """
-        self._ozone_sensor = DFRobot_Ozone_IIC(self._mode,
+        self._ozone_sensor = DFRobot_Ozone_IIC(get_bus(self._mode, self._clock),
                                                self._addr)
         #Set sensor measurement mode
         self._ozone_sensor.set_mode(self._measure_mode)
+        self._filter.reset()
     
     def teardown (self):
         """ The ozone sensor needs no cleaning up. """
         pass
 
+    def attach(self, publish):
+        """ Publish each new reading with publish(reading) . """
+        self._publish = publish
+
+    def stop(self):
+        """ End any backoff wait in progress, e.g. on shutdown . """
+        self._backoff.stop()
+
     @property
     def data(self):
         return self._data
+
+    @property
+    def history(self):
+        return self._history
@@ -0,0 +1,150 @@
+#Importing standard modules
+import logging
+
+#Importing custom modules
+from clock import SYSTEM_CLOCK
+from backoff import Backoff
+from .pressure_utils import start_conversion, read_conversion
+from .pressure_utils import CONVERSION_TIME
+##################################################################
+
+
+#Conversion states
+IDLE = 'idle'
+CONVERTING_D2 = 'converting_d2'
+CONVERTING_D1 = 'converting_d1'
+
+
+class ConversionStateMachine:
+    """Non-blocking D2 (temperature) then D1 (pressure) conversion
+    sequence of a single MS5611 sensor, repeated continuously."""
+    def __init__(self, bus, addr, osr=4096, clock=None):
+        """Initialisation. clock (default the system clock) times the
+        conversions"""
+        self._bus = bus
+        self._addr = addr
+        self._wait = CONVERSION_TIME[osr]
+        self._osr = osr
+        self._clock = clock or SYSTEM_CLOCK
+
+        self.state = IDLE
+        #Time at which the current conversion is complete
+        self.ready_at = 0.0
+        self._d2 = None
+
+    def reset(self):
+        """Abandon any conversion in progress"""
+        self.state = IDLE
+        self.ready_at = 0.0
+
+    def advance(self, now):
+        """Performs the next bus operation if it is due.
+        Returns (D1, D2) when a reading completes, otherwise None"""
+        if now < self.ready_at:
+            return None
+
+        if self.state == IDLE:
+            start_conversion(self._bus, self._addr, 't', self._osr)
+            self.state = CONVERTING_D2
+
+        elif self.state == CONVERTING_D2:
+            self._d2 = read_conversion(self._bus, self._addr)
+            start_conversion(self._bus, self._addr, 'p', self._osr)
+            self.state = CONVERTING_D1
+
+        elif self.state == CONVERTING_D1:
+            d1 = read_conversion(self._bus, self._addr)
+            #Start the next reading straight away, so it converts
+            #between updates
+            start_conversion(self._bus, self._addr, 't', self._osr)
+            self.state = CONVERTING_D2
+            self.ready_at = self._clock.monotonic() + self._wait
+            return d1, self._d2
+
+        self.ready_at = self._clock.monotonic() + self._wait
+        return None
+
+
+class PressurePipeline:
+    """Runs the conversions of several MS5611 sensors interleaved, so one
+    sensor converts while another is read. Each update completes one
+    reading of every sensor, but for a sensor that failed, which is
+    skipped until its backoff has passed rather than waited for."""
+    def __init__(self, sensors, clock=None):
+        """Input: list of sensors with conversion, convert, calibrate,
+        calibration, clear and teardown members, e.g. MS5611Sensor, and
+        the clock (default the system clock) to wait on, that of their
+        conversions"""
+        self._sensors = sensors
+        self._machines = [sensor.conversion() for sensor in sensors]
+        self._clock = clock or SYSTEM_CLOCK
+        #Backoff of each sensor's machine, and monotonic time from which
+        #it is retried
+        self._backoffs = {machine: Backoff(clock=self._clock)
+                          for machine in self._machines}
+        self._retry_at = dict.fromkeys(self._machines, 0.0)
+        self._logger = logging.getLogger(__name__)
+
+    def setup(self):
+        """Calibrate all sensors, retrying those that fail in updates"""
+        for machine, sensor in zip(self._machines, self._sensors):
+            if not sensor.calibrate():
+                self._failed(machine, sensor)
+
+    def teardown(self):
+        """Tear down all sensors"""
+        for sensor in self._sensors:
+            sensor.teardown()
+
+    def stop(self):
+        """End any backoff wait of the sensors"""
+        for sensor in self._sensors:
+            sensor.stop()
+
+    def _failed(self, machine, sensor):
+        """Abandon a sensor's reading and skip it until its backoff has
+        passed"""
+        machine.reset()
+        sensor.clear()
+        delay = self._backoffs[machine].delay()
+        self._retry_at[machine] = self._clock.monotonic() + delay
+        self._logger.info(f'Retrying {type(sensor).__name__} in '
+                          f'{delay:.1f} s')
+
+    def _due(self):
+        """Machine : sensor of those not backing off, calibrating any not
+        yet calibrated"""
+        now = self._clock.monotonic()
+        due = {}
+        for machine, sensor in zip(self._machines, self._sensors):
+            if now < self._retry_at[machine]:
+                continue
+            if sensor.calibration is None and not sensor.calibrate():
+                self._failed(machine, sensor)
+                continue
+            due[machine] = sensor
+        return due
+
+    def update(self):
+        """Advances every due sensor's conversions until each has
+        produced a reading, sleeping only until the next conversion is
+        ready."""
+        pending = self._due()
+        while pending:
+            for machine, sensor in list(pending.items()):
+                try:
+                    result = machine.advance(self._clock.monotonic())
+                except OSError as exc:
+                    self._logger.warning(type(exc).__name__)
+                    self._failed(machine, sensor)
+                    del pending[machine]
+                    continue
+                if result is not None:
+                    sensor.convert(*result)
+                    self._backoffs[machine].reset()
+                    del pending[machine]
+            if pending:
+                wait = (min(m.ready_at for m in pending)
+                        - self._clock.monotonic())
+                if wait > 0:
+                    self._clock.sleep(wait)
@@ -1,4 +1,4 @@
-import time
+from clock import SYSTEM_CLOCK
 
 def unpack(buffer ):
     """ Unpacks MSB -ordered buffer of bytes into an unsigned integer.
@@ -17,39 +17,51 @@ def unpack(buffer ):
 
 def read_calibration_constants(bus, addr):
     """Reads and unpacks calibration constants from pressure sensor
-    from the listed addresses
+    from the listed addresses. bus must be a bus_manager.SharedBus
     
     Returns constants as a list of integers."""
     #List of addresses for cal constants
     POSITIONS = [0xA2, 0xA4, 0xA6, 0xA8, 0xAA, 0xAC]
+    #All constants read in a single bus transaction
+    c_bytes = bus.read_registers(addr, [(pos, 2) for pos in POSITIONS])
     #Including None so no 0 index value:
-    cal_constants = [None]
-    for pos in POSITIONS:
-        c1bytes = bus.read_i2c_block_data(addr, pos, 2)
-        const = unpack(c1bytes)
-        cal_constants.append(const)
-    return cal_constants
+    return [None] + [unpack(c1bytes) for c1bytes in c_bytes]
 
-def read_adc(bus, addr, cmd):
+#Offset added to the convert commands for each oversampling ratio, and
+#maximum conversion time (s) from the MS5611 datasheet
+OSR_OFFSET = {256: 0x00, 512: 0x02, 1024: 0x04, 2048: 0x06, 4096: 0x08}
+CONVERSION_TIME = {256: 0.60e-3, 512: 1.17e-3, 1024: 2.28e-3,
+                   2048: 4.54e-3, 4096: 9.04e-3}
+
+#Convert D1 (pressure) and D2 (temperature) commands at OSR 256
+CONVERT_D1 = 0x40
+CONVERT_D2 = 0x50
+
+def start_conversion(bus, addr, cmd, osr=4096):
+    """Sends the pressure ('p') or temperature ('t') convert command
+    at the given oversampling ratio."""
+    adc = {'p': CONVERT_D1, 't': CONVERT_D2}[cmd] + OSR_OFFSET[osr]
+    bus.write_byte(addr , adc)
+
+def read_conversion(bus, addr):
+    """Reads the result of a completed conversion as an integer"""
+    # read the ADC values
+    adc_bytes = bus.read_i2c_block_data(addr , 0x00 , 3)
+    # unpack value as integer
+    return unpack(adc_bytes)
+
+def read_adc(bus, addr, cmd, osr=4096, clock=None):
     """Inputs: Bus object, address of sensor, and cmd string
     specifying temperature or pressure to be read.
     
-    Reads pressure or temperature ADC values depending on cmd input.
+    Reads pressure or temperature ADC values depending on cmd input,
+    waiting the conversion time of the oversampling ratio on clock
+    (default the system clock).
     
     Returns integer value for temp or press"""
-    # send temperature ADC command and pause for response
-    if cmd == 't':
-        adc = 0x58
-    elif cmd == 'p':
-        adc = 0x48
-        
-    bus.write_byte(addr , adc)
-    time.sleep(0.05)
-    # read the ADC values
-    adc_bytes = bus.read_i2c_block_data(addr , 0x00 , 3)
-    # unpack value as integer
-    adc_int = unpack(adc_bytes)
-    return adc_int
+    start_conversion(bus, addr, cmd, osr)
+    (clock or SYSTEM_CLOCK).sleep(CONVERSION_TIME[osr])
+    return read_conversion(bus, addr)
 
 def compute_pressure(t_adc, p_adc, cal_list):
     """Converts ADC value to temp or press as centicelsius or hectobar 
@@ -65,11 +77,17 @@ def compute_pressure(t_adc, p_adc, cal_list):
     
     return temperature, pressure
 
-def read_pressure(bus, addr, cal_list):
+def read_raw(bus, addr, osr=4096, clock=None):
+    """Reads the raw pressure (D1) and temperature (D2) ADC values,
+    returned as (D1, D2)"""
+    t_adc = read_adc(bus, addr, 't', osr, clock)
+    p_adc = read_adc(bus, addr, 'p', osr, clock)
+    return p_adc, t_adc
+
+def read_pressure(bus, addr, cal_list, osr=4096, clock=None):
     """Reads temperature and pressure from sensor and converts
     to integer values"""
-    t_adc = read_adc(bus, addr, 't')
-    p_adc = read_adc(bus, addr, 'p')
+    p_adc, t_adc = read_raw(bus, addr, osr, clock)
     temperature, pressure = compute_pressure(t_adc, p_adc, cal_list)
     return temperature, pressure
 
@@ -79,9 +97,10 @@ def format_temp_pres(temp, pres):
     pres_mbar = pres/100
     return temp_degC, pres_mbar
 
-def read_ms5611(bus, address, cal_constants):
+def read_ms5611(bus, address, cal_constants, osr=4096, clock=None):
     """Reads temperature and pressure from
     sensor and returns as celsius and mbar."""
-    temperature, pressure = read_pressure(bus, address, cal_constants)
+    temperature, pressure = read_pressure(bus, address, cal_constants, osr,
+                                          clock)
     t_degC, p_mbar = format_temp_pres(temperature, pressure)
     return t_degC, p_mbar
@@ -0,0 +1,256 @@
+"""
+pubsub.py
+
+In-process publish/subscribe fan-out of sensor readings.
+
+Sensors publish each new reading once as an immutable Reading. Every
+subscriber receives each reading on its topics exactly once: a
+Subscription into its own bounded queue, unless the queue overflows, in
+which case the drop policy decides which reading is lost and the loss is
+counted, and a LatestView into the history of its topic as it is
+published.
+"""
+# standard library imports
+import functools
+import logging
+import numbers
+import threading
+from collections import deque, namedtuple
+
+# local imports
+from clock import SYSTEM_CLOCK
+from sensor_history import SensorHistory, HISTORY_SIZE
+
+
+Reading = namedtuple('Reading', ['topic', 'time', 'value'])
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+def null_publisher(value):
+    """Placeholder publisher for sensors not attached to a broker."""
+    pass
+
+
+# ****************************************************************************
+
+class Subscription:
+    """A bounded queue of readings for one subscriber."""
+    def __init__(self, topics=None, maxsize=256, policy=DROP_OLDEST):
+        """Initialisation.
+
+        topics is a collection of topic names, or None for all topics.
+        """
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f'Unknown drop policy {policy}')
+        self.topics = None if topics is None else frozenset(topics)
+        self._maxsize = maxsize
+        self._policy = policy
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+        # backpressure metrics
+        self.delivered = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def wants(self, topic):
+        return self.topics is None or topic in self.topics
+
+    def put(self, reading):
+        """Queue a reading, applying the drop policy when full."""
+        with self._cond:
+            if len(self._queue) >= self._maxsize:
+                self.dropped += 1
+                if self._policy == DROP_NEWEST:
+                    return
+                self._queue.popleft()
+            self._queue.append(reading)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Next reading, waiting up to timeout seconds. None if none."""
+        with self._cond:
+            if not self._queue:
+                self._cond.wait(timeout)
+            if not self._queue:
+                return None
+            self.delivered += 1
+            return self._queue.popleft()
+
+    def drain(self):
+        """All queued readings, oldest first, without waiting."""
+        with self._cond:
+            readings = list(self._queue)
+            self._queue.clear()
+            self.delivered += len(readings)
+        return readings
+
+    def metrics(self):
+        return {'depth'    : len(self._queue),
+                'max_depth': self.max_depth,
+                'delivered': self.delivered,
+                'dropped'  : self.dropped}
+
+
+class Broker:
+    """Fans readings out to all subscriptions on their topic."""
+    def __init__(self, clock=None):
+        """Initialisation. Readings are timestamped by clock (default the
+        system clock)."""
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        self._clock = clock or SYSTEM_CLOCK
+        self.published = 0
+        self._logger = logging.getLogger(__name__)
+
+    def subscribe(self, topics=None, maxsize=256, policy=DROP_OLDEST):
+        return self.add(Subscription(topics, maxsize, policy))
+
+    def add(self, subscriber):
+        """Deliver readings to subscriber, any object with topics,
+        wants(topic), put(reading) and metrics() as a Subscription."""
+        with self._lock:
+            self._subscriptions.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.remove(subscription)
+
+    def publish(self, topic, value, t=None):
+        t = self._clock.time() if t is None else t
+        reading = Reading(topic, t, value)
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+            self.published += 1
+        for subscription in subscriptions:
+            if subscription.wants(topic):
+                subscription.put(reading)
+
+    def publisher(self, topic):
+        """Callable publishing a value on topic, for a sensor's attach."""
+        return functools.partial(self.publish, topic)
+
+    def metrics(self):
+        """List of backpressure metrics for every subscription."""
+        with self._lock:
+            return [dict(s.metrics(), topics=sorted(s.topics or []))
+                    for s in self._subscriptions]
+
+    def report(self):
+        """Log the backpressure metrics of every subscription."""
+        self._logger.info(f'{self.published} readings published')
+        for i, metrics in enumerate(self.metrics()):
+            self._logger.info(
+                f"subscription {i}: {metrics['delivered']} delivered, "
+                f"{metrics['dropped']} dropped, depth {metrics['depth']} "
+                f"(max {metrics['max_depth']})")
+
+
+# ****************************************************************************
+
+def _width(value):
+    """Number of values of a numeric reading, a number or a tuple of
+    numbers, otherwise None."""
+    def numeric(x):
+        return isinstance(x, numbers.Real) and not isinstance(x, bool)
+    if numeric(value):
+        return 1
+    if isinstance(value, tuple) and value and all(map(numeric, value)):
+        return len(value)
+    return None
+
+
+class _LatestReading:
+    """Stand-in for a sensor exposing its latest data and, once it has
+    published a numeric reading, the history of its readings."""
+    def __init__(self, value):
+        self.data = value
+        self.history = None
+
+
+class LatestView:
+    """Read-only label : sensor-like mapping fed by a broker.
+
+    Processes written against a dictionary of sensors read sensor.data;
+    this gives them the latest published reading of each topic instead.
+    Every numeric reading is also recorded, as it is published, in its
+    topic's history (sensor_history.py), timestamped by the clock's
+    monotonic time, so a process can use all readings since its last
+    update. A topic's readings that are overwritten in its history before
+    the topic is next read are counted as dropped.
+    """
+    def __init__(self, broker, defaults, capacity=HISTORY_SIZE, clock=None):
+        """Initialisation. Subscribes to the topics of defaults, which
+        gives each topic's value before its first reading, e.g. the
+        sensors' initial data."""
+        self.topics = frozenset(defaults)
+        self._capacity = capacity
+        self._clock = clock or SYSTEM_CLOCK
+        self._latest = {topic: _LatestReading(value)
+                        for topic, value in defaults.items()}
+        # readings recorded in each topic's history since it was last read
+        self._unread = dict.fromkeys(defaults, 0)
+        self._lock = threading.Lock()
+
+        # backpressure metrics
+        self.delivered = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+        broker.add(self)
+
+    def wants(self, topic):
+        return topic in self.topics
+
+    def put(self, reading):
+        """Record a reading; called by the broker on publication."""
+        t = self._clock.monotonic()
+        with self._lock:
+            latest = self._latest[reading.topic]
+            latest.data = reading.value
+            self.delivered += 1
+            width = _width(reading.value)
+            if width is None:
+                return
+            if latest.history is None:
+                latest.history = SensorHistory(width, self._capacity)
+            latest.history.push(reading.value, t)
+            if self._unread[reading.topic] == self._capacity:
+                self.dropped += 1
+            else:
+                self._unread[reading.topic] += 1
+            self.max_depth = max(self.max_depth, self._depth())
+
+    def _depth(self):
+        return sum(self._unread.values())
+
+    def metrics(self):
+        with self._lock:
+            return {'depth'    : self._depth(),
+                    'max_depth': self.max_depth,
+                    'delivered': self.delivered,
+                    'dropped'  : self.dropped}
+
+    def __getitem__(self, topic):
+        with self._lock:
+            self._unread[topic] = 0
+        return self._latest[topic]
+
+    def __iter__(self):
+        return iter(list(self._latest))
+
+    def __contains__(self, topic):
+        return topic in self._latest
+
+    def __len__(self):
+        return len(self._latest)
+
+    def items(self):
+        return [(topic, self[topic]) for topic in self]
+
+    def values(self):
+        return [self[topic] for topic in self]
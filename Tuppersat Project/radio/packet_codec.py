@@ -0,0 +1,155 @@
+"""
+packet_codec.py
+
+Binary encoding of HandleData radio packets, and the ground-side decoder.
+
+Each field is sent as a scaled integer at the precision of the ASCII
+format. The first sample of a field is packed absolute and the rest as
+differences from the previous present sample, in the narrowest of
+int8/int16/int32 that fits them all:
+
+    header : version u8 | packet index u16 | seconds of day u32 |
+             samples u8
+    masks  : one u8 per sample, bit i set if field i is present
+    fields : for each field with any samples present:
+             first value i32 | delta width u8 | deltas
+
+The version byte identifies FIELDS; change it whenever they change.
+
+The radio ends each frame with a newline, so the packet is then byte
+stuffed (COBS, with the newline in place of the zero byte) to hold no
+newline, at a cost of one byte per 254.
+"""
+import datetime
+import struct
+
+
+VERSION = 2
+
+# Byte ending the radio's frames, kept out of packets
+DELIMITER = 0x0A
+
+# field : scale, in the order of the mask bits
+FIELDS = {'alt'  : 100,      # m, 0.01
+          'temp2': 1000,     # degC, 0.001
+          'p_ext': 10000,    # mbar, 0.0001
+          'hum'  : 1,        # %RH
+          'ozone': 1}        # ppb
+
+_HEADER = struct.Struct('<BHIB')
+_FIRST = struct.Struct('<iB')
+
+# delta width code : struct format, (min, max)
+WIDTHS = {1: ('b', (-2**7, 2**7 - 1)),
+          2: ('h', (-2**15, 2**15 - 1)),
+          4: ('i', (-2**31, 2**31 - 1))}
+
+
+class PacketError(Exception):
+    pass
+
+
+def _width(deltas):
+    """Smallest delta width code holding all deltas"""
+    low, high = min(deltas, default=0), max(deltas, default=0)
+    for code, (fmt, (lowest, highest)) in WIDTHS.items():
+        if lowest <= low and high <= highest:
+            return code
+    raise PacketError(f'Delta out of range: {low}, {high}')
+
+
+def stuff(data, delimiter=DELIMITER):
+    """Consistent overhead byte stuffing of data, leaving no delimiter"""
+    data = bytes(byte ^ delimiter for byte in data)
+    out, code_at, code = bytearray(1), 0, 1
+    for byte in data:
+        if byte:
+            out.append(byte)
+            code += 1
+        if not byte or code == 0xFF:
+            out[code_at] = code
+            code_at, code = len(out), 1
+            out.append(0)
+    out[code_at] = code
+    return bytes(byte ^ delimiter for byte in out)
+
+
+def unstuff(data, delimiter=DELIMITER):
+    """Inverse of stuff"""
+    data = bytes(byte ^ delimiter for byte in data)
+    out, i = bytearray(), 0
+    while i < len(data):
+        code = data[i]
+        if not code or i + code > len(data):
+            raise PacketError(f'Bad stuffing code {code} at byte {i}')
+        out += data[i + 1:i + code]
+        i += code
+        if code < 0xFF and i < len(data):
+            out.append(0)
+    return bytes(byte ^ delimiter for byte in out)
+
+
+def encode_packet(samples, index, when=None):
+    """Encode a list of {field : value or None} samples, the packet index
+    and the time (datetime, default now) as stuffed bytes."""
+    when = datetime.datetime.now() if when is None else when
+    seconds = when.hour*3600 + when.minute*60 + when.second
+    parts = [_HEADER.pack(VERSION, index % 2**16, seconds, len(samples))]
+
+    masks = bytearray(len(samples))
+    for i, sample in enumerate(samples):
+        for bit, field in enumerate(FIELDS):
+            if sample.get(field) is not None:
+                masks[i] |= 1 << bit
+    parts.append(bytes(masks))
+
+    for field, scale in FIELDS.items():
+        values = [round(sample[field]*scale) for sample in samples
+                  if sample.get(field) is not None]
+        if not values:
+            continue
+        deltas = [b - a for a, b in zip(values, values[1:])]
+        code = _width(deltas)
+        parts.append(_FIRST.pack(values[0], code))
+        parts.append(struct.pack(f'<{len(deltas)}{WIDTHS[code][0]}',
+                                 *deltas))
+    return stuff(b''.join(parts))
+
+
+def decode_packet(packet):
+    """Decode an encoded packet, returning a dictionary with version,
+    index, time (datetime.time) and samples (list of {field : value or
+    None})."""
+    packet = unstuff(packet)
+    try:
+        version, index, seconds, count = _HEADER.unpack_from(packet)
+        if version != VERSION:
+            raise PacketError(f'Unknown packet version {version}')
+        offset = _HEADER.size
+        masks = packet[offset:offset + count]
+        offset += count
+        samples = [dict.fromkeys(FIELDS) for _ in range(count)]
+
+        for bit, (field, scale) in enumerate(FIELDS.items()):
+            present = [i for i, mask in enumerate(masks) if mask >> bit & 1]
+            if not present:
+                continue
+            value, code = _FIRST.unpack_from(packet, offset)
+            offset += _FIRST.size
+            fmt = f'<{len(present) - 1}{WIDTHS[code][0]}'
+            deltas = struct.unpack_from(fmt, packet, offset)
+            offset += struct.calcsize(fmt)
+            samples[present[0]][field] = value/scale
+            for i, delta in zip(present[1:], deltas):
+                value += delta
+                samples[i][field] = value/scale
+    except (struct.error, KeyError) as exc:
+        raise PacketError(f'Malformed packet: {exc}') from exc
+    if offset != len(packet):
+        raise PacketError(f'{len(packet) - offset} trailing bytes')
+
+    hours, rest = divmod(seconds, 3600)
+    return {'version': version,
+            'index'  : index,
+            'time'   : datetime.time(hours % 24, *divmod(rest, 60)),
+            'samples': samples}
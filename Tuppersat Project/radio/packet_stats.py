@@ -0,0 +1,29 @@
+"""
+packet_stats.py
+
+Read-to-transmit latency of the packets a process sends: the time from
+starting the sensor read that completes a packet to handing the packet to
+the radio.
+"""
+
+
+class PacketStats:
+    """Counts and read-to-transmit latency (s) of packets sent."""
+    def __init__(self):
+        self.packets = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def record(self, latency):
+        self.packets += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    def summary(self):
+        packets = max(self.packets, 1)
+        return {'packets'        : self.packets,
+                'last_latency_ms': 1e3*self.last_latency,
+                'mean_latency_ms': 1e3*self.total_latency/packets,
+                'max_latency_ms' : 1e3*self.max_latency}
@@ -0,0 +1,179 @@
+"""
+reprocess.py
+
+Post-flight conversion of the raw ADC counts logged in raw mode
+(toast_sat.STORE_RAW) to temperature, pressure and humidity.
+
+The whole flight is converted in one call with NumPy, in the datasheets'
+integer arithmetic including second-order temperature compensation, which
+the flight software leaves out. Each reading is converted with the
+calibration constants last logged before it, or with constants given in
+their place, so corrected calibrations can be applied after the flight.
+
+    python reprocess.py 101500_flight.tsfl --out reprocessed.csv
+"""
+# standard library imports
+import argparse
+
+# third party imports
+import numpy as np
+
+# local imports
+from flight_log import read_flight_log
+
+
+# ****************************************************************************
+
+def _shift(x, n):
+    """x/2**n rounded towards zero, as integer division in the datasheets'
+    C reference code."""
+    return np.sign(x)*(np.abs(x) >> n)
+
+
+def _ms5611_second_order(temp, dT):
+    """(T2, OFF2, SENS2) of the MS5611, zero at 20 degC and above."""
+    low = temp < 2000
+    very_low = temp < -1500
+    t2 = np.where(low, _shift(dT*dT, 31), 0)
+    off2 = np.where(low, _shift(5*(temp - 2000)**2, 1), 0)
+    sens2 = np.where(low, _shift(5*(temp - 2000)**2, 2), 0)
+    off2 += np.where(very_low, 7*(temp + 1500)**2, 0)
+    sens2 += np.where(very_low, _shift(11*(temp + 1500)**2, 1), 0)
+    return t2, off2, sens2
+
+
+def _ms8607_second_order(temp, dT):
+    """(T2, OFF2, SENS2) of the MS8607 pressure sensor."""
+    low = temp < 2000
+    very_low = temp < -1500
+    t2 = np.where(low, _shift(3*dT*dT, 33), _shift(5*dT*dT, 38))
+    off2 = np.where(low, _shift(61*(temp - 2000)**2, 4), 0)
+    sens2 = np.where(low, _shift(29*(temp - 2000)**2, 4), 0)
+    off2 += np.where(very_low, 17*(temp + 1500)**2, 0)
+    sens2 += np.where(very_low, 9*(temp + 1500)**2, 0)
+    return t2, off2, sens2
+
+
+# Shifts of C2, C4*dT, C1 and C3*dT in OFF and SENS, and the second-order
+# compensation, of each sensor type
+SENSOR_TYPES = {'ms5611': ((16, 7, 15, 8), _ms5611_second_order),
+                'ms8607': ((17, 6, 16, 7), _ms8607_second_order)}
+
+# Resolution (ns) of record times in the flight log, within which a
+# calibration logged with a reading counts as logged before it
+TIME_RESOLUTION_NS = 1000
+
+# Sensor type of each logged pressure sensor
+PRESSURE_SENSORS = {'pressure': 'ms5611',
+                    'p_ext'   : 'ms8607'}
+
+
+def compensate(d1, d2, constants, sensor_type='ms5611', second_order=True):
+    """Temperature (degC) and pressure (mbar) arrays from arrays of D1 and
+    D2 counts. constants is (C1, ..., C6), each a number or an array of
+    one value per reading; all must be valid (not NaN)."""
+    (off_shift, off_dt_shift, sens_shift, sens_dt_shift), second = (
+        SENSOR_TYPES[sensor_type])
+    d1 = np.asarray(d1, dtype=np.int64)
+    d2 = np.asarray(d2, dtype=np.int64)
+    c1, c2, c3, c4, c5, c6 = (np.asarray(c, dtype=np.int64)
+                              for c in constants)
+
+    dT = d2 - (c5 << 8)
+    temp = 2000 + _shift(dT*c6, 23)
+    off = (c2 << off_shift) + _shift(c4*dT, off_dt_shift)
+    sens = (c1 << sens_shift) + _shift(c3*dT, sens_dt_shift)
+    if second_order:
+        t2, off2, sens2 = second(temp, dT)
+        temp = temp - t2
+        off = off - off2
+        sens = sens - sens2
+    pressure = _shift(_shift(d1*sens, 21) - off, 15)
+    return temp/100, pressure/100
+
+
+def humidity(d3):
+    """Relative humidity array from an array of D3 counts, as
+    humidity_utils.compute_humidity."""
+    return -600 + 12500*np.asarray(d3, dtype=np.float64)/2**16
+
+
+# ****************************************************************************
+
+def calibration_at(times, calibration, label):
+    """(C1, ..., C6) arrays of the constants of sensor label last logged at
+    or before each time (within the record time resolution), NaN before
+    the first."""
+    index = np.searchsorted(calibration['t'], times + TIME_RESOLUTION_NS,
+                            side='right') - 1
+    constants = []
+    for i in range(1, 7):
+        logged = calibration[f'{label}_c{i}'].astype(np.float64)
+        constants.append(np.where(index >= 0, logged[index.clip(0)],
+                                  np.nan))
+    return constants
+
+
+def reprocess(log, calibrations=None, second_order=True):
+    """Convert the raw group of a read_flight_log result. calibrations is
+    an optional dictionary of sensor label : (C1, ..., C6) used in place of
+    the logged constants.
+
+    Returns a dictionary of field : array, with the readings' wall clock
+    times under 'time', (temperature, pressure) under label_t and label_p
+    of each pressure sensor, and humidity under 'hum'. Readings missing or
+    without calibration are NaN."""
+    calibrations = calibrations or {}
+    raw = log['raw']
+    result = {'time': raw['time']}
+    for label, sensor_type in PRESSURE_SENSORS.items():
+        d1 = raw[f'{label}_d1'].astype(np.float64)
+        d2 = raw[f'{label}_d2'].astype(np.float64)
+        if label in calibrations:
+            constants = [np.full(len(d1), c, dtype=np.float64)
+                         for c in calibrations[label]]
+        else:
+            constants = calibration_at(raw['t'], log['calibration'], label)
+        valid = np.isfinite(d1) & np.isfinite(d2)
+        for c in constants:
+            valid &= np.isfinite(c)
+        temp = np.full(len(d1), np.nan)
+        pressure = np.full(len(d1), np.nan)
+        temp[valid], pressure[valid] = compensate(
+            d1[valid], d2[valid], [c[valid] for c in constants],
+            sensor_type, second_order)
+        result[f'{label}_t'] = temp
+        result[f'{label}_p'] = pressure
+    result['hum'] = humidity(raw['hum_d3'])
+    return result
+
+
+def reprocess_flight(filename, calibrations=None, second_order=True):
+    """reprocess the flight log filename, written in raw mode."""
+    log = read_flight_log(filename)
+    if 'raw' not in log:
+        raise ValueError(f'{filename} was not written in raw mode')
+    return reprocess(log, calibrations, second_order)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[3])
+    parser.add_argument('log_file', help='binary flight log (.tsfl) '
+                                         'written in raw mode')
+    parser.add_argument('--out', default='reprocessed.csv',
+                        help='CSV file to write (default reprocessed.csv)')
+    parser.add_argument('--first-order', action='store_true',
+                        help='leave out second-order compensation, as in '
+                             'flight')
+    args = parser.parse_args()
+
+    result = reprocess_flight(args.log_file,
+                              second_order=not args.first_order)
+    np.savetxt(args.out, np.column_stack(list(result.values())),
+               delimiter=',', header=','.join(result), comments='',
+               fmt='%.6f')
+    print(f"Reprocessed {len(result['time'])} readings to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
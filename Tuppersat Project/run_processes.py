@@ -1,34 +1,31 @@
-#Importing standard libraries
-from threading import Event
-
 #Importing custom libraries
 import thread_utils as tu
 
 
 ############################################################
 
-def process_thread(process, stop_event):
-    """Function to loop process in a thread with stop event"""
-    return tu.loop_thread(
-        loop = process.update,
-        setup = process.setup,
-        teardown = process.teardown,
-        stop_event = stop_event
-        )
-
 class RunProcesses:
-    """Class to run all listed processes as separate threads"""
-    def __init__(self, processes):
+    """Class to run all listed processes as tasks on a shared scheduler"""
+    def __init__(self, processes, scheduler, rates, blocking=(),
+                 policies=None):
         """Initialisation"""
         
-        # List of all processes to be executed
+        # Dictionary of label : process pairs to be executed
         self._processes = processes
         
-        self._stop_event = Event()
+        #Scheduler running the process tasks
+        self._scheduler = scheduler
+        
+        #Dictionary of label : rate (Hz) pairs, and labels of processes
+        #whose updates block
+        self._rates = rates
+        self._blocking = blocking
+        
+        #Dictionary of label : missed slot policy (default SKIP)
+        self._policies = policies
         
-        #List of threads for all processes:
-        self._threads = [process_thread(process, self._stop_event)
-                         for process in self._processes]
+        #List of tasks for all processes:
+        self._tasks = []
         
     
     def __enter__(self):
@@ -38,12 +35,16 @@ class RunProcesses:
         self.teardown()
         
     def setup(self):
-        """Setup by starting all process threads"""
-        tu.start_threads(self._threads)
+        """Setup by scheduling all process tasks"""
+        self._tasks = tu.schedule_tasks(self._scheduler, self._processes,
+                                        self._rates, self._blocking,
+                                        self._policies)
     
     def teardown(self):
-        """Teardown by stopping all threads"""
-        tu.stop_threads(self._stop_event, self._threads)
+        """Teardown by ending any backoff wait, then removing all process
+        tasks within the scheduler's shutdown deadline"""
+        tu.stop_objects(self._processes)
+        tu.unschedule_tasks(self._scheduler, self._tasks)
         
     def loop(self):
         """No loop method required"""
@@ -1,6 +1,3 @@
-#Importing standard libraries
-from threading import Event
-
 #Importing custom libraries
 import thread_utils as tu
 
@@ -8,17 +5,27 @@ import thread_utils as tu
 ############################################################
 
 class RunSensors:
-    """Class to run all sensors as threads"""
-    def __init__(self, sensor_dict):
+    """Class to run all sensors as tasks on a shared scheduler"""
+    def __init__(self, sensor_dict, scheduler, rates, blocking=(),
+                 policies=None):
         """Initialisation"""
         
-        self._sensor_list = sensor_dict.values()
+        #Dictionary of label : sensor pairs
+        self._sensor_dict = sensor_dict
+        
+        #Scheduler running the sensor tasks
+        self._scheduler = scheduler
+        
+        #Dictionary of label : rate (Hz) pairs, and labels of sensors
+        #whose reads block
+        self._rates = rates
+        self._blocking = blocking
         
-        self._stop_event = Event()
+        #Dictionary of label : missed slot policy (default SKIP)
+        self._policies = policies
         
-        #List of threads for all sensors:
-        self._threads = [tu.sensor_thread(sensor, self._stop_event)
-                         for sensor in self._sensor_list]
+        #List of tasks for all sensors:
+        self._tasks = []
         
         
     def __enter__(self):
@@ -28,13 +35,17 @@ class RunSensors:
         self.teardown()
         
     def setup(self):
-        """Setup by starting all sensor threads"""
-        tu.start_threads(self._threads)
+        """Setup by scheduling all sensor tasks"""
+        self._tasks = tu.schedule_tasks(self._scheduler, self._sensor_dict,
+                                        self._rates, self._blocking,
+                                        self._policies)
     
     def teardown(self):
-        """Teardown by stopping all threads"""
-        tu.stop_threads(self._stop_event, self._threads)
+        """Teardown by ending any backoff wait, then removing all sensor
+        tasks within the scheduler's shutdown deadline"""
+        tu.stop_objects(self._sensor_dict)
+        tu.unschedule_tasks(self._scheduler, self._tasks)
         
     def loop(self):
         """No loop method required"""
-        pass
\ No newline at end of file
+        pass
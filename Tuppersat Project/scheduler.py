@@ -0,0 +1,454 @@
+"""
+scheduler.py
+
+Deadline-driven scheduler running every sensor read and process from a
+single thread at declared per-task rates.
+
+Deadlines are absolute, so a task does not drift by its own execution time,
+and a task's rate can be changed while it runs (set_rate). They are kept in
+integer nanoseconds, so they neither accumulate rounding errors nor fall
+between the ticks of a simulated clock.
+Tasks that still block on I/O are marked blocking and handed to a small
+pool of worker threads. Each task has a policy for slots it misses, by running
+late or while a blocking call is still running: SKIP drops them and waits
+for the next deadline, CATCH_UP runs up to MAX_CATCH_UP of them as soon
+as possible, e.g. so that a packet still gets all of its samples.
+
+Shutdown is bounded by one Deadline, shared with the other stages of the
+shutdown (thread_utils.unschedule_tasks, the file writer) and started by
+the first of them: a task whose call is still running when it passes is
+abandoned without its teardown. The scheduling and worker threads are
+daemons, so an abandoned call does not keep the program from exiting.
+
+Deadlines and waits come from an injected clock (clock.py), so that a
+replay can run the scheduler on simulated time.
+"""
+# standard library imports
+import heapq
+import itertools
+import logging
+import queue
+import threading
+
+# local imports
+from clock import SYSTEM_CLOCK
+
+
+# Missed slot policies
+SKIP = 'skip'
+CATCH_UP = 'catch_up'
+
+# Most missed slots a CATCH_UP task runs late; older ones are skipped
+MAX_CATCH_UP = 5
+
+# Default upper bound on the time (s) spent waiting for running calls and
+# file writes on shutdown, in all
+SHUTDOWN_TIMEOUT = 5
+
+
+# ****************************************************************************
+
+class Deadline:
+    """Time limit shared by all stages of a shutdown. It starts with the
+    first stage, and each later stage only gets the time left."""
+    def __init__(self, timeout=SHUTDOWN_TIMEOUT, clock=None):
+        self.timeout = timeout
+        self._clock = clock or SYSTEM_CLOCK
+        self._end = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start counting down, unless already started."""
+        with self._lock:
+            if self._end is None:
+                self._end = self._clock.monotonic() + self.timeout
+
+    def remaining(self):
+        """Seconds left, or None (no limit) until started."""
+        if self._end is None:
+            return None
+        return max(self._end - self._clock.monotonic(), 0)
+
+
+# ****************************************************************************
+
+class TaskStats:
+    """Lateness of a task's start against its deadline, in seconds.
+
+    Jitter is the change in lateness between successive starts, i.e. the
+    error of each start-to-start interval against the task's period.
+    """
+    def __init__(self):
+        self.runs = 0
+        self.calls = 0
+        self.skipped = 0
+        self.caught_up = 0
+        self.errors = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        self.total_runtime = 0.0
+        self.max_jitter = 0.0
+        self.total_jitter_sq = 0.0
+
+    def record(self, lateness):
+        if self.runs:
+            jitter = lateness - self.last_lateness
+            self.max_jitter = max(self.max_jitter, abs(jitter))
+            self.total_jitter_sq += jitter*jitter
+        self.runs += 1
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.total_lateness += lateness
+
+    def summary(self):
+        runs = max(self.runs, 1)
+        intervals = max(self.runs - 1, 1)
+        return {'runs'            : self.runs,
+                'skipped'         : self.skipped,
+                'caught_up'       : self.caught_up,
+                'errors'          : self.errors,
+                'mean_lateness_ms': 1e3*self.total_lateness/runs,
+                'max_lateness_ms' : 1e3*self.max_lateness,
+                'rms_jitter_ms'   : 1e3*(self.total_jitter_sq/intervals)**0.5,
+                'max_jitter_ms'   : 1e3*self.max_jitter,
+                'mean_runtime_ms' : 1e3*self.total_runtime/max(self.calls, 1)}
+
+
+class Task:
+    """A callable run by the Scheduler at a fixed rate."""
+    def __init__(self, name, func, rate, blocking=False, setup=None,
+                 teardown=None, policy=SKIP, clock=None):
+        """Initialisation.
+
+        rate is in Hz. setup runs once before the first call and teardown
+        once the task has been removed, both in the thread running func.
+        policy (SKIP or CATCH_UP) decides what happens to missed slots.
+        clock (default the system clock) times the calls.
+        """
+        if rate <= 0:
+            raise ValueError(f'{name}: rate must be positive')
+        if policy not in (SKIP, CATCH_UP):
+            raise ValueError(f'{name}: unknown policy {policy}')
+        self.name = name
+        self.interval_ns = round(1e9/rate)
+        self.blocking = blocking
+        self.policy = policy
+        self.stats = TaskStats()
+
+        # blocking call in the pool, and slots owed to it meanwhile
+        self.running = False
+        self.owed = 0
+        self.state_lock = threading.Lock()
+
+        # the task's live heap entry and its deadline (monotonic ns);
+        # entries replaced by set_rate are skipped
+        self.entry = None
+        self.deadline = None
+
+        self._func = func
+        self._setup = setup
+        self._teardown = teardown
+        self._clock = clock or SYSTEM_CLOCK
+        self._is_setup = False
+        # held while running so that teardown waits for a call in progress
+        self._lock = threading.Lock()
+        self.active = True
+
+    def __repr__(self):
+        return f'Task({self.name}, rate={1/self.interval:g} Hz)'
+
+    @property
+    def interval(self):
+        """Seconds between deadlines"""
+        return self.interval_ns/1e9
+
+    def run(self):
+        with self._lock:
+            if not self.active:
+                return
+            if not self._is_setup:
+                if self._setup:
+                    self._setup()
+                self._is_setup = True
+            start = self._clock.monotonic()
+            self._func()
+            self.stats.total_runtime += self._clock.monotonic() - start
+            self.stats.calls += 1
+
+    def teardown(self, timeout=None):
+        """Deactivate, waiting up to timeout seconds (default forever) for
+        any call in progress to finish. Returns False, without tearing
+        down, if the call is still running."""
+        self.active = False
+        if not self._lock.acquire(
+                timeout=-1 if timeout is None else max(timeout, 0)):
+            return False
+        try:
+            if self._is_setup and self._teardown:
+                self._teardown()
+            self._is_setup = False
+        finally:
+            self._lock.release()
+        return True
+
+
+# ****************************************************************************
+
+class Scheduler:
+    """Runs all Tasks from one thread on absolute deadlines."""
+    def __init__(self, workers=4, report_interval=60,
+                 shutdown_timeout=SHUTDOWN_TIMEOUT, clock=None):
+        """Initialisation.
+
+        workers is the size of the pool for blocking tasks. Per-task
+        lateness is logged every report_interval seconds (0 disables).
+        The shutdown deadline, of shutdown_timeout seconds, bounds
+        teardown and whatever else is torn down with it.
+        clock (default the system clock) gives the deadlines and waits.
+        """
+        self._workers = workers
+        self._report_interval = report_interval
+        self._clock = clock or SYSTEM_CLOCK
+        self.deadline = Deadline(shutdown_timeout, self._clock)
+
+        self._tasks = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+        # blocking tasks queued for the worker threads
+        self._pending = queue.SimpleQueue()
+        self._pool = []
+        self._thread = None
+
+        self._logger = logging.getLogger(__name__)
+
+    def __enter__(self):
+        self.setup()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.teardown()
+
+    def setup(self):
+        """Start the scheduling thread and worker pool."""
+        self._stop_event.clear()
+        self._pool = [threading.Thread(target=self._work, name=f'task_{i}',
+                                       daemon=True)
+                      for i in range(self._workers)]
+        for worker in self._pool:
+            worker.start()
+        self._thread = threading.Thread(target=self._run, name='scheduler',
+                                        daemon=True)
+        self._thread.start()
+        if self._report_interval:
+            self.add('scheduler_report', self.report,
+                     rate=1/self._report_interval,
+                     delay=self._report_interval)
+        self._logger.info('Started scheduler')
+
+    def stop(self):
+        """Stop scheduling once any call in progress on the scheduling
+        thread returns, e.g. from a task; teardown still tears down the
+        tasks."""
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify()
+
+    def join(self, timeout=None):
+        """Wait up to timeout seconds (default forever) for the scheduling
+        thread to stop. Returns False if it is still running."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def teardown(self):
+        """Stop scheduling, then tear down any tasks still registered and
+        stop the workers, within the time left to the shutdown deadline
+        (starting it). Calls still running then are abandoned."""
+        self.deadline.start()
+        self.stop()
+        self._thread.join(self.deadline.remaining())
+        for task in list(self._tasks.values()):
+            self.remove(task, self.deadline.remaining())
+        for worker in self._pool:
+            self._pending.put(None)
+        for worker in self._pool:
+            worker.join(self.deadline.remaining())
+        busy = [thread.name for thread in (self._thread, *self._pool)
+                if thread.is_alive()]
+        if busy:
+            self._logger.warning(f'Stopped scheduler, abandoning threads '
+                                 f'{", ".join(busy)} still running')
+        else:
+            self._logger.info('Stopped scheduler')
+
+    def add(self, name, func, rate, blocking=False, setup=None,
+            teardown=None, delay=0, policy=SKIP):
+        """Schedule func to run rate times per second, starting after
+        delay seconds, with policy SKIP or CATCH_UP for missed slots."""
+        task = Task(name, func, rate, blocking, setup, teardown, policy,
+                    self._clock)
+        with self._cond:
+            if name in self._tasks:
+                raise ValueError(f'Task {name} is already scheduled')
+            self._tasks[name] = task
+            self._push(task, self._clock.monotonic_ns() + round(delay*1e9))
+            self._cond.notify()
+        return task
+
+    def set_rate(self, name, rate):
+        """Change the rate (Hz) of a scheduled task. The next deadline is
+        brought forward if the new interval ends before it. Returns False
+        if no task name is scheduled."""
+        if rate <= 0:
+            raise ValueError(f'{name}: rate must be positive')
+        with self._cond:
+            task = self._tasks.get(name)
+            if task is None:
+                return False
+            task.interval_ns = round(1e9/rate)
+            deadline = self._clock.monotonic_ns() + task.interval_ns
+            if deadline < task.deadline:
+                self._push(task, deadline)
+                self._cond.notify()
+        return True
+
+    def remove(self, task, timeout=None):
+        """Unschedule a task, waiting up to timeout seconds (default
+        forever) for a running call before teardown. Returns False if the
+        task was abandoned with its call still running."""
+        with self._cond:
+            self._tasks.pop(task.name, None)
+        try:
+            if task.teardown(timeout):
+                return True
+        except Exception as exc:
+            task.stats.errors += 1
+            self._logger.exception(f'{task.name}: {type(exc).__name__}')
+            return True
+        self._logger.warning(f'{task.name}: still running after '
+                             f'{timeout:.1f} s, abandoned without teardown')
+        return False
+
+    @property
+    def tasks(self):
+        return dict(self._tasks)
+
+    def lateness(self):
+        """Dictionary of task name : lateness and run statistics."""
+        return {name: task.stats.summary()
+                for name, task in self._tasks.items()}
+
+    def report(self):
+        """Log the lateness statistics of every task."""
+        for name, stats in self.lateness().items():
+            self._logger.info(
+                f"{name}: {stats['runs']} runs, {stats['skipped']} skipped, "
+                f"{stats['caught_up']} caught up, "
+                f"lateness mean {stats['mean_lateness_ms']:.1f} ms "
+                f"max {stats['max_lateness_ms']:.1f} ms, "
+                f"jitter rms {stats['rms_jitter_ms']:.1f} ms "
+                f"max {stats['max_jitter_ms']:.1f} ms")
+
+    def _next_due(self):
+        """Block until a task is due, returning it and its deadline."""
+        with self._cond:
+            while not self._stop_event.is_set():
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, _, task = self._heap[0]
+                timeout = deadline - self._clock.monotonic_ns()
+                if timeout > 0:
+                    self._clock.wait_condition(self._cond, timeout/1e9)
+                    continue
+                _, entry, _ = heapq.heappop(self._heap)
+                if not task.active or entry != task.entry:
+                    continue
+                self._reschedule(task, deadline)
+                return task, deadline
+        return None, None
+
+    def _reschedule(self, task, deadline):
+        """Push the next deadline, skipping the slots already missed beyond
+        those the task's policy catches up."""
+        next_deadline = deadline + task.interval_ns
+        late = self._clock.monotonic_ns() - next_deadline
+        missed = late//task.interval_ns + 1
+        if task.policy == CATCH_UP:
+            missed -= MAX_CATCH_UP
+        if missed > 0:
+            task.stats.skipped += missed
+            next_deadline += missed*task.interval_ns
+        self._push(task, next_deadline)
+
+    def _push(self, task, deadline):
+        """Make deadline the task's next, replacing any earlier heap entry.
+        Called with the condition held."""
+        task.entry = next(self._counter)
+        task.deadline = deadline
+        heapq.heappush(self._heap, (deadline, task.entry, task))
+
+    def _run(self):
+        while True:
+            task, deadline = self._next_due()
+            if task is None:
+                return
+            if task.blocking and not self._claim(task):
+                continue
+            lateness = (self._clock.monotonic_ns() - deadline)/1e9
+            task.stats.record(lateness)
+            if task.policy == CATCH_UP and lateness >= task.interval:
+                task.stats.caught_up += 1
+            if task.blocking:
+                self._pending.put(task)
+            else:
+                self._call(task)
+
+    def _claim(self, task):
+        """Mark a blocking task running. If it already is, the slot is
+        owed to it (CATCH_UP) or skipped; returns False."""
+        with task.state_lock:
+            if not task.running:
+                task.running = True
+                return True
+            if task.policy == CATCH_UP and task.owed < MAX_CATCH_UP:
+                task.owed += 1
+                task.stats.caught_up += 1
+            else:
+                task.stats.skipped += 1
+            return False
+
+    def _work(self):
+        """Worker thread running queued blocking tasks until given None.
+        Tasks still queued once scheduling has stopped are not run."""
+        while True:
+            task = self._pending.get()
+            if task is None:
+                return
+            if self._stop_event.is_set():
+                with task.state_lock:
+                    task.owed = 0
+                    task.running = False
+                continue
+            self._call_blocking(task)
+
+    def _call_blocking(self, task):
+        """Run a blocking task, then any slots owed to it meanwhile."""
+        while True:
+            self._call(task)
+            with task.state_lock:
+                if not task.owed or self._stop_event.is_set():
+                    task.owed = 0
+                    task.running = False
+                    return
+                task.owed -= 1
+
+    def _call(self, task):
+        try:
+            task.run()
+        except Exception as exc:
+            task.stats.errors += 1
+            self._logger.exception(f'{task.name}: {type(exc).__name__}')
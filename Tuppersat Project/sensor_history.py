@@ -0,0 +1,190 @@
+"""
+sensor_history.py
+
+Timestamped history of sensor readings.
+
+Each sensor pushes every reading into a fixed-size, array-backed ring
+buffer, so consumers polling at their own pace can ask for all samples since
+a given time instead of seeing only the latest value. Minimum, maximum, mean
+and standard deviation over a trailing time window are kept up to date as
+samples arrive. The processes' LatestViews (pubsub.py) keep one per sensor
+they read too, from which a process in window mode sends or stores the mean
+of the readings since its last update (mean_since).
+"""
+# standard library imports
+import math
+import threading
+from collections import deque
+
+# third party imports
+import numpy as np
+
+# local imports
+from clock import SYSTEM_CLOCK
+
+
+# ****************************************************************************
+
+class RingBuffer:
+    """Fixed-capacity buffer of (time, values) samples."""
+    def __init__(self, capacity, width=1):
+        """Initialisation."""
+        self._times = np.full(capacity, np.nan)
+        self._values = np.full((capacity, width), np.nan)
+        self._capacity = capacity
+        # index of the next slot to write, and number of samples held
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def push(self, t, values):
+        self._times[self._next] = t
+        self._values[self._next] = values
+        self._next = (self._next + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def _ordered(self):
+        """Indices of the held samples, oldest first."""
+        start = (self._next - self._count) % self._capacity
+        return (start + np.arange(self._count)) % self._capacity
+
+    def since(self, t):
+        """Arrays of times and values of all samples after time t."""
+        idx = self._ordered()
+        times = self._times[idx]
+        # times are pushed in increasing order
+        first = np.searchsorted(times, t, side='right')
+        return times[first:], self._values[idx[first:]]
+
+    def latest(self):
+        if not self._count:
+            return None, None
+        last = (self._next - 1) % self._capacity
+        return self._times[last], self._values[last]
+
+
+class WindowStats:
+    """Running min, max, mean and std of one quantity over a time window.
+
+    Sums are updated as samples enter and leave the window, and min/max use
+    monotonic deques, so each sample costs amortised O(1).
+    """
+    def __init__(self, window):
+        """Initialisation. window is in seconds."""
+        self._window = window
+        self._samples = deque()
+        self._mins = deque()
+        self._maxs = deque()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def push(self, t, value):
+        self._samples.append((t, value))
+        self._sum += value
+        self._sum_sq += value*value
+        while self._mins and self._mins[-1][1] >= value:
+            self._mins.pop()
+        self._mins.append((t, value))
+        while self._maxs and self._maxs[-1][1] <= value:
+            self._maxs.pop()
+        self._maxs.append((t, value))
+        self.expire(t)
+
+    def expire(self, now):
+        """Drop samples older than the window."""
+        cutoff = now - self._window
+        while self._samples and self._samples[0][0] <= cutoff:
+            _, value = self._samples.popleft()
+            self._sum -= value
+            self._sum_sq -= value*value
+        while self._mins and self._mins[0][0] <= cutoff:
+            self._mins.popleft()
+        while self._maxs and self._maxs[0][0] <= cutoff:
+            self._maxs.popleft()
+
+    def summary(self):
+        n = len(self._samples)
+        if not n:
+            return {'count': 0, 'min': None, 'max': None,
+                    'mean': None, 'std': None}
+        mean = self._sum/n
+        # guard against small negative values from rounding
+        var = max(self._sum_sq/n - mean*mean, 0.0)
+        return {'count': n,
+                'min'  : self._mins[0][1],
+                'max'  : self._maxs[0][1],
+                'mean' : mean,
+                'std'  : math.sqrt(var)}
+
+
+# ****************************************************************************
+
+HISTORY_SIZE = 2048
+STATS_WINDOW = 20
+
+class SensorHistory:
+    """Ring buffer and window statistics for the readings of one sensor.
+
+    Readings may be a number or a tuple of numbers, e.g. (t, p); None
+    readings are not recorded. Times default to the clock's monotonic
+    time, so that steps of the wall clock cannot reorder them.
+    """
+    def __init__(self, width=1, capacity=HISTORY_SIZE, window=STATS_WINDOW,
+                 clock=None):
+        """Initialisation."""
+        self._width = width
+        self._clock = clock or SYSTEM_CLOCK
+        self._buffer = RingBuffer(capacity, width)
+        self._stats = [WindowStats(window) for _ in range(width)]
+        self._lock = threading.Lock()
+
+    def push(self, reading, t=None):
+        """Record a reading taken at time t (default now)."""
+        if reading is None:
+            return
+        values = (reading,) if self._width == 1 else tuple(reading)
+        if any(v is None for v in values):
+            return
+        t = self._clock.monotonic() if t is None else t
+        with self._lock:
+            self._buffer.push(t, values)
+            for stats, value in zip(self._stats, values):
+                stats.push(t, value)
+
+    def since(self, t):
+        """Arrays of times and readings recorded after time t."""
+        with self._lock:
+            times, values = self._buffer.since(t)
+        return times, (values[:, 0] if self._width == 1 else values)
+
+    def mean_since(self, t):
+        """Mean of the readings recorded after time t, a number or a
+        tuple as the readings, None if there are none."""
+        _, values = self.since(t)
+        if not len(values):
+            return None
+        mean = values.mean(axis=0)
+        return float(mean) if self._width == 1 else tuple(mean.tolist())
+
+    def window_stats(self, now=None):
+        """Statistics over the trailing window, one dictionary per value."""
+        now = self._clock.monotonic() if now is None else now
+        with self._lock:
+            for stats in self._stats:
+                stats.expire(now)
+            summaries = [stats.summary() for stats in self._stats]
+        return summaries[0] if self._width == 1 else summaries
+
+
+def mean_since(sensor, t):
+    """Mean of the readings of a sensor-like object recorded after time t
+    if it has a history holding any, otherwise its latest data; with t
+    None, its latest data."""
+    history = getattr(sensor, 'history', None)
+    if t is not None and history is not None:
+        mean = history.mean_since(t)
+        if mean is not None:
+            return mean
+    return sensor.data
@@ -0,0 +1,187 @@
+"""
+fake_gps.py
+
+Pseudo-terminal u-blox receiver for the hardware-in-the-loop simulator.
+
+GpsReceiver opens the pty's slave path like the real serial port. The
+fake streams NMEA, either replayed from a recorded file or generated from
+the flight model, and answers UBX configuration: CFG messages are
+acknowledged, CFG-RATE sets the navigation rate, CFG-MSG enables NAV-DOP
+and NAV-PVT and CFG-PRT selects the output protocols.
+"""
+import datetime
+import os
+import select
+import struct
+import threading
+import time
+import tty
+
+from gps.nmea import checksum
+from gps.ubx import UbxParser, frame, _NAV_PVT, _NAV_DOP
+from gps.ubx import NAV_PVT, NAV_DOP, ACK_ACK, CFG_RATE, CFG_MSG, CFG_PRT
+from gps.ubx import PROTO_UBX, PROTO_NMEA
+
+
+def _nmea(body):
+    return f'${body}*{checksum(body.encode()):02X}\r\n'.encode()
+
+def _ddmm(degrees, width):
+    """Signed decimal degrees to (d)ddmm.mmmmm and hemisphere index."""
+    value = abs(degrees)
+    whole = int(value)
+    return f'{whole*100 + (value - whole)*60:0{width}.5f}', degrees < 0
+
+
+def nmea_epoch(state, utc):
+    """RMC, VTG, GGA and GSA sentences of a flight model state."""
+    lat, south = _ddmm(state['lat'], 10)
+    lon, west = _ddmm(state['lon'], 11)
+    ns, ew = 'S' if south else 'N', 'W' if west else 'E'
+    hms = f'{utc:%H%M%S}.{utc.microsecond//10000:02d}'
+    return b''.join(_nmea(body) for body in (
+        f'GPRMC,{hms},A,{lat},{ns},{lon},{ew},19.4,70.0,{utc:%d%m%y},,,A',
+        f'GPVTG,70.0,T,,M,19.4,N,36.0,K,A',
+        f'GPGGA,{hms},{lat},{ns},{lon},{ew},1,09,0.95,{state["alt"]:.1f},'
+        f'M,55.0,M,,',
+        f'GPGSA,A,3,01,03,06,09,12,17,19,22,25,,,,1.65,0.95,1.35'))
+
+
+def nav_pvt(state, utc, itow):
+    """NAV-PVT frame of a flight model state."""
+    payload = _NAV_PVT.pack(
+        itow, utc.year, utc.month, utc.day, utc.hour, utc.minute,
+        utc.second, 0x07, 20, utc.microsecond*1000, 3, 0x01, 0, 9,
+        round(state['lon']*1e7), round(state['lat']*1e7),
+        round((state['alt'] + 55)*1e3), round(state['alt']*1e3),
+        2500, 4000, 0, 10000, round(-state['climb']*1e3), 10000,
+        70*10**5, 500, 100000, 165, 0, 0, 0)
+    return frame(NAV_PVT, payload)
+
+
+def nav_dop(itow):
+    """NAV-DOP frame with the DOPs of the generated GSA sentence."""
+    return frame(NAV_DOP, _NAV_DOP.pack(itow, 180, 165, 90, 135, 95, 70,
+                                        65))
+
+
+def recorded_epochs(filename):
+    """Lists of sentences of a recorded NMEA file, split into epochs at
+    each repeat of the file's first sentence type."""
+    with open(filename, 'rb') as file:
+        lines = [line.strip() + b'\r\n' for line in file if line.strip()]
+    first = lines[0][3:6]
+    epochs = []
+    for line in lines:
+        if line[3:6] == first or not epochs:
+            epochs.append([])
+        epochs[-1].append(line)
+    return [b''.join(epoch) for epoch in epochs]
+
+
+class _CommandParser(UbxParser):
+    """UbxParser keeping every message received."""
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def _message(self, msg, payload):
+        self.messages.append((msg, bytes(payload)))
+        return None
+
+
+class FakeGps:
+    """u-blox receiver behind a pseudo-terminal."""
+    def __init__(self, model, nmea_file=None):
+        """Initialisation. model is a FlightModel; nmea_file replays a
+        recorded NMEA stream instead of generating one."""
+        self._model = model
+        self._epochs = recorded_epochs(nmea_file) if nmea_file else None
+        self._period = 1.0
+        self._nmea = True
+        self._pvt = False
+        self._dop = False
+        self._parser = _CommandParser()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.epochs_sent = 0
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='fake_gps')
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    @property
+    def native_id(self):
+        return self._thread.native_id
+
+    def _run(self):
+        next_epoch = time.monotonic()
+        while not self._stop_event.is_set():
+            timeout = max(next_epoch - time.monotonic(), 0)
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            if readable:
+                self._commands(os.read(self._master, 4096))
+                continue
+            self._send_epoch()
+            next_epoch += self._period
+
+    def _commands(self, data):
+        self._parser.feed(data)
+        for msg, payload in self._parser.messages:
+            if msg == CFG_RATE:
+                period_ms, = struct.unpack_from('<H', payload)
+                self._period = period_ms/1000
+            elif msg == CFG_MSG:
+                cls, msg_id, rate = struct.unpack_from('<BBB', payload)
+                if (cls, msg_id) == NAV_PVT:
+                    self._pvt = rate > 0
+                elif (cls, msg_id) == NAV_DOP:
+                    self._dop = rate > 0
+            elif msg == CFG_PRT:
+                out_proto, = struct.unpack_from('<H', payload, 14)
+                self._nmea = bool(out_proto & PROTO_NMEA)
+                self._pvt = self._pvt and bool(out_proto & PROTO_UBX)
+                self._dop = self._dop and bool(out_proto & PROTO_UBX)
+            if msg[0] == 0x06:
+                self._write(frame(ACK_ACK, bytes(msg)))
+        self._parser.messages.clear()
+
+    def _send_epoch(self):
+        utc = datetime.datetime.utcnow()
+        data = b''
+        if self._nmea:
+            if self._epochs:
+                data += self._epochs[self.epochs_sent % len(self._epochs)]
+            else:
+                data += nmea_epoch(self._model.state(), utc)
+        itow = round((utc.timestamp() % (7*86400))*1000)
+        if self._dop:
+            data += nav_dop(itow)
+        if self._pvt:
+            data += nav_pvt(self._model.state(), utc, itow)
+        self._write(data)
+        self.epochs_sent += 1
+
+    def _write(self, data):
+        try:
+            os.write(self._master, data)
+        except OSError:
+            # nobody reading and the pty buffer is full: drop the epoch
+            pass
@@ -0,0 +1,97 @@
+"""
+fake_radio.py
+
+Radio sink for the hardware-in-the-loop simulator.
+
+RadioSink owns a pseudo-terminal standing in for the radio's UART and
+drains everything written to it. FakeSatRadio replaces
+tuppersat.radio.SatRadio: it writes each packet to the serial port, as
+the real radio would, and records the time, kind and payload of every
+packet sent for the simulator's throughput and latency report.
+"""
+import functools
+import os
+import select
+import threading
+import time
+import tty
+
+
+class RadioSink:
+    """Receiving end of the radio UART, and record of packets sent."""
+    def __init__(self):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # (time sent, 'data' or 'telemetry', payload, bytes on the UART)
+        self.packets = []
+        self.uart_bytes = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='radio_sink')
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    @property
+    def native_id(self):
+        return self._thread.native_id
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if readable:
+                self.uart_bytes += len(os.read(self._master, 4096))
+
+    def record(self, kind, payload, size):
+        with self._lock:
+            self.packets.append((time.time(), kind, payload, size))
+
+    def satradio(self):
+        """SatRadio replacement class sending to this sink."""
+        return functools.partial(FakeSatRadio, sink=self)
+
+
+class FakeSatRadio:
+    """Stand-in for tuppersat.radio.SatRadio."""
+    def __init__(self, ser, address, callsign, sink):
+        self._ser = ser
+        self._address = address
+        self._callsign = callsign
+        self._sink = sink
+        self._running = False
+
+    def start(self):
+        self._running = True
+
+    def stop(self):
+        self._running = False
+
+    def _send(self, kind, frame, payload):
+        if not self._running:
+            raise RuntimeError('Radio not started')
+        self._ser.write(frame)
+        self._sink.record(kind, payload, len(frame))
+
+    def send_data_packet(self, data):
+        header = f'{self._callsign},{self._address:02X},D,'.encode()
+        self._send('data', header + data + b'\n', data)
+
+    def send_telemetry(self, **fields):
+        body = ','.join(f'{key}={value}' for key, value in fields.items())
+        frame = f'{self._callsign},{self._address:02X},T,{body}\n'.encode()
+        self._send('telemetry', frame, fields)
@@ -0,0 +1,191 @@
+"""
+fake_smbus.py
+
+Software stand-in for smbus.SMBus with emulated MS5611, MS8607 pressure
+and humidity, and DFRobot ozone sensors.
+
+Devices answer at the register level, so the real sensor classes,
+utility modules and bus manager run unchanged. Conversions take their
+datasheet time: reading an MS5611 ADC early returns 0 and reading the
+humidity sensor early fails with a NACK, as on the hardware. Each transfer
+also takes the time its bytes need on a 100 kHz bus.
+"""
+import errno
+import threading
+import time
+
+from pressure_sensors.pressure_utils import CONVERSION_TIME, OSR_OFFSET
+
+
+# I2C clock (Hz); each byte plus acknowledge takes 9 clocks
+I2C_CLOCK = 100e3
+
+# address : device, shared by all FakeSMBus instances
+DEVICES = {}
+
+
+def register(addr, device):
+    DEVICES[addr] = device
+
+def _nack():
+    return OSError(errno.EREMOTEIO, 'Remote I/O error')
+
+
+# ****************************************************************************
+
+class MS5611Device:
+    """MS5611 register interface.
+
+    quantities is a callable returning (temperature degC, pressure mbar),
+    which are converted to the D2 and D1 ADC values the sensor's
+    calibration constants turn back into them.
+    """
+    # typical calibration constants from the MS5611 datasheet
+    PROM = [0, 40127, 36924, 23317, 23282, 33464, 28312, 0]
+    # powers of 2 of C2 and C4 in OFF, and of C1 and C3 in SENS
+    OFF_SHIFTS = (16, 7)
+    SENS_SHIFTS = (15, 8)
+
+    def __init__(self, quantities):
+        self._quantities = quantities
+        self._conversion = None
+        self._ready_at = 0.0
+        self._adc = 0
+
+    def adc_values(self, temperature, pressure):
+        """(D1, D2) ADC values giving temperature and pressure."""
+        c = self.PROM
+        d_t = (temperature*100 - 2000)*2**23/c[6]
+        d2 = d_t + c[5]*2**8
+        offset = c[2]*2**self.OFF_SHIFTS[0] + c[4]*d_t/2**self.OFF_SHIFTS[1]
+        sensitivity = (c[1]*2**self.SENS_SHIFTS[0]
+                       + c[3]*d_t/2**self.SENS_SHIFTS[1])
+        d1 = (pressure*100*2**15 + offset)*2**21/sensitivity
+        clamp = lambda v: min(max(round(v), 0), 2**24 - 1)
+        return clamp(d1), clamp(d2)
+
+    def write_byte(self, cmd):
+        if cmd == 0x1E:
+            # reset
+            self._conversion = None
+            return
+        base, offset = cmd & 0xF0, cmd & 0x0F
+        osr = {v: k for k, v in OSR_OFFSET.items()}.get(offset)
+        if base not in (0x40, 0x50) or osr is None:
+            raise _nack()
+        d1, d2 = self.adc_values(*self._quantities())
+        self._adc = d1 if base == 0x40 else d2
+        self._conversion = cmd
+        self._ready_at = time.monotonic() + CONVERSION_TIME[osr]
+
+    def read_i2c_block_data(self, reg, length):
+        if 0xA0 <= reg <= 0xAE:
+            word = self.PROM[(reg - 0xA0)//2]
+            return [word >> 8, word & 0xFF][:length]
+        if reg != 0x00:
+            raise _nack()
+        # ADC read; 0 if no conversion has completed
+        value = 0
+        if self._conversion is not None and time.monotonic() >= self._ready_at:
+            value = self._adc
+        self._conversion = None
+        return [value >> 16, (value >> 8) & 0xFF, value & 0xFF][:length]
+
+
+class MS8607PressureDevice(MS5611Device):
+    """MS8607 pressure and temperature register interface, as the MS5611
+    but for its calibration constants and first order shifts (see
+    humidity_sensor/pressure_utils.compute_pressure)."""
+    # typical calibration constants from the MS8607 datasheet
+    PROM = [0, 46372, 43981, 29059, 27842, 31553, 28165, 0]
+    OFF_SHIFTS = (17, 6)
+    SENS_SHIFTS = (16, 7)
+
+
+class HumidityDevice:
+    """MS8607 relative humidity register interface (hold-less read).
+
+    quantities is a callable returning relative humidity in %.
+    """
+    CONVERSION_TIME = 0.016
+
+    def __init__(self, quantities):
+        self._quantities = quantities
+        self._ready_at = None
+        self._adc = 0
+
+    def write_byte(self, cmd):
+        if cmd != 0xF5:
+            raise _nack()
+        rh = self._quantities()
+        # inverse of humidity_utils.compute_humidity
+        self._adc = min(max(round((rh + 600)*2**16/12500/256), 0), 255)
+        self._ready_at = time.monotonic() + self.CONVERSION_TIME
+
+    def read_byte(self):
+        if self._ready_at is None or time.monotonic() < self._ready_at:
+            raise _nack()
+        self._ready_at = None
+        return self._adc
+
+
+class OzoneDevice:
+    """DFRobot SEN0321 ozone sensor register interface.
+
+    quantities is a callable returning ozone concentration in ppb.
+    """
+    def __init__(self, quantities):
+        self._quantities = quantities
+        self._registers = {}
+
+    def write_i2c_block_data(self, reg, data):
+        self._registers[reg] = list(data)
+
+    def read_i2c_block_data(self, reg, length):
+        if reg not in (0x07, 0x09):
+            raise _nack()
+        ppb = min(max(round(self._quantities()), 0), 0xFFFF)
+        return [ppb >> 8, ppb & 0xFF][:length]
+
+
+# ****************************************************************************
+
+class FakeSMBus:
+    """Drop-in replacement for smbus.SMBus talking to DEVICES."""
+    def __init__(self, bus=None):
+        self._bus = bus
+        # an I2C bus carries one transfer at a time
+        self._lock = threading.Lock()
+
+    def _device(self, addr, method):
+        device = DEVICES.get(addr)
+        if device is None or not hasattr(device, method):
+            raise _nack()
+        return getattr(device, method)
+
+    def _transfer(self, n_bytes):
+        # address byte, register/command and data bytes
+        time.sleep(9*(n_bytes + 1)/I2C_CLOCK)
+
+    def write_byte(self, addr, value):
+        with self._lock:
+            self._transfer(1)
+            return self._device(addr, 'write_byte')(value)
+
+    def read_byte(self, addr):
+        with self._lock:
+            self._transfer(1)
+            return self._device(addr, 'read_byte')()
+
+    def read_i2c_block_data(self, addr, reg, length=32):
+        with self._lock:
+            self._transfer(length + 2)
+            return self._device(addr, 'read_i2c_block_data')(reg, length)
+
+    def write_i2c_block_data(self, addr, reg, data):
+        with self._lock:
+            self._transfer(len(data) + 1)
+            return self._device(addr, 'write_i2c_block_data')(reg, data)
+
+    def close(self):
+        pass
@@ -0,0 +1,31 @@
+"""
+fake_tuppersat.py
+
+Installs the simulator's stand-ins for the tuppersat library in
+sys.modules, before the flight software imports it.
+"""
+import sys
+import types
+
+
+def install(satradio=None):
+    """Replace tuppersat.airborne.set_airborne with a no-op and, if given,
+    tuppersat.radio.SatRadio with satradio. Without the tuppersat library
+    installed, its utilities are taken from the vendored tuppersat_utils.
+    """
+    try:
+        import tuppersat
+    except ImportError:
+        import tuppersat_utils
+        import tuppersat_utils.threadutils
+        tuppersat = types.ModuleType('tuppersat')
+        tuppersat.utils = tuppersat_utils
+        sys.modules['tuppersat'] = tuppersat
+        sys.modules['tuppersat.utils'] = tuppersat_utils
+        sys.modules['tuppersat.utils.threadutils'] = (
+            tuppersat_utils.threadutils)
+    sys.modules['tuppersat.airborne'] = types.SimpleNamespace(
+        set_airborne=lambda port: None)
+    if satradio is not None:
+        sys.modules['tuppersat.radio'] = types.SimpleNamespace(
+            SatRadio=satradio)
@@ -0,0 +1,126 @@
+"""
+fake_w1.py
+
+Fake 1-Wire sysfs tree of DS18B20 temperature sensors.
+
+The device directories sit in a bus master directory, as in
+/sys/devices/w1_bus_master1. Each holds a w1_slave file in the kernel
+driver's format, and the temperature (millidegrees) and resolution files,
+rewritten atomically with a fresh reading every conversion time (750 ms
+at 12-bit resolution). Once 'trigger' has been written to the master's
+therm_bulk_read, readings are only written by bulk conversions instead:
+the status reads -1 for the conversion time of the lowest resolution set,
+then the new readings are written and it reads 1. The time each value was
+written is kept, so readings can be traced through to the radio packets
+that carry them.
+"""
+import os
+import threading
+import time
+
+W1_SLAVE = ('72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n'
+            '72 01 4b 46 7f ff 0e 10 57 t={t}\n')
+
+MASTER = 'w1_bus_master1'
+
+# Conversion time (s) at each resolution (bits)
+CONVERSION_TIME = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.75}
+
+# Seconds between checks for a bulk conversion trigger
+POLL_INTERVAL = 0.01
+
+
+class FakeW1:
+    """Writes w1_slave files for a set of DS18B20 devices."""
+    def __init__(self, root, devices, interval=0.75):
+        """Initialisation.
+
+        devices is a dictionary of device id (e.g. '28-00000deac472') :
+        callable returning the temperature in degC.
+        """
+        self.root = root
+        self._devices = devices
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._master = os.path.join(root, MASTER)
+        # bulk conversions used, and end time of the one in progress
+        self._bulk = False
+        self._converting_until = None
+        # device id : {temperature (millidegrees) : [write times]}
+        self.written = {device: {} for device in devices}
+
+    def path(self, device):
+        return self._file(device, 'w1_slave')
+
+    def _file(self, device, name):
+        return os.path.join(self._master, device, name)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        for device in self._devices:
+            os.makedirs(os.path.join(self._master, device), exist_ok=True)
+            self._replace(self._file(device, 'resolution'), '12\n')
+        self._replace(os.path.join(self._master, 'therm_bulk_read'), '0\n')
+        self.update()
+        self._thread = threading.Thread(target=self._run, name='fake_w1')
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def update(self):
+        """Write a fresh reading of every device."""
+        for device, temperature in self._devices.items():
+            millidegrees = round(temperature()*1000)
+            self._replace(self.path(device),
+                          W1_SLAVE.format(t=millidegrees))
+            self._replace(self._file(device, 'temperature'),
+                          f'{millidegrees}\n')
+            self.written[device].setdefault(millidegrees, []).append(
+                time.time())
+
+    def _replace(self, path, text):
+        with open(path + '.tmp', 'w') as file:
+            file.write(text)
+        os.replace(path + '.tmp', path)
+
+    def conversion_time(self):
+        """Conversion time of the slowest device at its resolution"""
+        bits = []
+        for device in self._devices:
+            with open(self._file(device, 'resolution')) as file:
+                bits.append(int(file.read()))
+        return CONVERSION_TIME[max(bits)]
+
+    def _run(self):
+        bulk_file = os.path.join(self._master, 'therm_bulk_read')
+        last = time.monotonic()
+        while not self._stop_event.wait(POLL_INTERVAL):
+            now = time.monotonic()
+            if self._converting_until is None:
+                with open(bulk_file) as file:
+                    if file.read().strip() == 'trigger':
+                        self._bulk = True
+                        self._converting_until = (now
+                                                  + self.conversion_time())
+                        self._replace(bulk_file, '-1\n')
+            if self._converting_until is not None:
+                if now >= self._converting_until:
+                    self.update()
+                    self._replace(bulk_file, '1\n')
+                    self._converting_until = None
+            elif not self._bulk and now - last >= self._interval:
+                self.update()
+                last = now
+
+    @property
+    def native_id(self):
+        return self._thread.native_id
@@ -0,0 +1,121 @@
+"""
+flight_model.py
+
+Physical conditions seen by TOAST-Sat during a simulated balloon flight,
+used by the fake devices of the hardware-in-the-loop simulator.
+
+The balloon waits on the pad, ascends at a constant rate to burst, then
+descends at a constant rate. Pressure and outside temperature follow the
+International Standard Atmosphere; the inside of the payload is kept
+warmer; humidity and ozone follow simple profiles; and the position
+drifts downwind. All quantities carry a little noise so that successive
+readings differ.
+"""
+import math
+import random
+import time
+
+
+# ISA layers: (base altitude m, base temperature K, lapse rate K/m,
+# base pressure mbar)
+ISA_LAYERS = [(0, 288.15, -0.0065, 1013.25),
+              (11000, 216.65, 0.0, 226.32),
+              (20000, 216.65, 0.001, 54.749),
+              (32000, 228.65, 0.0028, 8.6802)]
+G_M_R = 9.80665*0.0289644/8.31447
+
+
+def isa(altitude):
+    """(temperature degC, pressure mbar) at altitude in m."""
+    for base, t_base, lapse, p_base in reversed(ISA_LAYERS):
+        if altitude >= base:
+            break
+    temperature = t_base + lapse*(altitude - base)
+    if lapse == 0:
+        pressure = p_base*math.exp(-G_M_R*(altitude - base)/t_base)
+    else:
+        pressure = p_base*(temperature/t_base)**(-G_M_R/lapse)
+    return temperature - 273.15, pressure
+
+
+class FlightModel:
+    """Flight profile as a function of (optionally accelerated) time."""
+    def __init__(self, pad_time=60, ascent_rate=5.0, burst_altitude=30000,
+                 descent_rate=8.0, ground_altitude=50.0, time_scale=1.0,
+                 start=(53.3096, -6.2186), clock=time.time, seed=0):
+        """Initialisation.
+
+        time_scale > 1 runs the flight that many times faster than the
+        clock, e.g. to cover a whole flight in a short simulator run.
+        """
+        self.pad_time = pad_time
+        self.ascent_rate = ascent_rate
+        self.burst_altitude = burst_altitude
+        self.descent_rate = descent_rate
+        self.ground_altitude = ground_altitude
+        self.time_scale = time_scale
+        self.start = start
+        self._clock = clock
+        self._t0 = clock()
+        self._rng = random.Random(seed)
+
+        height = burst_altitude - ground_altitude
+        self.burst_time = pad_time + height/ascent_rate
+        self.landing_time = self.burst_time + height/descent_rate
+
+    def flight_time(self, now=None):
+        """Seconds of flight time elapsed at clock time now."""
+        now = self._clock() if now is None else now
+        return (now - self._t0)*self.time_scale
+
+    def altitude(self, t):
+        """Altitude in m at flight time t."""
+        if t < self.pad_time:
+            return self.ground_altitude
+        if t < self.burst_time:
+            return self.ground_altitude + self.ascent_rate*(t - self.pad_time)
+        if t < self.landing_time:
+            fallen = self.descent_rate*(t - self.burst_time)
+            return self.burst_altitude - fallen
+        return self.ground_altitude
+
+    def vertical_speed(self, t):
+        if self.pad_time <= t < self.burst_time:
+            return self.ascent_rate
+        if self.burst_time <= t < self.landing_time:
+            return -self.descent_rate
+        return 0.0
+
+    def position(self, t):
+        """(lat, lon) in degrees, drifting east-north-east while aloft."""
+        aloft = min(max(t - self.pad_time, 0),
+                    self.landing_time - self.pad_time)
+        # about 10 m/s of wind
+        return (self.start[0] + aloft*3e-5,
+                self.start[1] + aloft*1.2e-4)
+
+    def _noise(self, scale):
+        return self._rng.gauss(0, scale)
+
+    def state(self, now=None):
+        """Dictionary of conditions at clock time now (default now)."""
+        t = self.flight_time(now)
+        alt = self.altitude(t)
+        temp_ext, pressure = isa(alt)
+        # insulated payload box, warmed by the electronics
+        temp_int = 20 + 0.3*(temp_ext - 15)
+        # wet troposphere, dry above
+        humidity = max(60*math.exp(-alt/4000), 0.5)
+        # ozone layer peaking near 25 km
+        ozone = 30 + 120*math.exp(-((alt - 25000)/6000)**2)
+        lat, lon = self.position(t)
+        return {'flight_time': t,
+                'alt'        : alt + self._noise(2),
+                'lat'        : lat,
+                'lon'        : lon,
+                'climb'      : self.vertical_speed(t),
+                'pressure'   : pressure*(1 + self._noise(2e-4)),
+                'temp_ext'   : temp_ext + self._noise(0.05),
+                'temp_int'   : temp_int + self._noise(0.05),
+                'humidity'   : humidity + self._noise(0.5),
+                'ozone'      : max(ozone + self._noise(3), 0)}
@@ -0,0 +1,212 @@
+"""Faster-than-real-time replay of a recorded flight through the processes.
+
+Feeds the readings of a binary flight log (flight_log.py, as written by
+StoreData) through the real HandleTelemetry, HandleData and StoreData on a
+VirtualClock. The processes are run by the Scheduler at their toast_sat
+rates and missed slot policies, and every deadline, sleep and timestamp
+comes from the virtual clock, so a three hour flight replays in seconds
+and the packets and files produced are the same on every run. The replay
+fails if any process raised.
+
+Outputs, in --out:
+
+    radio_packets.txt : time, kind and contents of every packet sent
+                        (data packets in hex)
+    flight_data/      : the files written by StoreData
+
+    python simulator/replay.py 101500_flight.tsfl --out replayed
+    python simulator/replay.py 101500_flight.tsfl --data-format text
+"""
+import argparse
+import bisect
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from pathlib import Path
+
+TUPPERSAT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(TUPPERSAT_DIR))
+sys.path.insert(0, str(TUPPERSAT_DIR / 'simulator'))
+
+import fake_smbus
+import fake_tuppersat
+from fake_radio import FakeSatRadio
+
+# nothing is read from the bus or sent by radio; the fakes only satisfy
+# the flight software's imports
+sys.modules['smbus'] = types.SimpleNamespace(SMBus=fake_smbus.FakeSMBus)
+fake_tuppersat.install(FakeSatRadio)
+
+import store_data
+import toast_sat
+from clock import VirtualClock
+from flight_log import read_flight_log
+from gps.nmea import EMPTY_FIX
+from handle_data import HandleData
+from handle_telem import HandleTelemetry
+from scheduler import Scheduler
+from store_data import StoreData
+
+
+# sensor label : (group, fields) of the flight log; two fields make a
+# (temperature, pressure) reading
+SENSOR_FIELDS = {'temp1'   : ('interior', ['temp1']),
+                 'pressure': ('interior', ['pressure_t', 'pressure_p']),
+                 'temp2'   : ('payload', ['temp2']),
+                 'p_ext'   : ('payload', ['p_ext_t', 'p_ext_p']),
+                 'hum'     : ('payload', ['hum']),
+                 'ozone'   : ('payload', ['ozone'])}
+
+
+def _value(x):
+    x = float(x)
+    return None if math.isnan(x) else x
+
+
+class ReplaySensor:
+    """Sensor-like view of a logged sensor: data is its latest reading
+    at the clock's time, or before the first one initial, the value the
+    real sensor holds until it has read."""
+    def __init__(self, times, readings, clock, initial=None):
+        self._times = list(times)
+        self._readings = readings
+        self._clock = clock
+        self._initial = initial
+
+    @property
+    def data(self):
+        i = bisect.bisect_right(self._times, self._clock.time()) - 1
+        return self._readings[i] if i >= 0 else self._initial
+
+
+def replay_sensors(log, clock):
+    """Dictionary of label : ReplaySensor of a read_flight_log result,
+    in the order of toast_sat's sensors."""
+    gps = log['gps']
+    fixes = [None if lat is None else
+             EMPTY_FIX._replace(lat=lat, lon=lon, alt=alt, hdop=hdop)
+             for lat, lon, alt, hdop in zip(
+                 *([_value(x) for x in gps[field]]
+                   for field in ('lat', 'lon', 'alt', 'hdop')))]
+    sensors = {'gps': ReplaySensor(gps['time'], fixes, clock)}
+    for label, (group, fields) in SENSOR_FIELDS.items():
+        columns = [[_value(x) for x in log[group][field]]
+                   for field in fields]
+        if len(columns) > 1:
+            readings, initial = list(zip(*columns)), (None,)*len(columns)
+        else:
+            readings, initial = columns[0], None
+        sensors[label] = ReplaySensor(log[group]['time'], readings, clock,
+                                      initial)
+    return sensors
+
+
+class RecordingRadio:
+    """SatRadio stand-in recording packets at the clock's time."""
+    def __init__(self, clock):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.packets = []
+
+    def _record(self, kind, payload):
+        with self._lock:
+            self.packets.append((self._clock.time(), kind, payload))
+
+    def send_data_packet(self, data):
+        self._record('data', data)
+
+    def send_telemetry(self, **fields):
+        self._record('telemetry', fields)
+
+    def write(self, filename):
+        with open(filename, 'w') as file:
+            for t, kind, payload in sorted(self.packets,
+                                           key=lambda p: (p[0], p[1])):
+                if kind == 'data':
+                    payload = payload.hex()
+                file.write(f'{t:.6f},{kind},{payload}\n')
+
+
+def replay(log_file, out_dir, data_format=None, data_samples=None,
+           store_format=None):
+    """Replay log_file, writing the packets and files to out_dir.
+    Returns (seconds of flight replayed, wall clock seconds taken)."""
+
+    log = read_flight_log(log_file)
+    times = [columns['time'] for columns in log.values()
+             if len(columns['time'])]
+    start = min(t[0] for t in times)
+    end = max(t[-1] for t in times)
+
+    data_dir = os.path.join(out_dir, 'flight_data', '')
+    os.makedirs(data_dir, exist_ok=True)
+    store_data.DATA_DIR = data_dir
+
+    clock = VirtualClock(start)
+    sensors = replay_sensors(log, clock)
+    radio = RecordingRadio(clock)
+    processes = {
+        'telemetry': HandleTelemetry(sensors, radio, clock,
+                                     toast_sat.WINDOW_MEANS),
+        'data'     : HandleData(sensors, radio,
+                                data_format or toast_sat.DATA_FORMAT,
+                                data_samples or toast_sat.DATA_SAMPLES,
+                                clock, toast_sat.WINDOW_MEANS),
+        'store'    : StoreData(sensors,
+                               store_format or toast_sat.STORE_FORMAT,
+                               clock, window=toast_sat.WINDOW_MEANS)
+        }
+
+    # Nothing blocks in a replay, so every task runs on the scheduling
+    # thread, the clock's only sleeper. All are added before it starts,
+    # and the scheduler stops itself at the end, before any process
+    # update due then
+    wall_start = time.monotonic()
+    scheduler = Scheduler(report_interval=0, clock=clock)
+    scheduler.add('end', scheduler.stop, rate=1/(end - start + 1),
+                  delay=end - start)
+    tasks = [scheduler.add(label, process.update,
+                           rate=toast_sat.PROCESS_RATES[label],
+                           setup=process.setup, teardown=process.teardown,
+                           policy=toast_sat.PROCESS_POLICIES[label])
+             for label, process in processes.items()]
+    scheduler.setup()
+    scheduler.join()
+    scheduler.teardown()
+    wall = time.monotonic() - wall_start
+
+    failed = {task.name: task.stats.errors for task in tasks
+              if task.stats.errors}
+    if failed:
+        raise RuntimeError(f'Replay failed, errors by process: {failed}')
+    radio.write(os.path.join(out_dir, 'radio_packets.txt'))
+    return end - start, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('log_file', help='binary flight log (.tsfl)')
+    parser.add_argument('--out', help='output directory (default a new '
+                                      'temporary directory)')
+    parser.add_argument('--data-format', choices=('text', 'binary'),
+                        help='data packet format (default toast_sat\'s)')
+    parser.add_argument('--data-samples', type=int,
+                        help='samples per data packet '
+                             '(default toast_sat\'s)')
+    parser.add_argument('--store-format', choices=('text', 'binary'),
+                        help='stored data format (default toast_sat\'s)')
+    args = parser.parse_args()
+
+    out_dir = args.out or tempfile.mkdtemp(prefix='toastsat_replay_')
+    flight, wall = replay(args.log_file, out_dir, args.data_format,
+                          args.data_samples, args.store_format)
+    print(f'Replayed {flight:.0f} s of flight in {wall:.2f} s '
+          f'({flight/max(wall, 1e-9):.0f}x), output in {out_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Hardware-in-the-loop run of the full flight software on a Linux box.
+
+Runs toast_sat.main() unchanged against simulated hardware:
+
+    I2C    : fake_smbus.FakeSMBus with MS5611 (0x77), MS8607 pressure (0x76)
+             and humidity (0x40) and DFRobot ozone (0x73) devices
+    1-Wire : fake_w1.FakeW1 sysfs tree of both DS18B20 sensors
+    GPS    : fake_gps.FakeGps on a pseudo-terminal, generating or replaying
+             NMEA and answering UBX configuration
+    radio  : fake_radio.RadioSink on a pseudo-terminal, recording packets
+
+all driven by the flight profile of flight_model.FlightModel. After
+--duration seconds the run is stopped as by Ctrl-C and reports
+
+    CPU        : seconds of CPU used by the flight software (the fakes'
+                 own threads excluded) and the share of one core
+    throughput : packets, bytes and packets/s of each kind
+    latency    : sensor-to-radio latency, from the time a DS18B20 reading
+                 is written to the sysfs tree to the time the packet
+                 carrying it is sent, for the newest temp2 sample of each
+                 data packet and the temp1 and temp2 of each telemetry
+                 packet
+
+    python simulator/run_hil.py --duration 120
+    python simulator/run_hil.py --time-scale 50 --nmea capture.nmea
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import types
+import _thread
+from pathlib import Path
+
+TUPPERSAT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(TUPPERSAT_DIR))
+sys.path.insert(0, str(TUPPERSAT_DIR / 'simulator'))
+
+import fake_smbus
+import fake_tuppersat
+from fake_gps import FakeGps
+from fake_radio import RadioSink
+from fake_w1 import FakeW1
+from flight_model import FlightModel
+
+from radio.packet_codec import decode_packet, PacketError
+
+DURATION = 120
+# DS18B20 device ids of TEMP_PATH1 (inside) and TEMP_PATH2 (outside)
+W1_DEVICES = ('28-00000deac472', '28-0120424fab9f')
+
+
+def install_fakes(sink):
+    """Put the fake smbus and tuppersat modules in sys.modules, before
+    toast_sat imports them."""
+    sys.modules['smbus'] = types.SimpleNamespace(SMBus=fake_smbus.FakeSMBus)
+    fake_tuppersat.install(sink.satradio())
+
+
+def register_devices(model):
+    """Register the I2C devices, reading their quantities from model."""
+    from ozone_sensor.ozone_class import OZONE_ADDRESS_3
+    def quantity(*keys):
+        def read():
+            state = model.state()
+            values = tuple(state[key] for key in keys)
+            return values if len(values) > 1 else values[0]
+        return read
+    fake_smbus.register(0x77, fake_smbus.MS5611Device(
+        quantity('temp_int', 'pressure')))
+    fake_smbus.register(0x76, fake_smbus.MS8607PressureDevice(
+        quantity('temp_ext', 'pressure')))
+    fake_smbus.register(0x40, fake_smbus.HumidityDevice(
+        quantity('humidity')))
+    fake_smbus.register(OZONE_ADDRESS_3, fake_smbus.OzoneDevice(
+        quantity('ozone')))
+
+
+def thread_cpu(native_id):
+    """CPU seconds used so far by a thread of this process"""
+    with open(f'/proc/self/task/{native_id}/stat') as file:
+        fields = file.read().rsplit(')', 1)[1].split()
+    # utime and stime, fields 14 and 15 of stat
+    return (int(fields[11]) + int(fields[12]))/os.sysconf('SC_CLK_TCK')
+
+def process_cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(round(q*(len(values) - 1)), len(values) - 1)]
+    return {'n'   : len(values),
+            'mean': sum(values)/len(values),
+            'p50' : pick(0.5),
+            'p95' : pick(0.95),
+            'max' : values[-1]}
+
+
+def written_before(written, value, sent):
+    """Latest time value (degC) was written no later than sent"""
+    key = round(value*1000)
+    times = [t for t in written.get(key, ()) if t <= sent]
+    return max(times) if times else None
+
+def data_temp2(payload):
+    """temp2 samples of a data packet, oldest first"""
+    try:
+        samples = decode_packet(payload)['samples']
+        return [sample['temp2'] for sample in samples]
+    except PacketError:
+        pass
+    # text packet: header;alt,temp2,p_ext,hum,ozone;...
+    samples = []
+    for sample in payload.decode().split(';')[1:]:
+        field = sample.split(',')[1]
+        samples.append(float(field) if field.strip() else None)
+    return samples
+
+def latencies(packets, w1):
+    """Sensor-to-radio latencies of the packets sent"""
+    inside, outside = (w1.written[device] for device in W1_DEVICES)
+    data, telemetry = [], []
+    for sent, kind, payload, size in packets:
+        if kind == 'data':
+            values = [(v, outside) for v in data_temp2(payload)[-1:]]
+            target = data
+        else:
+            values = [(payload.get('temp1'), inside),
+                      (payload.get('temp2'), outside)]
+            target = telemetry
+        for value, written in values:
+            if value is None:
+                continue
+            t = written_before(written, value, sent)
+            if t is not None:
+                target.append(sent - t)
+    return {'data': percentiles(data), 'telemetry': percentiles(telemetry)}
+
+
+def throughput(packets, duration):
+    result = {}
+    for kind in ('data', 'telemetry'):
+        sizes = [size for _, k, _, size in packets if k == kind]
+        result[kind] = {'packets' : len(sizes),
+                        'bytes'   : sum(sizes),
+                        'per_second': len(sizes)/duration}
+    return result
+
+
+def run(args):
+    out_dir = args.out or tempfile.mkdtemp(prefix='toastsat_hil_')
+    log_dir = os.path.join(out_dir, 'logs', '')
+    data_dir = os.path.join(out_dir, 'flight_data', '')
+    w1_root = os.path.join(out_dir, 'w1')
+    for directory in (log_dir, data_dir):
+        os.makedirs(directory, exist_ok=True)
+
+    sink = RadioSink()
+    install_fakes(sink)
+    model = FlightModel(time_scale=args.time_scale)
+    register_devices(model)
+    w1 = FakeW1(w1_root, {W1_DEVICES[0]: lambda: model.state()['temp_int'],
+                          W1_DEVICES[1]: lambda: model.state()['temp_ext']})
+    gps = FakeGps(model, args.nmea)
+
+    import store_data
+    import toast_sat
+    toast_sat.GPS_PORT = gps.port
+    toast_sat.TEMP_PATH1, toast_sat.TEMP_PATH2 = (w1.path(device)
+                                                  for device in W1_DEVICES)
+    toast_sat.RADIO_PATH = sink.port
+    toast_sat.LOG_DIR = log_dir
+    store_data.DATA_DIR = data_dir
+
+    fakes = (w1, gps, sink)
+    with w1, gps, sink:
+        timer = threading.Timer(args.duration, _thread.interrupt_main)
+        cpu_start = process_cpu()
+        fakes_start = sum(thread_cpu(fake.native_id) for fake in fakes)
+        start = time.monotonic()
+        timer.start()
+        toast_sat.main()
+        timer.cancel()
+        wall = time.monotonic() - start
+        fakes_cpu = sum(thread_cpu(fake.native_id) for fake in fakes)
+        cpu = process_cpu() - cpu_start - (fakes_cpu - fakes_start)
+
+    return {'duration'   : wall,
+            'flight_time': model.flight_time(),
+            'cpu_seconds': cpu,
+            'cpu_share'  : cpu/wall,
+            'gps_epochs' : gps.epochs_sent,
+            'uart_bytes' : sink.uart_bytes,
+            'throughput' : throughput(sink.packets, wall),
+            'latency'    : latencies(sink.packets, w1),
+            'output'     : out_dir}
+
+
+def report(summary):
+    print(f"\nHIL run of {summary['duration']:.1f} s "
+          f"({summary['flight_time']:.0f} s of flight), "
+          f"output in {summary['output']}")
+    print(f"CPU: {summary['cpu_seconds']:.2f} s, "
+          f"{summary['cpu_share']:.1%} of one core")
+    print(f"GPS epochs: {summary['gps_epochs']}, "
+          f"radio UART bytes: {summary['uart_bytes']}")
+    for kind, stats in summary['throughput'].items():
+        print(f"{kind:>9}: {stats['packets']} packets, {stats['bytes']} B, "
+              f"{stats['per_second']:.3f} packets/s")
+    for kind, stats in summary['latency'].items():
+        if stats is None:
+            print(f'{kind:>9} latency: no readings traced')
+            continue
+        print(f"{kind:>9} latency (s): n={stats['n']} "
+              f"mean={stats['mean']:.3f} p50={stats['p50']:.3f} "
+              f"p95={stats['p95']:.3f} max={stats['max']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--duration', type=float, default=DURATION,
+                        help='seconds to run the flight software')
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='flight seconds per second of run time')
+    parser.add_argument('--nmea', help='recorded NMEA file to replay')
+    parser.add_argument('--out', help='directory for logs and flight data '
+                                      '(default a new temporary directory)')
+    parser.add_argument('--json', help='also write the summary to this file')
+    args = parser.parse_args()
+
+    summary = run(args)
+    report(summary)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
-from tuppersat_utils.fileutils import OutputFile
+from flight_log import FlightLogWriter, SCHEMA, RAW_SCHEMA, MEAN_SCHEMA
+from gps.nmea import EMPTY_FIX
+from clock import SYSTEM_CLOCK
+from sensor_history import mean_since
 from datetime import datetime as dt
-import time
 import logging
 
 def timestamp(datetime=None, fmt='%H%M%S'):
@@ -13,46 +15,133 @@ GROUPS = {'gps' : ['gps'],
           'interior': ['temp1', 'pressure'],
           'payload' : ['temp2', 'p_ext', 'hum', 'ozone']}
 
-def collect_data(sensor_dict):
-    """For each group gathers all relevant data in list.
+#Sensors whose raw ADC counts are logged in raw mode, published on the
+#topic label_raw, and those of them whose calibration constants are
+#published on label_cal
+RAW_SENSORS = ['pressure', 'p_ext', 'hum']
+CALIBRATED_SENSORS = ['pressure', 'p_ext']
+
+#Raw mode groups
+RAW_GROUPS = {'raw': [f'{label}_raw' for label in RAW_SENSORS]}
+CALIBRATION_TOPICS = [f'{label}_cal' for label in CALIBRATED_SENSORS]
+
+#Window mode group of the mean of each interior and payload reading
+MEAN_GROUPS = {'mean': GROUPS['interior'] + GROUPS['payload']}
+
+def collect_data(sensor_dict, groups=GROUPS, since=None):
+    """For each group gathers all relevant data in list, the latest or,
+    given a monotonic time since, the mean of the readings since then
+    where the sensors keep a history (see sensor_history.mean_since).
     Returns dictionary with group : data list pairs"""
-    return{group: [sensor_dict[sensor].data for sensor in sensors] for
-           (group,sensors) in GROUPS.items()}
+    return{group: [mean_since(sensor_dict[sensor], since)
+                   for sensor in sensors] for
+           (group,sensors) in groups.items()}
+
+def raw_defaults(sensors):
+    """Dictionary of raw mode topic : current value of the sensors, the
+    starting values of a LatestView subscribed to them"""
+    defaults = {f'{label}_raw': sensors[label].raw for label in RAW_SENSORS}
+    defaults.update({f'{label}_cal': sensors[label].calibration
+                     for label in CALIBRATED_SENSORS})
+    return defaults
+
+def calibration_values(calibrations):
+    """Flattens the calibration constants (C1, ..., C6) of each sensor,
+    six None for a sensor not yet calibrated"""
+    values = []
+    for constants in calibrations:
+        values.extend(constants or [None]*6)
+    return values
+
+def gps_values(fix):
+    """(lat, lon, alt, hdop) of a Fix, all None if there is none"""
+    fix = fix or EMPTY_FIX
+    return [fix.lat, fix.lon, fix.alt, fix.hdop]
+
+def record_values(group, data_list):
+    """Flattens data of a group into one value per field, taking the
+    position fields of a Fix and expanding (t, p) and (D1, D2) tuples"""
+    values = []
+    labels = {**GROUPS, **RAW_GROUPS, **MEAN_GROUPS}[group]
+    for label, data in zip(labels, data_list):
+        if label == 'gps':
+            values.extend(gps_values(data))
+        elif isinstance(data, tuple):
+            values.extend(data)
+        else:
+            values.append(data)
+    return values
 
 ####################################################
 
         
-def data_to_string(data_list):
+def data_to_string(data_list, datetime=None):
     """Places contents of list in comma-separated string
-    with timestamp."""
-    data_list.insert(0, f"{dt.now():%H%M%S}")
+    with timestamp (default now)."""
+    data_list.insert(0, timestamp(datetime))
     return ','.join([str(i) for i in data_list])
 
 #####################################################
 
 DATA_DIR = '/home/pi/flight_data/'
 
+#Suffix of each group's text file
+FILE_SUFFIXES = {'gps' : 'gps',
+                 'interior' : 'internal',
+                 'payload' : 'payload',
+                 'raw' : 'raw',
+                 'calibration' : 'calibration',
+                 'mean' : 'mean'}
+
+def text_filename(prefix, group):
+    """Text file of a group, e.g. prefix_internal.txt"""
+    return f'{prefix}_{FILE_SUFFIXES[group]}.txt'
+
 class StoreData:
     """Class to collect all data from sensors and save to local file."""
-    def __init__(self, sensor_dict):
-        """Initialisation"""
+    def __init__(self, sensor_dict, fmt='text', clock=None, raw=False,
+                 window=False):
+        """Initialisation. fmt is 'text' for one comma-separated file per
+        group, or 'binary' for a single flight log (see flight_log.py).
+        clock (default the system clock) timestamps files and records.
+        raw also logs the raw ADC counts and calibration constants of the
+        pressure and humidity sensors, read from the label_raw and
+        label_cal entries of sensor_dict, for reprocess.py. Records hold
+        the latest readings, matching the raw counts; window also stores
+        the mean of the readings since the previous record (MEAN_GROUPS)"""
+        if fmt not in ('text', 'binary'):
+            raise ValueError(f'Unknown data format {fmt}')
         
         #Input dictionary with label : sensor object pairs
         self._sensor_dict = sensor_dict
         
+        #Output format
+        self._fmt = fmt
+        
+        #Raw mode, and the calibration constants last written
+        self._raw = raw
+        self._calibrations = None
+        
+        #Window mode, and monotonic time of the last record
+        self._window = window
+        self._since = None
+        
         #Placeholder for data
         self._data = None
         
-        #Time between updates
-        self._pause = 1
-        
+        #Clock for timestamps
+        self._clock = clock or SYSTEM_CLOCK
         
         #Dictionary of group:filename pairs
-        _time = timestamp()
-        self._filenames = {
-            'gps' : f'{DATA_DIR}{_time}_gps.txt',
-            'interior' : f'{DATA_DIR}{_time}_internal.txt',
-            'payload' : f'{DATA_DIR}{_time}_payload.txt'}
+        _time = timestamp(self._clock.now())
+        groups = list(GROUPS)
+        if raw:
+            groups += [*RAW_GROUPS, 'calibration']
+        if window:
+            groups += list(MEAN_GROUPS)
+        self._filenames = {group: text_filename(f'{DATA_DIR}{_time}', group)
+                           for group in groups}
+        self._log_filename = f'{DATA_DIR}{_time}_flight.tsfl'
         
         #Setup logger
         self._logger = logging.getLogger(__name__)
@@ -67,36 +156,78 @@ class StoreData:
     
     def setup(self):
         """Create and open all files"""
-        self._files = {k: OutputFile(v) for (k,v) in self._filenames.items()}
-        for file in self._files.values(): file.open()
+        if self._fmt == 'binary':
+            schema = dict(RAW_SCHEMA if self._raw else SCHEMA)
+            if self._window:
+                schema.update(MEAN_SCHEMA)
+            self._log = FlightLogWriter(self._log_filename, schema,
+                                        clock=self._clock)
+            self._log.open()
+        else:
+            #Imported here so that load_data.py can use the groups above
+            #without the tuppersat library
+            from tuppersat_utils.fileutils import OutputFile
+            self._files = {k: OutputFile(v)
+                           for (k,v) in self._filenames.items()}
+            for file in self._files.values(): file.open()
         #Log action
         self._logger.info('Created data files')
         
     def teardown(self):
         """Close all files"""
         #Log action
-        for file in self._files.values(): file.close()
+        if self._fmt == 'binary':
+            self._log.close()
+        else:
+            for file in self._files.values(): file.close()
         self._logger.info('Closed data files')
     
     def read(self):
-        """Gathers data from all sensors and returns as 
-        comma-separated string"""
-        return collect_data(self._sensor_dict)
+        """Gathers data from all sensors and returns as dictionary of
+        group : data list, in window mode with the mean of the readings
+        since the last record"""
+        data = collect_data(self._sensor_dict)
+        if self._window:
+            now = self._clock.monotonic()
+            data.update(collect_data(self._sensor_dict, MEAN_GROUPS,
+                                     self._since))
+            self._since = now
+        return data
         
 
 
         
     def update(self):
-        """Reads sensor data as bytestring and updates to data attribute. 
-        Sends pakcet via radio with a frequency of 20s."""
+        """Reads sensor data and writes each group to its file.
+        Run once a second by the scheduler."""
         
-        #Read sensor data as string
+        #Read sensor data, and the raw counts of the same readings
         self._data = self.read()
+        if self._raw:
+            self._data.update(collect_data(self._sensor_dict, RAW_GROUPS))
+        now = self._clock.now()
+        
+        #Calibration constants are written when first read and whenever
+        #they change, e.g. after a sensor recalibrates, ahead of the raw
+        #counts they convert
+        if self._raw:
+            calibrations = [self._sensor_dict[topic].data
+                            for topic in CALIBRATION_TOPICS]
+            if calibrations != self._calibrations:
+                self._write('calibration', calibration_values(calibrations),
+                            now)
+                self._calibrations = calibrations
         
-        #Write data from each sensor group to individual file
-        for group in self._data: 
-            self._files[group].writeline(data_to_string(self._data[group]))
-            
-        #Pause between readings
-        time.sleep(self._pause)
+        #Write data from each sensor group to individual file, or as a
+        #record of the group to the flight log
+        for group in self._data:
+            self._write(group, record_values(group, self._data[group]), now)
+    
+    def _write(self, group, values, now):
+        """Write a record of values to the group's file or the flight
+        log"""
+        if self._fmt == 'binary':
+            self._log.append(group, values)
+        else:
+            self._files[group].writeline(data_to_string(values, now))
 
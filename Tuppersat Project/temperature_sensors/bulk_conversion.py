@@ -0,0 +1,92 @@
+#Importing standard modules
+import os
+import logging
+
+#Importing custom modules
+from clock import SYSTEM_CLOCK
+from backoff import Backoff
+from temperature_sensors.temperature_utils import bulk_read_file
+from temperature_sensors.temperature_utils import trigger_bulk_conversion
+from temperature_sensors.temperature_utils import bulk_conversion_status
+##################################################################
+
+
+class BulkConversion:
+    """Converts all DS18B20 sensors on the w1 bus master at once, through
+    its therm_bulk_read file, so the sensors convert in parallel, then
+    reads each result without waiting. Each update after a conversion has
+    completed reads every sensor and starts the next conversion; earlier
+    updates return straight away.
+
+    Without bulk conversion support in the kernel (w1_therm before 5.10),
+    each update reads the sensors one after the other, as their own
+    update does."""
+    def __init__(self, sensors, clock=None):
+        """Input: list of sensors on the same w1 bus master with path,
+        conversion_time, collect, update, setup and teardown, e.g.
+        DS18B20Sensor"""
+        self._sensors = sensors
+        self._bulk_file = bulk_read_file(sensors[0].path)
+        #Slowest sensor sets the time taken by a conversion
+        self._wait = max(sensor.conversion_time for sensor in sensors)
+        self._clock = clock or SYSTEM_CLOCK
+        #Backoff between retries of a failed trigger
+        self._backoff = Backoff(clock=self._clock)
+
+        #Time at which the conversion in progress is complete, None with
+        #no conversion in progress
+        self.ready_at = None
+        self._supported = False
+        self._logger = logging.getLogger(__name__)
+
+    def setup(self):
+        """Set every sensor's resolution and check for bulk conversion"""
+        for sensor in self._sensors:
+            sensor.setup()
+        self._supported = os.path.exists(self._bulk_file)
+        if not self._supported:
+            self._logger.warning(f'No {self._bulk_file}, reading sensors '
+                                 f'one at a time')
+        self.ready_at = None
+
+    def teardown(self):
+        """Tear down all sensors"""
+        for sensor in self._sensors:
+            sensor.teardown()
+
+    def stop(self):
+        """End any backoff wait of the sensors"""
+        self._backoff.stop()
+        for sensor in self._sensors:
+            sensor.stop()
+
+    def update(self):
+        """Reads every sensor if the conversion in progress is complete,
+        then starts the next one"""
+        if not self._supported:
+            for sensor in self._sensors:
+                sensor.update()
+            return
+        now = self._clock.monotonic()
+        if self.ready_at is not None:
+            if now < self.ready_at:
+                return
+            try:
+                if bulk_conversion_status(self._bulk_file) < 0:
+                    #Still converting, e.g. on a slow bus
+                    return
+            except (OSError, ValueError) as exc:
+                self._logger.warning(type(exc).__name__)
+            for sensor in self._sensors:
+                sensor.collect()
+        self._trigger()
+
+    def _trigger(self):
+        try:
+            trigger_bulk_conversion(self._bulk_file)
+            self.ready_at = self._clock.monotonic() + self._wait
+            self._backoff.reset()
+        except OSError as exc:
+            self._logger.exception(type(exc).__name__)
+            self.ready_at = None
+            self._backoff.wait()
@@ -1,19 +1,39 @@
 #Importing libraries
-import time
 from temperature_sensors.temperature_utils import read_ds18b20
+from temperature_sensors.temperature_utils import read_converted
+from temperature_sensors.temperature_utils import set_resolution
+from temperature_sensors.temperature_utils import CONVERSION_TIME
+from sensor_history import SensorHistory
+from pubsub import null_publisher
+from clock import SYSTEM_CLOCK
+from backoff import Backoff
 import logging
 
 
 class DS18B20Sensor:
     """Class representing DS18B20 temperature sensor."""
-    def __init__(self, path):
-        """Initialisation including file path of sensor"""
+    def __init__(self, path, resolution=None, clock=None):
+        """Initialisation including file path of sensor, and resolution
+        (9-12 bits, default the sensor's own setting)"""
         
         #Sensor filepath
         self._path = path
         
+        #Resolution in bits, set on the sensor at setup
+        if resolution is not None and resolution not in CONVERSION_TIME:
+            raise ValueError(f'Unsupported resolution {resolution} bits')
+        self._resolution = resolution
+        
         #Data attribute placeholder:
         self._data = None
+        #History of readings, timestamped by the clock:
+        self._history = SensorHistory(clock=clock)
+        #Publisher of each new reading:
+        self._publish = null_publisher
+        #Clock for timestamps and waits:
+        self._clock = clock or SYSTEM_CLOCK
+        #Backoff between retries after errors:
+        self._backoff = Backoff(clock=self._clock)
         
         self._logger = logging.getLogger(__name__)
         
@@ -21,15 +41,32 @@ class DS18B20Sensor:
         """Updates data attribute to most recent sensor reading"""
         try:
             self._data = self.read()
+            self._history.push(self._data)
+            self._publish(self._data)
+            self._backoff.reset()
         except (FileNotFoundError, IndexError) as exc:
             self._logger.exception(type(exc).__name__)
             self._data = None
-            time.sleep(1)
-        
+            self._publish(self._data)
+            self._backoff.wait()
         
+    def collect(self):
+        """Updates data attribute to the result of a bulk conversion,
+        without starting or waiting for a conversion. Returns False after
+        an error"""
+        try:
+            self._data = read_converted(self._path)
+            self._history.push(self._data)
+            self._publish(self._data)
+            return True
+        except (OSError, ValueError) as exc:
+            self._logger.warning(type(exc).__name__)
+            self._data = None
+            self._publish(self._data)
+            return False
         
     def read(self):
-        """Reads temperature reading from sensor file.
+        """Reads temperature reading from sensor file, converting first.
         Returns temperature in degrees Celsius"""
         return read_ds18b20(self._path)
         
@@ -40,11 +77,40 @@ class DS18B20Sensor:
         pass
     
     def setup(self):
-        """"Sensor file requires no setup method"""
-        pass
+        """Sets the sensor's resolution, if given"""
+        if self._resolution is None:
+            return
+        try:
+            set_resolution(self._path, self._resolution)
+        except OSError as exc:
+            self._logger.warning(f'Resolution not set: {type(exc).__name__}')
     
+    def attach(self, publish):
+        """Publish each new reading with publish(reading)"""
+        self._publish = publish
+
+    def stop(self):
+        """End any backoff wait in progress, e.g. on shutdown"""
+        self._backoff.stop()
+
     @property
     def data(self):
         """Acquire data attribute"""
         return self._data
+
+    @property
+    def history(self):
+        """History of timestamped readings"""
+        return self._history
+
+    @property
+    def path(self):
+        """Path of the sensor's w1_slave file"""
+        return self._path
+
+    @property
+    def conversion_time(self):
+        """Conversion time (s) at the sensor's resolution, 12 bits if not
+        set"""
+        return CONVERSION_TIME[self._resolution or 12]
     
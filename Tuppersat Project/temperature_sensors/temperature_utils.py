@@ -1,3 +1,5 @@
+import os
+
 def format_temperature(lines):
     """Reads temperature from sensor file and formats to degrees C. """
    	#Finding position of equals sign:
@@ -13,6 +15,47 @@ def read_ds18b20(path):
         lines = sensor.readlines()
     return format_temperature(lines)
 
+#Conversion time (s) at each resolution (bits), from the DS18B20 datasheet
+CONVERSION_TIME = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.75}
+
+def device_file(path, name):
+    """Path of another sysfs file of the device whose w1_slave file is
+    path, e.g. 'temperature' or 'resolution'"""
+    return os.path.join(os.path.dirname(path), name)
+
+def bulk_read_file(path):
+    """Path of the therm_bulk_read file of the w1 bus master of the device
+    whose w1_slave file is path"""
+    master = os.path.dirname(os.path.realpath(os.path.dirname(path)))
+    return os.path.join(master, 'therm_bulk_read')
+
+def set_resolution(path, bits):
+    """Sets the resolution (9-12 bits) of the device whose w1_slave file
+    is path. Needs write access to sysfs, e.g. as root"""
+    if bits not in CONVERSION_TIME:
+        raise ValueError(f'Unsupported resolution {bits} bits')
+    with open(device_file(path, 'resolution'), 'w') as file:
+        file.write(str(bits))
+
+def trigger_bulk_conversion(bulk_file):
+    """Starts a temperature conversion on every device of a w1 bus master
+    at once"""
+    with open(bulk_file, 'w') as file:
+        file.write('trigger')
+
+def bulk_conversion_status(bulk_file):
+    """Status of the bulk conversion: -1 while any device is converting,
+    1 when done and not every result read yet, 0 with none pending"""
+    with open(bulk_file, 'r') as file:
+        return int(file.read())
+
+def read_converted(path):
+    """Reads the result of the last conversion of the device whose
+    w1_slave file is path, without starting another, as a float in
+    Celsius"""
+    with open(device_file(path, 'temperature'), 'r') as sensor:
+        return int(sensor.read()) / 1000
+
 
 
         
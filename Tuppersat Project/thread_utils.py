@@ -1,44 +1,40 @@
-from threading import Thread
-from class_utils import run
+#Importing custom libraries
+from scheduler import SKIP
 
-def loop_thread(loop, setup=None, teardown=None, stop_event=None):
-    """Creates thread running sensor class until 
-    stop_event is set to True"""
-    
-    def keep_running():
-        """Returns opposite condition of stop event
-        e.g. if stop_event == False, keep_running == True"""
-        
-        return not stop_event.is_set()
-    
-    return Thread(
-        target = run,
-        args=(loop, setup, teardown, keep_running)
-        )
 
-def sensor_thread(sensor, stop_event):
-    """Creates thread running a specific sensor until 
-    stop_event is True"""
-    
-    return loop_thread(
-        loop = sensor.update,
-        setup = sensor.setup,
-        teardown = sensor.teardown,
-        stop_event = stop_event
-        )
+def schedule_tasks(scheduler, objects, rates, blocking=(), policies=None):
+    """Inputs: Scheduler, dictionary of label : object pairs, dictionary of
+    label : rate (Hz) pairs, labels of objects whose update blocks, and
+    optional dictionary of label : missed slot policy (default SKIP).
 
-def start_threads(threads):
-    """Input: List of threads
-    Starts all input threads"""
-    for thread in threads :
-        thread.start()
-        
-def stop_threads(event, threads):
-    """Input: List of threads
-    Stops all input threads"""
-    # trigger stop_event
-    event.set()
-    # wait for the threads to finish
-    for thread in threads:
-        # end threads
-        thread.join()
+    Schedules update of each object at its rate, with the object's setup
+    and teardown. Returns list of tasks"""
+    policies = policies or {}
+    return [scheduler.add(
+                name = label,
+                func = obj.update,
+                rate = rates[label],
+                blocking = label in blocking,
+                setup = obj.setup,
+                teardown = obj.teardown,
+                policy = policies.get(label, SKIP)
+                )
+            for label, obj in objects.items()]
+
+def stop_objects(objects):
+    """Input: dictionary of label : object pairs
+    Calls stop of each object that has one, ending any backoff wait"""
+    for obj in objects.values():
+        stop = getattr(obj, 'stop', None)
+        if stop is not None:
+            stop()
+
+def unschedule_tasks(scheduler, tasks):
+    """Input: Scheduler and list of tasks
+    Removes all input tasks, tearing down each one, waiting for calls
+    still running at most until the scheduler's shutdown deadline, which
+    this starts. Returns list of the tasks abandoned with their call
+    still running"""
+    scheduler.deadline.start()
+    return [task for task in tasks
+            if not scheduler.remove(task, scheduler.deadline.remaining())]
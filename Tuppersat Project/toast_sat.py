@@ -1,7 +1,6 @@
 #Importing standard libraries
 import time
 from datetime import datetime as dt
-import logging
 #################################################
 
 
@@ -13,20 +12,31 @@ from class_utils import catch_and_suppress
 
 #Importing sensor classes
 from gps.gps_sensor_class import GpsReceiver
+from gps.ubx import PORT_USB
 from temperature_sensors.temp_class import DS18B20Sensor
+from temperature_sensors.bulk_conversion import BulkConversion
+from temperature_sensors.temperature_utils import CONVERSION_TIME
 from pressure_sensors.pressure_class import MS5611Sensor
+from pressure_sensors.conversion import PressurePipeline
 from humidity_sensor.pressure_class import MS5611ExtSensor
 from humidity_sensor.humidity_class import MS8607Sensor
 from ozone_sensor.ozone_class import OzoneSensor, OZONE_ADDRESS_3
 
 #Importing run classes
+from scheduler import Scheduler, SKIP, CATCH_UP
+from bus_manager import get_bus
+from pubsub import Broker, LatestView
+from tuppersat_utils.fileutils import get_writer
+from tuppersat_utils.logutils import QueueLogging
 from run_sensors import RunSensors
 from radio.radio_class import RunRadio
 
 #Importing processes
 from handle_telem import HandleTelemetry
 from handle_data import HandleData
-from store_data import StoreData
+from store_data import StoreData, RAW_SENSORS, CALIBRATED_SENSORS
+from store_data import raw_defaults
+from flight_phase import FlightPhase
 from run_processes import RunProcesses
 
 #################################################
@@ -35,6 +45,11 @@ from run_processes import RunProcesses
 FMT = '%(asctime)s : %(name)s : %(levelname)s : %(message)s'
 LOG_DIR = '/home/pi/logs/'
 
+#Log file rotation size (bytes) and rotated files kept, capping the logs
+#at 50 MB of the SD card
+LOG_MAX_BYTES = 5*2**20
+LOG_BACKUPS = 9
+
 
 ################################################
 
@@ -42,24 +57,122 @@ LOG_DIR = '/home/pi/logs/'
 GPS_PORT   = '/dev/ttyACM0'
 set_airborne(GPS_PORT)
 
+#GPS output, 'ubx' NAV-PVT and NAV-DOP frames or 'nmea' sentences, navigation
+#solutions per second, and receiver port (ttyACM0 is its USB port)
+GPS_MODE     = 'ubx'
+GPS_NAV_RATE = 5
+GPS_UBX_PORT = PORT_USB
+
 #Defining ports + addresses
 
 TEMP_PATH1 = '/sys/bus/w1/devices/28-00000deac472/w1_slave'
 TEMP_PATH2 = '/sys/bus/w1/devices/28-0120424fab9f/w1_slave'
+
+#DS18B20 resolution (9-12 bits), setting the conversion time (94-750 ms)
+#and so the temperature sample rate
+TEMP_RESOLUTION = 12
 RADIO_PATH = '/dev/ttyAMA0'
 PRESS_INT_ADDR = 0x77
 PRESS_EXT_ADDR = 0x76
 HUM_ADDR = 0x40
 
-#Ozone sensor inputs
-COLLECT_NUMBER   = 20
+#Pressure sensor oversampling ratio (256 - 4096)
+PRESS_OSR = 4096
+
+#Ozone sensor inputs: readings per filter window and filter, 'mean',
+#'median' or 'ema'
+OZONE_WINDOW     = 20
+OZONE_FILTER     = 'mean'
 IIC_MODE         = 0x01
 #####################################################
 
+#Format of data packets, 'binary' (radio/packet_codec.py) or 'text',
+#and samples per 20s packet (12 binary samples fit in the size of 4 text)
+DATA_FORMAT  = 'binary'
+DATA_SAMPLES = 12
+
+#Ozone sensor output rate (Hz); it is polled at this rate, independent
+#of its filter window
+OZONE_RATE = 1
+
+#Task rates (Hz). Both temperature sensors are converted at once and
+#read by one task, polled a few times per conversion time
+SENSOR_RATES = {'gps'              : GPS_NAV_RATE,
+                'temperature_bulk' : 4/CONVERSION_TIME[TEMP_RESOLUTION],
+                'pressure_pipeline': 50,
+                'hum'              : 10,
+                'ozone'            : OZONE_RATE}
+
+#Data is scheduled per sample, sending a packet every DATA_SAMPLES
+PROCESS_RATES = {'telemetry': 1/20,
+                 'data'     : DATA_SAMPLES/20,
+                 'store'    : 1,
+                 'phase'    : 1}
+
+#Rates (Hz) of the tasks adapted to the flight phase, as (pad, ascent,
+#float, descent, landed): dense while climbing and sinking, sparse on the
+#pad and after landing. Other tasks keep the rates above
+_temp = SENSOR_RATES['temperature_bulk']
+PHASE_RATES = {'pressure_pipeline': (10, 50, 20, 50, 1),
+               'temperature_bulk' : (1, _temp, _temp, _temp, 0.2),
+               'hum'              : (2, 10, 5, 10, 0.5),
+               'ozone'            : (0.2, OZONE_RATE, OZONE_RATE,
+                                     OZONE_RATE, 0.1),
+               'store'            : (0.2, 1, 1, 1, 0.1)}
+
+#Missed deadline policies: stale telemetry is skipped, missed data
+#samples are caught up so that every packet is complete
+PROCESS_POLICIES = {'telemetry': SKIP,
+                    'data'     : CATCH_UP,
+                    'store'    : SKIP,
+                    'phase'    : SKIP}
+
+#Tasks whose updates still block on I/O or sleep, run in the worker pool
+BLOCKING = {'gps', 'temperature_bulk', 'pressure_pipeline', 'hum', 'ozone',
+            'telemetry', 'data'}
+
+#One worker thread per blocking task, so that none waits behind another's
+#I/O. Shrinks as tasks stop blocking
+SCHEDULER_WORKERS = len(BLOCKING)
+
+#Seconds between I2C bus usage reports
+BUS_REPORT_INTERVAL = 60
+
+#Sensors whose readings each process subscribes to, None for all
+PROCESS_TOPICS = {'telemetry': ('gps', 'temp1', 'temp2', 'pressure'),
+                  'data'     : ('gps', 'temp2', 'p_ext', 'hum', 'ozone'),
+                  'store'    : None,
+                  'phase'    : ('gps', 'pressure')}
+
+#Format of stored flight data, 'binary' flight log or 'text' files
+STORE_FORMAT = 'binary'
+
+#Also store the raw ADC counts and calibration constants of the pressure
+#and humidity sensors, to convert again after the flight (reprocess.py)
+STORE_RAW = True
+
+#Send and store the mean of the readings since each process's last update,
+#not only the latest readings. Stored means go in their own group, so the
+#latest readings still match the raw counts
+WINDOW_MEANS = False
+
+#Seconds between reading fan-out reports
+PUBSUB_REPORT_INTERVAL = 60
+
+#Seconds between file writer queue depth and latency reports
+WRITER_REPORT_INTERVAL = 60
+
+#Seconds between packet read-to-transmit latency reports
+PACKET_REPORT_INTERVAL = 60
+
+#Seconds between reports of log records suppressed as repeats or dropped
+LOG_REPORT_INTERVAL = 60
+#####################################################
+
         
     
 def main():
-    """Runs threads for all specified sensors.
+    """Runs all specified sensors as tasks on a single scheduler.
     Extracts attributes from housekeeping and data sensors,
     combines to packets and sends via radio.
     
@@ -67,34 +180,102 @@ def main():
     
     Threads stopped by KeyboardInterrupt"""
     log_filename = f"{LOG_DIR}{dt.now():%Y-%m-%d-%H-%M-%S}_toastsat.log"
-    logging.basicConfig(filename =log_filename,
-                    level=logging.INFO,
-                    format = FMT)
+    # Records are written by a listener thread, so sensor threads never
+    # wait on the SD card, and repeated errors are rate-limited
+    log_queue = QueueLogging(filename=log_filename, fmt=FMT, stream=False,
+                             max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS)
     
     # Dictionary of sensor objects
-    sensors = {'gps'     : GpsReceiver(GPS_PORT),
-               'temp1'   : DS18B20Sensor(TEMP_PATH1),
-               'temp2'   : DS18B20Sensor(TEMP_PATH2),
-               'pressure': MS5611Sensor(PRESS_INT_ADDR),
-               'p_ext'   : MS5611ExtSensor(PRESS_EXT_ADDR),
+    sensors = {'gps'     : GpsReceiver(GPS_PORT, GPS_MODE, GPS_NAV_RATE,
+                                       GPS_UBX_PORT),
+               'temp1'   : DS18B20Sensor(TEMP_PATH1, TEMP_RESOLUTION),
+               'temp2'   : DS18B20Sensor(TEMP_PATH2, TEMP_RESOLUTION),
+               'pressure': MS5611Sensor(PRESS_INT_ADDR, PRESS_OSR),
+               'p_ext'   : MS5611ExtSensor(PRESS_EXT_ADDR, PRESS_OSR),
                'hum'     : MS8607Sensor(HUM_ADDR),
                'ozone'   : OzoneSensor(IIC_MODE,
                                      OZONE_ADDRESS_3,
-                                     COLLECT_NUMBER)
+                                     OZONE_WINDOW,
+                                     OZONE_FILTER)
                }
     
-    with catch_and_suppress(KeyboardInterrupt):
-        with RunSensors(sensors):
-            with RunRadio(RADIO_PATH) as run_radio:
-                processes = [
-                    HandleTelemetry(sensors, run_radio._radio),
-                    HandleData(sensors, run_radio._radio),
-                    StoreData(sensors)
-                    ]
-                time.sleep(1)
-                with RunProcesses(processes):
-                    #wait indefinitely
-                    while True: time.sleep(0.1)
+    # Every sensor publishes its readings; each process subscribes to the
+    # sensors it reads, seeing the latest reading and the history of
+    # readings of each
+    broker = Broker()
+    for label, sensor in sensors.items():
+        sensor.attach(broker.publisher(label))
+    if STORE_RAW:
+        for label in RAW_SENSORS:
+            publishers = [broker.publisher(f'{label}_raw')]
+            if label in CALIBRATED_SENSORS:
+                publishers.append(broker.publisher(f'{label}_cal'))
+            sensors[label].attach_raw(*publishers)
+    
+    def latest_view(process, raw=False):
+        topics = PROCESS_TOPICS[process] or sensors
+        defaults = {label: sensor.data for label, sensor in sensors.items()
+                    if label in topics}
+        if raw:
+            defaults.update(raw_defaults(sensors))
+        return LatestView(broker, defaults)
+    
+    # Both pressure sensors are read by one pipelined conversion task
+    pipeline = PressurePipeline([sensors['pressure'], sensors['p_ext']])
+    sensor_tasks = {label: sensor for label, sensor in sensors.items()
+                    if label not in ('pressure', 'p_ext', 'temp1', 'temp2')}
+    sensor_tasks['pressure_pipeline'] = pipeline
+    
+    # Both temperature sensors convert at once, read by one task
+    sensor_tasks['temperature_bulk'] = BulkConversion([sensors['temp1'],
+                                                       sensors['temp2']])
+    
+    with log_queue, catch_and_suppress(KeyboardInterrupt):
+        with Scheduler(SCHEDULER_WORKERS) as scheduler:
+            # One deadline bounds the whole shutdown, files included
+            get_writer().deadline = scheduler.deadline
+            scheduler.add('log_report', log_queue.report,
+                          rate=1/LOG_REPORT_INTERVAL,
+                          delay=LOG_REPORT_INTERVAL)
+            scheduler.add('bus_report', get_bus(1).report,
+                          rate=1/BUS_REPORT_INTERVAL,
+                          delay=BUS_REPORT_INTERVAL)
+            scheduler.add('pubsub_report', broker.report,
+                          rate=1/PUBSUB_REPORT_INTERVAL,
+                          delay=PUBSUB_REPORT_INTERVAL)
+            scheduler.add('writer_report', get_writer().report,
+                          rate=1/WRITER_REPORT_INTERVAL,
+                          delay=WRITER_REPORT_INTERVAL)
+            with RunSensors(sensor_tasks, scheduler, SENSOR_RATES,
+                            BLOCKING):
+                with RunRadio(RADIO_PATH) as run_radio:
+                    processes = {
+                        'telemetry': HandleTelemetry(
+                            latest_view('telemetry'), run_radio._radio,
+                            window=WINDOW_MEANS),
+                        'data'     : HandleData(latest_view('data'),
+                                                run_radio._radio,
+                                                DATA_FORMAT,
+                                                DATA_SAMPLES,
+                                                window=WINDOW_MEANS),
+                        'store'    : StoreData(latest_view('store',
+                                                         STORE_RAW),
+                                             STORE_FORMAT,
+                                             raw=STORE_RAW,
+                                             window=WINDOW_MEANS),
+                        'phase'    : FlightPhase(latest_view('phase'),
+                                                 scheduler, PHASE_RATES)
+                        }
+                    for label in ('telemetry', 'data'):
+                        scheduler.add(f'{label}_report',
+                                      processes[label].report,
+                                      rate=1/PACKET_REPORT_INTERVAL,
+                                      delay=PACKET_REPORT_INTERVAL)
+                    time.sleep(1)
+                    with RunProcesses(processes, scheduler, PROCESS_RATES,
+                                      BLOCKING, PROCESS_POLICIES):
+                        #wait indefinitely
+                        while True: time.sleep(0.1)
     print('Finished')
         
 if __name__ == '__main__':
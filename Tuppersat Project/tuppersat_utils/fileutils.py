@@ -4,11 +4,14 @@ tuppersat.utils.fileutils
 """
 
 # standard library imports
+import logging
+import os
+import queue
+import threading
 import time
-from queue import Queue
 
 # UCD TupperSat related imports
-from tuppersat.utils.threadutils import ConsumerThread
+from tuppersat.utils.threadutils import LoopThread
 
 
 # ****************************************************************************
@@ -34,12 +37,229 @@ def timestamped(msg, time_fmt='unix', sep='\t'):
 
 
 
+# ****************************************************************************
+# single writer thread shared by all output files
+# ****************************************************************************
+
+# fsync policies
+FSYNC_NEVER    = 'never'     # leave it to the operating system
+FSYNC_ALWAYS   = 'always'    # after every flush
+FSYNC_INTERVAL = 'interval'  # at most every fsync_interval seconds
+
+
+class WriterStats:
+    """Queue depth and write latency of a FileWriter."""
+    def __init__(self):
+        self.messages = 0
+        self.batches = 0
+        self.bytes = 0
+        self.flushes = 0
+        self.fsyncs = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def summary(self, depth):
+        messages = max(self.messages, 1)
+        return {'depth'          : depth,
+                'max_depth'      : self.max_depth,
+                'messages'       : self.messages,
+                'batches'        : self.batches,
+                'bytes'          : self.bytes,
+                'flushes'        : self.flushes,
+                'fsyncs'         : self.fsyncs,
+                'errors'         : self.errors,
+                'mean_latency_ms': 1e3*self.total_latency/messages,
+                'max_latency_ms' : 1e3*self.max_latency}
+
+
+class FileWriter(LoopThread):
+    """One thread writing the queued messages of many OutputFiles.
+
+    Messages are drained from a single queue in batches and written with
+    one call per file. Files are flushed once flush_bytes are pending or
+    flush_interval seconds have passed, so at most flush_interval seconds
+    of data are lost if the program dies. fsync, which bounds the loss on
+    power failure, follows the fsync policy.
+
+    Closing a file waits for its writes, within the time left to the
+    shutdown deadline once that has started, so that a stuck write cannot
+    hold up the shutdown.
+    """
+    def __init__(self, flush_bytes=64*1024, flush_interval=1.0,
+                 fsync=FSYNC_INTERVAL, fsync_interval=5.0, batch_size=256):
+        """Initialiser."""
+        if fsync not in (FSYNC_NEVER, FSYNC_ALWAYS, FSYNC_INTERVAL):
+            raise ValueError(f'Unknown fsync policy {fsync}')
+        self._flush_bytes    = flush_bytes
+        self._flush_interval = flush_interval
+        self._fsync          = fsync
+        self._fsync_interval = fsync_interval
+        self._batch_size     = batch_size
+
+        self._queue = queue.Queue()
+        # file : [bytes pending flush, time of last flush, time of last fsync]
+        self._files = {}
+        self.stats = WriterStats()
+        self._logger = logging.getLogger(__name__)
+
+        # shutdown deadline bounding close_file, with a remaining() method
+        # giving the seconds left or None for no bound (scheduler.Deadline)
+        self.deadline = None
+
+        super().__init__(loop=None)
+        # open files are closed by their owners, which wait for the queue
+        self.daemon = True
+
+    def __repr__(self):
+        return f'FileWriter(depth={self._queue.qsize()})'
+
+    def submit(self, file, msg):
+        """Queue msg (str or bytes) to be written to the open file object."""
+        self._queue.put((file, msg, time.monotonic()))
+        self.stats.max_depth = max(self.stats.max_depth,
+                                   self._queue.qsize())
+
+    def close_file(self, file):
+        """Write everything queued for file, then close it. Blocks until
+        the file is closed, or the shutdown deadline passes; returns False
+        if it did, leaving the file for the writer to close."""
+        done = threading.Event()
+        self._queue.put((file, None, done))
+        timeout = None if self.deadline is None else self.deadline.remaining()
+        if done.wait(timeout):
+            return True
+        self._logger.warning(f'{file.name}: still writing at the shutdown '
+                             f'deadline, not waiting for it to close')
+        return False
+
+    def metrics(self):
+        return self.stats.summary(self._queue.qsize())
+
+    def report(self):
+        """Log queue depth and write latency."""
+        stats = self.metrics()
+        self._logger.info(
+            f"{stats['messages']} messages in {stats['batches']} batches, "
+            f"depth {stats['depth']} (max {stats['max_depth']}), latency "
+            f"mean {stats['mean_latency_ms']:.1f} ms "
+            f"max {stats['max_latency_ms']:.1f} ms, "
+            f"{stats['fsyncs']} fsyncs")
+
+    def loop(self):
+        batch = self._next_batch()
+        pending = {}
+        queued_times = []
+        for file, msg, queued in batch:
+            if msg is None:
+                # close request: write what is pending first
+                self._write(file, pending.pop(file, []))
+                self._close(file)
+                queued.set()
+                continue
+            pending.setdefault(file, []).append(msg)
+            queued_times.append(queued)
+        for file, msgs in pending.items():
+            self._write(file, msgs)
+
+        # latency from submit until handed to the file
+        now = time.monotonic()
+        for queued in queued_times:
+            self.stats.total_latency += now - queued
+        if queued_times:
+            self.stats.max_latency = max(self.stats.max_latency,
+                                         now - queued_times[0])
+        self._flush_due(now)
+
+    def _next_batch(self):
+        """Wait up to flush_interval for a message, then take whatever
+        else is queued, up to batch_size messages."""
+        try:
+            batch = [self._queue.get(timeout=self._flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, file, msgs):
+        if not msgs:
+            return
+        data = msgs[0][:0].join(msgs)
+        state = self._files.setdefault(file, [0, time.monotonic(),
+                                              time.monotonic()])
+        try:
+            file.write(data)
+        except (OSError, ValueError) as exc:
+            self.stats.errors += 1
+            self._logger.exception(f'{file.name}: {type(exc).__name__}')
+            return
+        state[0] += len(data)
+        self.stats.messages += len(msgs)
+        self.stats.batches += 1
+        self.stats.bytes += len(data)
+        if state[0] >= self._flush_bytes:
+            self._flush(file, state, time.monotonic())
+
+    def _flush_due(self, now):
+        for file, state in self._files.items():
+            if state[0] and now - state[1] >= self._flush_interval:
+                self._flush(file, state, now)
+
+    def _flush(self, file, state, now):
+        try:
+            file.flush()
+            self.stats.flushes += 1
+            if (self._fsync == FSYNC_ALWAYS or
+                    (self._fsync == FSYNC_INTERVAL and
+                     now - state[2] >= self._fsync_interval)):
+                os.fsync(file.fileno())
+                self.stats.fsyncs += 1
+                state[2] = now
+        except (OSError, ValueError) as exc:
+            self.stats.errors += 1
+            self._logger.exception(f'{file.name}: {type(exc).__name__}')
+        state[0] = 0
+        state[1] = now
+
+    def _close(self, file):
+        state = self._files.pop(file, None)
+        try:
+            if state is not None:
+                file.flush()
+                if self._fsync != FSYNC_NEVER:
+                    os.fsync(file.fileno())
+                    self.stats.fsyncs += 1
+            file.close()
+        except (OSError, ValueError) as exc:
+            self.stats.errors += 1
+            self._logger.exception(f'{file.name}: {type(exc).__name__}')
+
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+def get_writer():
+    """Return the FileWriter shared by all OutputFiles, starting it on
+    first use."""
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = FileWriter()
+            _WRITER.start()
+        return _WRITER
+
+
 # ****************************************************************************
 
 class OutputFile:
     """A thread-safe file output."""
-    def __init__(self, filename, mode='w', buffering=1, encoding=None,
-                 timeout=1):
+    def __init__(self, filename, mode='w', buffering=-1, encoding=None,
+                 writer=None):
         """Initialiser.
 
         ==========
@@ -48,7 +268,8 @@ class OutputFile:
 
         filename, mode, buffering, encoding are passed to the built-in open.
 
-        timeout is passed to ConsumerThread
+        writer is the FileWriter doing the writes (defaults to the shared
+        one from get_writer)
 
         """
         # file arguments
@@ -57,10 +278,8 @@ class OutputFile:
         self._buffering = buffering
         self._encoding  = encoding
         
-        # consumer thread arguments
-        self._timeout  = timeout
-        
-        self._queue = Queue()
+        # writer thread
+        self._writer = writer
 
     def __repr__(self):
         return f'OutputFile({self._filename}, mode={self._mode})'        
@@ -80,33 +299,24 @@ class OutputFile:
             buffering = self._buffering,
             encoding  = self._encoding ,
         )
-
-        self._thread = ConsumerThread(
-            queue   = self._queue        ,
-            func    = self._write_to_file,
-            timeout = self._timeout      ,
-        )
-        self._thread.start()
+        if self._writer is None:
+            self._writer = get_writer()
 
     def close(self):
-        self._thread.stop()
-        self._file.close()
-
-
-    def _write_to_file(self, msg):
-        """Internal method to write to file."""
-        self._file.write(msg)
+        """Close once everything written so far has been written out.
+        Returns False if the writer's shutdown deadline passed first."""
+        return self._writer.close_file(self._file)
 
     def write(self, msg):
-        """Write string to file.
+        """Write string (or bytes, in binary mode) to file.
 
-        Internally, this uses a Queue to ensure thread-safety.
+        Internally, this queues msg for the FileWriter thread.
         """
-        self._queue.put(msg)
+        self._writer.submit(self._file, msg)
 
     def writeline(self, msg, newline='\n'):
         """Write string to file with newline termination.
 
-        Internally, this uses a Queue to ensure thread-safety.
+        Internally, this queues msg for the FileWriter thread.
         """
         self.write(msg+newline)
@@ -5,6 +5,10 @@ tuppersat.utils.logutils
 """
 # standard library imports
 import logging
+import logging.handlers
+import queue
+import threading
+import time
 from contextlib import contextmanager
 
 # local imports
@@ -78,6 +82,182 @@ def configure_logging(logger=None, verbose=False, filename=None,
 
 
 
+# ****************************************************************************
+# non-blocking logging through a queue
+# ****************************************************************************
+
+# Records queued for the listener thread; further records are dropped
+LOG_QUEUE_SIZE = 10000
+
+# Size (bytes) at which the log file is rotated, and rotated files kept, so
+# that the logs never take more than LOG_MAX_BYTES*(LOG_BACKUPS + 1)
+LOG_MAX_BYTES = 5*2**20
+LOG_BACKUPS = 9
+
+# Identical records at WARNING or above passed per REPEAT_INTERVAL seconds;
+# the rest are suppressed and counted
+REPEAT_INTERVAL = 60
+REPEAT_BURST = 5
+
+
+class RepeatFilter(logging.Filter):
+    """Rate-limits identical records, e.g. the same exception raised by a
+    failing sensor in its loop.
+
+    Records with the same logger, level and message pass at most burst
+    times per interval seconds; the rest are dropped before they are
+    formatted or queued, and counted for summarise().
+    """
+    def __init__(self, interval=REPEAT_INTERVAL, burst=REPEAT_BURST,
+                 level=logging.WARNING):
+        super().__init__()
+        self._interval = interval
+        self._burst = burst
+        self._level = level
+        self._lock = threading.Lock()
+        # key : [window start, records in window]
+        self._windows = {}
+        # key : records suppressed since the last summary
+        self._suppressed = {}
+
+    def filter(self, record):
+        if record.levelno < self._level:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self._interval:
+                self._windows[key] = [now, 1]
+                return True
+            window[1] += 1
+            if window[1] <= self._burst:
+                return True
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+
+    def summarise(self):
+        """List of (logger name, level, message, count) of the records
+        suppressed since the last call, forgetting expired windows."""
+        now = time.monotonic()
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, {}
+            self._windows = {key: window
+                             for key, window in self._windows.items()
+                             if now - window[0] < self._interval}
+        return [key + (count,) for key, count in suppressed.items()]
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records that do not fit in a full
+    queue are dropped and counted."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class QueueLogging:
+    """Logging from any thread without waiting on disk or console I/O.
+
+    Records are filtered by a RepeatFilter and queued by the logging
+    thread, and written by a QueueListener thread to the handlers: a
+    StreamHandler and/or a size-capped RotatingFileHandler.
+    """
+    def __init__(self, logger=None, verbose=False, filename=None,
+                 fmt=LOG_FORMAT, stream=True, max_bytes=LOG_MAX_BYTES,
+                 backups=LOG_BACKUPS, queue_size=LOG_QUEUE_SIZE,
+                 repeat_interval=REPEAT_INTERVAL, repeat_burst=REPEAT_BURST):
+        """Initialisation, with the parameters of configure_logging and
+
+        stream : bool [optional]
+            False writes to the log file only
+
+        max_bytes, backups : [optional]
+            the log file is rotated at max_bytes, keeping backups old files
+
+        queue_size : [optional]
+            records queued before further records are dropped
+
+        repeat_interval, repeat_burst : [optional]
+            identical warnings and errors passed per interval
+
+        """
+        self._logger = logger if logger is not None else logging.getLogger()
+        self._level = (logging.DEBUG if verbose else logging.INFO)
+
+        _fmtr = logging.Formatter(fmt)
+        self._handlers = [logging.StreamHandler()] if stream else []
+        if filename is not None:
+            if filename == True:
+                filename = timestamped_filename(ext='.log')
+            self._handlers.append(logging.handlers.RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backups))
+        for _handler in self._handlers:
+            _handler.setLevel(self._level)
+            _handler.setFormatter(_fmtr)
+
+        self.repeats = RepeatFilter(repeat_interval, repeat_burst)
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.handler.setLevel(self._level)
+        self.handler.addFilter(self.repeats)
+        self._listener = logging.handlers.QueueListener(
+            self.handler.queue, *self._handlers, respect_handler_level=True)
+        self._reported_drops = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start the listener and route the logger through the queue."""
+        self._listener.start()
+        self._logger.setLevel(self._level)
+        self._logger.addHandler(self.handler)
+
+    def stop(self):
+        """Report any suppressed records, then write out every queued
+        record and stop the listener."""
+        self.report()
+        self._logger.removeHandler(self.handler)
+        self._listener.stop()
+        for _handler in self._handlers:
+            _handler.close()
+
+    def report(self):
+        """Log a summary of the records suppressed as repeats, and of
+        those dropped from a full queue, since the last report."""
+        log = logging.getLogger(__name__)
+        for name, level, message, count in self.repeats.summarise():
+            log.info(f'{count} repeats suppressed: {name} : '
+                     f'{logging.getLevelName(level)} : {message}')
+        dropped = self.handler.dropped - self._reported_drops
+        if dropped:
+            self._reported_drops += dropped
+            log.warning(f'{dropped} records dropped from a full queue')
+
+
+def configure_queue_logging(logger=None, verbose=False, filename=None,
+                            fmt=LOG_FORMAT, **kwargs):
+    """Set up non-blocking logging of the root logger (see QueueLogging
+    for the optional keyword arguments).
+
+    Returns the started QueueLogging, to be stopped before exiting so that
+    every queued record is written.
+    """
+    _logging = QueueLogging(logger, verbose, filename, fmt, **kwargs)
+    _logging.start()
+    return _logging
+
+
 # ****************************************************************************
 # log the successful completion of an action
 # ****************************************************************************